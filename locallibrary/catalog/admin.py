@@ -1,5 +1,10 @@
-from django.contrib import admin
-from .models import Author, Genre, Book, BookInstance, Language
+from django.contrib import admin, messages
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import Author, Genre, Book, BookInstance, Language, LoanConflict
+from .pagination import EstimatedCountPaginator
 
 # admin.site.register(Book)
 # admin.site.register(Author)
@@ -8,31 +13,91 @@ admin.site.register(Genre)
 admin.site.register(Language)
 
 
+class LimitedInlineFormSet(BaseInlineFormSet):
+    """
+    Набор форм, показывающий не больше max_rows связанных объектов. Остальные объекты
+    доступны по ссылке на отфильтрованный список
+    """
+    max_rows = 20
+
+    def get_queryset(self):
+        if not hasattr(self, '_limited_queryset'):
+            self._limited_queryset = super().get_queryset()[:self.max_rows]
+        return self._limited_queryset
+
+
+class LoanConflictAdminMixin:
+    """
+    Если экземпляр книги изменили другим запросом между загрузкой объекта и сохранением формы,
+    сохранение (вместе с записью в журнал администратора) откатывается и форма открывается заново с ошибкой
+    """
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except LoanConflict as error:
+            self.message_user(request, "%s. Проверьте данные и сохраните еще раз" % error, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+
 class BookInstanceInline(admin.TabularInline):
     model = BookInstance
     extra = 0
+    formset = LimitedInlineFormSet
+    raw_id_fields = ('borrower',)
+    show_change_link = True
 
 
 class BookInline(admin.TabularInline):
     model = Book
     extra = 0
+    formset = LimitedInlineFormSet
+    fields = ('title', 'isbn', 'language')
+    show_change_link = True
+
+
+def changelist_link(model, field, obj, label):
+    url = reverse('admin:catalog_%s_changelist' % model._meta.model_name)
+    return format_html('<a href="{}?{}={}">{}</a>', url, field, obj.pk, label)
 
 
 # Определяем класс Администратора
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
-    fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
+    fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death'), 'all_books']
+    readonly_fields = ('all_books',)
     inlines = [BookInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @admin.display(description="Все книги автора")
+    def all_books(self, obj):
+        if obj.pk is None:
+            return '-'
+        return changelist_link(Book, 'author__id__exact', obj, "Открыть список книг")
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(LoanConflictAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
+    readonly_fields = ('all_copies',)
     inlines = [BookInstanceInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Жанры всех книг страницы загружаются одним запросом, display_genre берет их из кэша
+        return super().get_queryset(request).prefetch_related('genre')
+
+    @admin.display(description="Все экземпляры")
+    def all_copies(self, obj):
+        if obj.pk is None:
+            return '-'
+        return changelist_link(BookInstance, 'book__id__exact', obj, "Открыть список экземпляров")
 
 
 @admin.register(BookInstance)
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(LoanConflictAdminMixin, admin.ModelAdmin):
     list_filter = ('status', 'due_back')
     fieldsets = (
         (None, {
@@ -43,8 +108,12 @@ class BookInstanceAdmin(admin.ModelAdmin):
         })
     )
     list_display = ['book', 'status', 'borrower', 'due_back', 'id']
+    list_select_related = ('book', 'borrower')
+    raw_id_fields = ('book', 'borrower')
+    paginator = EstimatedCountPaginator
+    # Не считать отдельно общее число строк таблицы при включенных фильтрах
+    show_full_result_count = False
 
 
 # Зарегестрируйте класс администратора со связанной моделью
 admin.site.register(Author, AuthorAdmin)
-
@@ -0,0 +1,153 @@
+from django.core.exceptions import ValidationError
+from .models import Author, Book, BookInstance, Genre, Language
+from .pagination import decode_cursor, encode_cursor, keyset_filter
+
+# Размер страницы API по умолчанию и наибольший допустимый (параметр limit)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+
+class ApiError(ValueError):
+    """
+    Ошибка в параметрах запроса к API
+    """
+
+
+def _split(value):
+    return [name for name in (value or '').split(',') if name]
+
+
+def book_genres(book_ids):
+    """
+    Жанры книг одним запросом к промежуточной таблице (аналог prefetch_related для строк values())
+    :return: Словарь id книги -> список жанров
+    """
+    genres = {}
+    rows = (Book.genre.through.objects.filter(book_id__in=book_ids).order_by('genre__name')
+            .values_list('book_id', 'genre_id', 'genre__name'))
+    for book_id, genre_id, name in rows:
+        genres.setdefault(book_id, []).append({'id': genre_id, 'name': name})
+    return genres
+
+
+class Resource:
+    """
+    Описание ресурса API. Ответ строится напрямую из строк values(), без создания объектов моделей.
+
+    fields - поля ресурса: имя в API -> путь для values(); default_fields - поля без параметра fields;
+    ordering - ключ сортировки и курсора (последним должен быть id);
+    related - вложенные объекты по внешнему ключу: имя -> {поле: путь}, выбираются тем же запросом через JOIN;
+    many - связи многие-ко-многим: имя -> функция, загружающая их для всех строк страницы одним запросом
+    """
+    def __init__(self, model, fields, default_fields, ordering, related=None, many=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields
+        self.ordering = ordering
+        self.related = related or {}
+        self.many = many or {}
+
+    def parse(self, params):
+        """
+        :return: Запрошенные поля и вложенные объекты (параметры fields и include)
+        """
+        fields = _split(params.get('fields')) or list(self.default_fields)
+        includes = _split(params.get('include'))
+        unknown = [name for name in fields if name not in self.fields]
+        unknown += [name for name in includes if name not in self.related and name not in self.many]
+        if unknown:
+            raise ApiError("Неизвестные поля: %s" % ', '.join(unknown))
+        return fields, includes
+
+    def get_queryset(self, fields, includes):
+        paths = [self.fields[name] for name in fields] + list(self.ordering)
+        for name in includes:
+            paths += self.related.get(name, {}).values()
+        return self.model.objects.order_by(*self.ordering).values(*dict.fromkeys(paths))
+
+    def serialize(self, rows, fields, includes):
+        results = []
+        for row in rows:
+            item = {name: row[self.fields[name]] for name in fields}
+            for name in includes:
+                if name in self.related:
+                    nested = {key: row[path] for key, path in self.related[name].items()}
+                    item[name] = nested if nested['id'] is not None else None
+            results.append(item)
+        for name in includes:
+            if name in self.many:
+                loaded = self.many[name]([row['id'] for row in rows])
+                for item, row in zip(results, rows):
+                    item[name] = loaded.get(row['id'], [])
+        return results
+
+    def get_page(self, params):
+        """
+        Страница списка ресурса. Следующая страница выбирается по курсору after условием по ключу ordering
+        :return: Список объектов и курсор следующей страницы (или None)
+        """
+        fields, includes = self.parse(params)
+        try:
+            limit = min(int(params.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            raise ApiError("Неправильный параметр limit")
+        queryset = self.get_queryset(fields, includes)
+        if params.get('after'):
+            try:
+                queryset = queryset.filter(keyset_filter(self.model, self.ordering, decode_cursor(params['after']),
+                                                         'gt'))
+            except (ValueError, TypeError, ValidationError):
+                raise ApiError("Неправильный курсор страницы")
+        rows = list(queryset[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][name] for name in self.ordering])
+        return self.serialize(rows, fields, includes), next_cursor
+
+    def get_object(self, pk, params):
+        """
+        :return: Один объект ресурса или None, если его нет
+        """
+        fields, includes = self.parse(params)
+        try:
+            rows = list(self.get_queryset(fields, includes).filter(pk=pk)[:1])
+        except (ValueError, ValidationError):
+            return None
+        return self.serialize(rows, fields, includes)[0] if rows else None
+
+
+RESOURCES = {
+    'books': Resource(
+        Book,
+        fields={'id': 'id', 'title': 'title', 'summary': 'summary', 'isbn': 'isbn',
+                'author': 'author_id', 'language': 'language_id',
+                'copies': 'num_copies', 'available': 'num_available'},
+        default_fields=('id', 'title', 'author'),
+        ordering=('title', 'id'),
+        related={'author': {'id': 'author__id', 'first_name': 'author__first_name', 'last_name': 'author__last_name'},
+                 'language': {'id': 'language__id', 'name': 'language__name'}},
+        many={'genres': book_genres},
+    ),
+    'authors': Resource(
+        Author,
+        fields={'id': 'id', 'first_name': 'first_name', 'last_name': 'last_name',
+                'date_of_birth': 'date_of_birth', 'date_of_death': 'date_of_death'},
+        default_fields=('id', 'first_name', 'last_name'),
+        ordering=('last_name', 'first_name', 'id'),
+    ),
+    'genres': Resource(Genre, fields={'id': 'id', 'name': 'name'}, default_fields=('id', 'name'),
+                       ordering=('name', 'id')),
+    'languages': Resource(Language, fields={'id': 'id', 'name': 'name'}, default_fields=('id', 'name'),
+                          ordering=('name', 'id')),
+    'copies': Resource(
+        BookInstance,
+        # Читатель экземпляра не публикуется
+        fields={'id': 'id', 'book': 'book_id', 'imprint': 'imprint', 'status': 'status', 'due_back': 'due_back'},
+        default_fields=('id', 'book', 'status', 'due_back'),
+        ordering=('id',),
+        related={'book': {'id': 'book__id', 'title': 'book__title', 'isbn': 'book__isbn'}},
+    ),
+}
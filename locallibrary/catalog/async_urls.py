@@ -0,0 +1,17 @@
+from django.urls import path
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# Страницы, которые под ASGI обслуживаются асинхронными представлениями, остальные адреса те же, что в catalog.urls
+ASYNC_VIEWS = {
+    'index': async_views.index,
+    'books': async_views.BookListView.as_view(),
+    'book-detail': async_views.BookDetailView.as_view(),
+    'authors': async_views.AuthorListView.as_view(),
+    'my-borrowed': async_views.LoanedBooksByUserListView.as_view(),
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,165 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Count, aprefetch_related_objects
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.views import generic
+from .borrowers import aget_borrower_summary, aget_loan_history, current_loans
+from .facets import aget_facets, facet_links, filter_books, filter_query, parse_filters
+from .caching import AsyncCachedViewMixin, aattach_cache_versions, author_scope, book_scope
+from .models import Author, Book, BookInstance
+from .pagination import KeysetPage, encode_cursor, keyset_page, keyset_queryset, keyset_values
+from .popularity import aget_popular
+from .stats import aget_stats
+from .views import AuthorListView as SyncAuthorListView, BookDetailView as SyncBookDetailView
+from .views import BookListView as SyncBookListView
+from .views import AUTHOR_SORTS, BOOK_SORTS, get_sort, summarize_statuses
+from .visits import get_visit_counter
+
+# Асинхронные варианты основных страниц каталога для работы под ASGI (см. catalog.async_urls).
+# Данные загружаются асинхронным ORM, а шаблоны отрисовываются обработчиком ASGI в потоке
+# через TemplateResponse, так что обращения шаблонов к базе (user, perms) остаются безопасными
+
+
+async def apaginate(queryset, per_page, page_number, count=None):
+    """
+    Асинхронный аналог пагинации ListView: число строк считается через acount() (если не передано count),
+    строки страницы загружаются асинхронной итерацией
+    :return: Пагинатор и страница
+    """
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount() if count is None else count
+    try:
+        number = paginator.num_pages if page_number == 'last' else int(page_number or 1)
+        page = paginator.page(number)
+    except (ValueError, InvalidPage) as exc:
+        raise Http404("Неправильная страница") from exc
+    page.object_list = [obj async for obj in page.object_list]
+    return paginator, page
+
+
+def list_context(name, paginator, page):
+    return {
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': page.object_list,
+        name: page.object_list,
+    }
+
+
+async def index(request):
+    """
+    Домашняя страница (см. views.index)
+    """
+    stats = await aget_stats()
+    # Счетчик посещений работает с сессией, которая загружается синхронно
+    num_visits = await sync_to_async(get_visit_counter().record)(request)
+    return TemplateResponse(request, 'index.html', context={**stats, 'num_visits': num_visits,
+                                                            'popular': await aget_popular()})
+
+
+class BookListView(AsyncCachedViewMixin, generic.View):
+    """
+    Список книг (см. views.BookListView)
+    """
+    paginate_by = SyncBookListView.paginate_by
+
+    def get_cache_scopes(self):
+        return ['books', 'facets']
+
+    async def get(self, request, *args, **kwargs):
+        sort, sort_query = get_sort(request, BOOK_SORTS)
+        filters = parse_filters(request.GET)
+        keyset_fields = BOOK_SORTS[sort]
+        queryset = filter_books(Book.objects.select_related('author').order_by(*keyset_fields), filters)
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        if after or before:
+            rows = [book async for book in keyset_queryset(queryset, keyset_fields, after, before,
+                                                           self.paginate_by)]
+            page = keyset_page(rows, keyset_fields, after, before, self.paginate_by)
+            context = list_context('book_list', None, page)
+        else:
+            paginator, page = await apaginate(queryset, self.paginate_by, request.GET.get('page'))
+            context = list_context('book_list', paginator, page)
+            if page.has_next():
+                context['next_cursor'] = encode_cursor(keyset_values(page.object_list[-1], keyset_fields))
+        context.update(is_keyset_page=isinstance(page, KeysetPage), sort=sort, sort_query=sort_query,
+                       filter_query=filter_query(filters),
+                       facets=facet_links(await aget_facets(filters), filters, sort_query),
+                       popular_books=(await aget_popular())['books'])
+        await aattach_cache_versions(page.object_list, book_scope)
+        return TemplateResponse(request, 'catalog/book_list.html', context)
+
+
+class BookDetailView(AsyncCachedViewMixin, generic.View):
+    """
+    Страница книги (см. views.BookDetailView)
+    """
+    copies_paginate_by = SyncBookDetailView.copies_paginate_by
+
+    def get_cache_scopes(self):
+        return [book_scope(self.kwargs['pk'])]
+
+    async def get(self, request, pk):
+        try:
+            book = await Book.objects.select_related('author', 'language').aget(pk=pk)
+        except Book.DoesNotExist:
+            raise Http404("Книга не найдена")
+        await aprefetch_related_objects([book], 'genre')
+        copies = BookInstance.objects.filter(book=book)
+        status_summary = summarize_statuses([
+            row async for row in copies.order_by().values('status').annotate(count=Count('pk')).order_by('status')
+        ])
+        paginator = Paginator(copies.order_by('due_back', 'id'), self.copies_paginate_by)
+        paginator.count = sum(row['count'] for row in status_summary)
+        copies_page = paginator.get_page(request.GET.get('page'))
+        copies_page.object_list = [copy async for copy in copies_page.object_list]
+        return TemplateResponse(request, 'catalog/book_detail.html', {
+            'object': book,
+            'book': book,
+            'status_summary': status_summary,
+            'num_copies': paginator.count,
+            'copies_page': copies_page,
+        })
+
+
+class AuthorListView(AsyncCachedViewMixin, generic.View):
+    """
+    Список авторов (см. views.AuthorListView)
+    """
+    paginate_by = SyncAuthorListView.paginate_by
+
+    def get_cache_scopes(self):
+        # Число доступных экземпляров в строках меняется при выдаче экземпляров, что сбрасывает область 'books'
+        return ['authors', 'books']
+
+    async def get(self, request, *args, **kwargs):
+        sort, sort_query = get_sort(request, AUTHOR_SORTS)
+        queryset = Author.objects.with_book_stats().order_by(*AUTHOR_SORTS[sort])
+        paginator, page = await apaginate(queryset, self.paginate_by, request.GET.get('page'))
+        context = list_context('author_list', paginator, page)
+        context.update(sort=sort, sort_query=sort_query)
+        await aattach_cache_versions(page.object_list, author_scope)
+        return TemplateResponse(request, 'catalog/author_list.html', context)
+
+
+class LoanedBooksByUserListView(generic.View):
+    """
+    Книги, взятые текущим пользователем (см. views.LoanedBooksByUserListView)
+    """
+    paginate_by = 10
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        summary = await aget_borrower_summary(user)
+        paginator, page = await apaginate(current_loans(user), self.paginate_by, request.GET.get('page'),
+                                          count=summary['on_loan'])
+        context = list_context('bookinstance_list', paginator, page)
+        context['summary'] = summary
+        context['history'] = await aget_loan_history(user)
+        return TemplateResponse(request, 'catalog/bookinstance_list_borrowed_user.html', context)
@@ -0,0 +1,381 @@
+import asyncio
+import contextlib
+import json
+import math
+import threading
+import time
+import tracemalloc
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncRequestFactory, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from .datagen import BORROWER_PASSWORD, generate_catalog
+from .models import Author, Book
+
+# Измеряемые страницы: имя URL -> требуется ли вход читателя
+ENDPOINTS = (
+    ('index', False),
+    ('books', False),
+    ('book-detail', False),
+    ('authors', False),
+    ('author-detail', False),
+    ('my-borrowed', True),
+)
+
+# Страницы, у которых есть асинхронный вариант (см. catalog.async_urls), и конфигурации URL серверов
+SERVER_ENDPOINTS = ('index', 'books', 'book-detail', 'authors', 'my-borrowed')
+SERVER_URLCONFS = {
+    'wsgi': 'locallibrary.urls',
+    'asgi': 'locallibrary.asgi_urls',
+}
+
+# Страницы, отрисовываемые через TemplateResponse (время отрисовки видно в query_stats), и режимы шаблонов:
+# 'uncached' - шаблоны читаются и компилируются при каждой отрисовке, фрагменты не кэшируются;
+# 'loader' - только кэширующий загрузчик; 'cached' - кэширующий загрузчик и кэш фрагментов (меню и строк списков)
+TEMPLATE_ENDPOINTS = ('books', 'book-detail', 'authors', 'author-detail', 'my-borrowed')
+TEMPLATE_MODES = ('uncached', 'loader', 'cached')
+FRAGMENTS_OFF_CACHE = 'catalog-fragments-off'
+
+# Метрики, рост которых считается регрессией
+LATENCY_METRICS = ('p50_ms', 'p90_ms')
+COUNT_METRICS = ('queries',)
+
+
+@contextlib.contextmanager
+def seeded_database(keepdb=False, report=None, **dataset):
+    """
+    Создает отдельную тестовую базу и заполняет ее детерминированным набором данных (см. catalog.datagen).
+    После выхода из блока база удаляется, если не указан keepdb
+    """
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0, keepdb=keepdb)
+    try:
+        generate_catalog(report=report, **dataset)
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def percentile(values, percent):
+    """
+    :return: Перцентиль по методу ближайшего ранга
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100.0 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def endpoint_urls():
+    """
+    Выбирает самые "тяжелые" объекты набора данных: книгу с наибольшим числом экземпляров,
+    автора с наибольшим числом книг и читателя с наибольшим числом выданных книг
+    :return: Словарь имя URL -> адрес и имя пользователя для my-borrowed
+    """
+    book = Book.objects.order_by('-num_copies', 'pk').first()
+    author = Author.objects.annotate(num_books=Count('book')).order_by('-num_books', 'pk').first()
+    borrower = User.objects.filter(bookinstance__status='o').annotate(
+        num_loans=Count('bookinstance')).order_by('-num_loans', 'pk').first()
+    urls = {
+        'index': reverse('index'),
+        'books': reverse('books'),
+        'authors': reverse('authors'),
+        'my-borrowed': reverse('my-borrowed'),
+    }
+    if book is not None:
+        urls['book-detail'] = reverse('book-detail', args=[book.pk])
+    if author is not None:
+        urls['author-detail'] = reverse('author-detail', args=[author.pk])
+    return urls, borrower.username if borrower is not None else None
+
+
+def measure(client, url, requests, warm=False):
+    """
+    Выполняет requests запросов к странице через тестовый клиент
+    :return: Перцентили задержки, число SQL-запросов и пиковое выделение памяти на запрос
+    """
+    latencies = []
+    queries = []
+    for _ in range(requests):
+        if not warm:
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            resp = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if resp.status_code != 200:
+            raise RuntimeError("%s вернул код %s" % (url, resp.status_code))
+        queries.append(len(ctx.captured_queries))
+
+    if not warm:
+        cache.clear()
+    tracemalloc.start()
+    client.get(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p90_ms': round(percentile(latencies, 90), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+# Измерения (run_benchmark, run_server_benchmark, run_template_benchmark) выполняют сотни запросов к каждой
+# странице с одного адреса, поэтому запускаются без ограничения частоты запросов (см. catalog.throttling)
+@override_settings(CATALOG_THROTTLE_RATES={})
+def run_benchmark(requests=50, warm=False, endpoints=None):
+    """
+    Измеряет все страницы каталога на данных, которые уже есть в базе
+    :return: Словарь имя URL -> метрики
+    """
+    urls, username = endpoint_urls()
+    results = {}
+    for name, login_required in ENDPOINTS:
+        if endpoints and name not in endpoints or name not in urls:
+            continue
+        client = Client()
+        if login_required:
+            if username is None or not client.login(username=username, password=BORROWER_PASSWORD):
+                continue
+        # Первый запрос прогревает шаблоны и подключение, в измерения не входит
+        client.get(urls[name])
+        results[name] = measure(client, urls[name], requests, warm=warm)
+    return results
+
+
+def compare_results(current, baseline, tolerance=0.25):
+    """
+    Сравнивает результаты с предыдущим запуском
+    :return: Список описаний регрессий
+    """
+    regressions = []
+    for name, metrics in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if metric in previous and metrics[metric] > previous[metric] * (1 + tolerance):
+                regressions.append("%s: %s %.3f > %.3f (+%d%%)" % (
+                    name, metric, metrics[metric], previous[metric], round(tolerance * 100)))
+        for metric in COUNT_METRICS:
+            if metric in previous and metrics[metric] > previous[metric]:
+                regressions.append("%s: %s %d > %d" % (name, metric, metrics[metric], previous[metric]))
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def _server_metrics(latencies, errors, elapsed):
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p90_ms': round(percentile(latencies, 90), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+    }
+
+
+def _login_cookies(username):
+    client = Client()
+    if username is None or not client.login(username=username, password=BORROWER_PASSWORD):
+        return None
+    return client.cookies
+
+
+def measure_wsgi(url, requests, concurrency, cookies=None):
+    """
+    Выполняет requests запросов через WSGIHandler в concurrency потоках, как многопоточный WSGI-сервер
+    """
+    handler = WSGIHandler()
+    path, _, query = url.partition('?')
+    factory = RequestFactory()
+    if cookies:
+        factory.cookies = cookies
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    barrier = threading.Barrier(concurrency + 1)
+
+    def start_response(status, headers, exc_info=None):
+        start_response.status = status
+
+    def worker():
+        barrier.wait()
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                environ = factory._base_environ(PATH_INFO=path, QUERY_STRING=query, REQUEST_METHOD='GET')
+                started = time.perf_counter()
+                try:
+                    response = handler(environ, start_response)
+                    b''.join(response)
+                    response.close()
+                    ok = response.status_code == 200
+                except Exception:
+                    ok = False
+                with lock:
+                    if ok:
+                        latencies.append((time.perf_counter() - started) * 1000)
+                    else:
+                        errors[0] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return _server_metrics(latencies, errors[0], time.perf_counter() - started)
+
+
+async def _measure_asgi(url, requests, concurrency, cookies=None):
+    handler = ASGIHandler()
+    path, _, query = url.partition('?')
+    factory = AsyncRequestFactory()
+    if cookies:
+        factory.cookies = cookies
+    remaining = iter(range(requests))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            status = []
+            body_sent = []
+
+            async def receive():
+                if body_sent:
+                    # Клиент не отключается: обработчик отменит ожидание после ответа
+                    await asyncio.Future()
+                body_sent.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            scope = factory._base_scope(path=path, query_string=query.encode(), method='GET',
+                                        headers=[(b'host', b'testserver')])
+            started = time.perf_counter()
+            try:
+                await handler(scope, receive, send)
+                ok = status == [200]
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return _server_metrics(latencies, errors, time.perf_counter() - started)
+
+
+def measure_asgi(url, requests, concurrency, cookies=None):
+    """
+    Выполняет requests запросов через ASGIHandler в concurrency одновременных задачах, как ASGI-сервер
+    """
+    return asyncio.run(_measure_asgi(url, requests, concurrency, cookies))
+
+
+@override_settings(CATALOG_THROTTLE_RATES={})
+def run_server_benchmark(requests=500, concurrency=50, warm=False, endpoints=None, servers=('wsgi', 'asgi')):
+    """
+    Сравнивает пропускную способность синхронных страниц под WSGI и асинхронных под ASGI
+    на данных, которые уже есть в базе. Без warm кэш отключается, чтобы измерялась работа представлений
+    :return: Словарь сервер -> имя URL -> метрики
+    """
+    urls, username = endpoint_urls()
+    cookies = _login_cookies(username)
+    measure_server = {'wsgi': measure_wsgi, 'asgi': measure_asgi}
+    caches = settings.CACHES if warm else {alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+                                           for alias in settings.CACHES}
+    results = {}
+    for server in servers:
+        results[server] = {}
+        with override_settings(ROOT_URLCONF=SERVER_URLCONFS[server], CACHES=caches):
+            for name, login_required in ENDPOINTS:
+                if name not in SERVER_ENDPOINTS or endpoints and name not in endpoints or name not in urls:
+                    continue
+                if login_required and cookies is None:
+                    continue
+                results[server][name] = measure_server[server](urls[name], requests, concurrency,
+                                                               cookies if login_required else None)
+    return results
+
+
+def template_settings(mode):
+    """
+    :return: Настройки для override_settings, включающие режим шаблонов mode (см. TEMPLATE_MODES)
+    """
+    loaders = settings.TEMPLATE_LOADERS
+    if mode != 'uncached':
+        loaders = [('django.template.loaders.cached.Loader', loaders)]
+    templates = [{**settings.TEMPLATES[0], 'OPTIONS': {**settings.TEMPLATES[0]['OPTIONS'], 'loaders': loaders}}]
+    return {
+        'TEMPLATES': templates,
+        'CACHES': {**settings.CACHES, FRAGMENTS_OFF_CACHE: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        'CATALOG_FRAGMENT_CACHE': 'default' if mode == 'cached' else FRAGMENTS_OFF_CACHE,
+    }
+
+
+@override_settings(CATALOG_THROTTLE_RATES={})
+def run_template_benchmark(requests=200, endpoints=None, modes=TEMPLATE_MODES):
+    """
+    Сравнивает время отрисовки шаблонов страниц в разных режимах шаблонов на данных, которые уже есть в базе.
+    Страницы запрашиваются читателем, поэтому ответы целиком не кэшируются и шаблон отрисовывается каждый раз
+    :return: Словарь режим -> имя URL -> метрики
+    """
+    urls, username = endpoint_urls()
+    results = {}
+    for mode in modes:
+        results[mode] = {}
+        with override_settings(**template_settings(mode)):
+            client = Client()
+            if username is None or not client.login(username=username, password=BORROWER_PASSWORD):
+                raise RuntimeError("В наборе данных нет читателя с выданными книгами")
+            for name in TEMPLATE_ENDPOINTS:
+                if endpoints and name not in endpoints or name not in urls:
+                    continue
+                # Первый запрос загружает шаблоны и заполняет кэш фрагментов, в измерения не входит
+                client.get(urls[name])
+                render = []
+                total = []
+                for _ in range(requests):
+                    resp = client.get(urls[name])
+                    if resp.status_code != 200:
+                        raise RuntimeError("%s вернул код %s" % (urls[name], resp.status_code))
+                    render.append(resp.query_stats['render_ms'])
+                    total.append(resp.query_stats['total_ms'])
+                results[mode][name] = {
+                    'requests': requests,
+                    'render_mean_ms': round(sum(render) / len(render), 3),
+                    'render_p50_ms': round(percentile(render, 50), 3),
+                    'render_p90_ms': round(percentile(render, 90), 3),
+                    'total_p50_ms': round(percentile(total, 50), 3),
+                }
+    return results
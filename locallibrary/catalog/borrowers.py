@@ -0,0 +1,107 @@
+import datetime
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import BooleanField, Count, DurationField, ExpressionWrapper, F, Min, Q, Value
+from .caching import aget_versions, borrower_scope, get_versions, get_view_cache_timeout
+from .models import BookInstance, LoanEvent
+
+# Префиксы ключей кэша со сводками и историей выдач читателей
+SUMMARY_CACHE_PREFIX = 'catalog:borrower-summary:'
+HISTORY_CACHE_PREFIX = 'catalog:borrower-history:'
+
+# Сколько последних событий журнала выдач показывать в истории читателя
+HISTORY_LIMIT = 20
+
+# За сколько дней до срока возврата выдача считается подходящей к концу
+DUE_SOON_DAYS = 3
+
+
+def current_loans(user, today=None):
+    """
+    Текущие выдачи читателя. Книга и автор загружаются тем же запросом, а просрочка (overdue)
+    и остаток срока (time_remaining, отрицательный у просроченных) вычисляются базой данных
+    """
+    today = today or datetime.date.today()
+    return (BookInstance.objects.on_loan().filter(borrower=user).select_related('book__author')
+            .annotate(overdue=ExpressionWrapper(Q(due_back__lt=today), output_field=BooleanField()),
+                      time_remaining=ExpressionWrapper(F('due_back') - Value(today), output_field=DurationField()))
+            .order_by('due_back', 'id'))
+
+
+def compute_summary(user, today=None):
+    """
+    Сводка по выдачам читателя одним агрегирующим запросом
+    :return: Словарь on_loan, overdue, due_soon и next_due_back (ближайший еще не прошедший срок)
+    """
+    today = today or datetime.date.today()
+    due_soon = today + datetime.timedelta(days=DUE_SOON_DAYS)
+    return BookInstance.objects.on_loan().filter(borrower=user).aggregate(
+        on_loan=Count('pk'),
+        overdue=Count('pk', filter=Q(due_back__lt=today)),
+        due_soon=Count('pk', filter=Q(due_back__gte=today, due_back__lte=due_soon)),
+        next_due_back=Min('due_back', filter=Q(due_back__gte=today)),
+    )
+
+
+def _summary_key(user, versions, today):
+    # Версия области читателя меняется при каждой выдаче, возврате и продлении его экземпляров,
+    # дата - потому что от нее зависит просрочка
+    return '%s%s:%s:%s' % (SUMMARY_CACHE_PREFIX, user.pk, versions[borrower_scope(user.pk)], today.isoformat())
+
+
+def get_borrower_summary(user, today=None):
+    """
+    :return: Сводка по выдачам читателя из кэша (см. compute_summary)
+    """
+    today = today or datetime.date.today()
+    key = _summary_key(user, get_versions([borrower_scope(user.pk)]), today)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_summary(user, today)
+        cache.set(key, summary, get_view_cache_timeout())
+    return summary
+
+
+async def aget_borrower_summary(user, today=None):
+    today = today or datetime.date.today()
+    key = _summary_key(user, await aget_versions([borrower_scope(user.pk)]), today)
+    summary = await cache.aget(key)
+    if summary is None:
+        summary = await sync_to_async(compute_summary)(user, today)
+        await cache.aset(key, summary, get_view_cache_timeout())
+    return summary
+
+
+def loan_history(user, limit=HISTORY_LIMIT):
+    """
+    Последние события журнала выдач читателя (выдачи, продления, возвраты) с книгами одним запросом
+    по индексу (borrower, created_at)
+    """
+    return list(LoanEvent.objects.filter(borrower_id=user.pk).select_related('book')
+                .order_by('-created_at', '-pk')[:limit])
+
+
+def _history_key(user, versions):
+    # События читателя записываются вместе с изменениями его экземпляров, которые меняют версию его области
+    return '%s%s:%s' % (HISTORY_CACHE_PREFIX, user.pk, versions[borrower_scope(user.pk)])
+
+
+def get_loan_history(user):
+    """
+    :return: История выдач читателя из кэша (см. loan_history)
+    """
+    key = _history_key(user, get_versions([borrower_scope(user.pk)]))
+    history = cache.get(key)
+    if history is None:
+        history = loan_history(user)
+        cache.set(key, history, get_view_cache_timeout())
+    return history
+
+
+async def aget_loan_history(user):
+    key = _history_key(user, await aget_versions([borrower_scope(user.pk)]))
+    history = await cache.aget(key)
+    if history is None:
+        history = await sync_to_async(loan_history)(user)
+        await cache.aset(key, history, get_view_cache_timeout())
+    return history
@@ -0,0 +1,200 @@
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .middleware import render_timed
+
+# Префиксы ключей кэша с версиями объектов и с готовыми ответами
+VERSION_PREFIX = 'catalog:version:'
+RESPONSE_PREFIX = 'catalog:response:'
+
+
+def get_view_cache_timeout():
+    """
+    :return: Время жизни (в секундах) закэшированного ответа страницы каталога
+    """
+    return getattr(settings, 'CATALOG_VIEW_CACHE_TIMEOUT', 600)
+
+
+def get_version_cache():
+    """
+    Версии хранятся в отдельном кэше, чтобы их не вытесняли закэшированные ответы и фрагменты
+    :return: Кэш CATALOG_VERSION_CACHE с версиями областей
+    """
+    return caches[getattr(settings, 'CATALOG_VERSION_CACHE', 'default')]
+
+
+def book_scope(pk):
+    return 'book:%s' % pk
+
+
+def author_scope(pk):
+    return 'author:%s' % pk
+
+
+def borrower_scope(pk):
+    return 'borrower:%s' % pk
+
+
+def _version_keys(scopes):
+    return {scope: VERSION_PREFIX + scope for scope in scopes}
+
+
+def _fill_versions(keys, found):
+    versions = {}
+    missing = {}
+    now = int(time.time() * 1000)
+    for scope, key in keys.items():
+        if key in found:
+            versions[scope] = found[key]
+        else:
+            versions[scope] = missing[key] = now
+    return versions, missing
+
+
+def get_versions(scopes):
+    """
+    Версия области - время последнего изменения в миллисекундах. Если версии нет в кэше,
+    она создается равной текущему времени, так что потеря ключа только сбрасывает кэш страниц
+    :return: Словарь область -> версия
+    """
+    keys = _version_keys(scopes)
+    version_cache = get_version_cache()
+    versions, missing = _fill_versions(keys, version_cache.get_many(keys.values()))
+    if missing:
+        version_cache.set_many(missing, None)
+    return versions
+
+
+async def aget_versions(scopes):
+    """
+    Асинхронный вариант get_versions
+    """
+    keys = _version_keys(scopes)
+    version_cache = get_version_cache()
+    versions, missing = _fill_versions(keys, await version_cache.aget_many(keys.values()))
+    if missing:
+        await version_cache.aset_many(missing, None)
+    return versions
+
+
+def attach_cache_versions(objects, scope):
+    """
+    Записывает в атрибут cache_version каждого объекта версию его области (одно обращение к кэшу).
+    Версия входит в ключ фрагмента шаблона со строкой объекта: {% cache ... obj.pk obj.cache_version %}
+    :param scope: Функция id объекта -> область (book_scope, author_scope)
+    """
+    versions = get_versions([scope(obj.pk) for obj in objects])
+    for obj in objects:
+        obj.cache_version = versions[scope(obj.pk)]
+    return objects
+
+
+async def aattach_cache_versions(objects, scope):
+    versions = await aget_versions([scope(obj.pk) for obj in objects])
+    for obj in objects:
+        obj.cache_version = versions[scope(obj.pk)]
+    return objects
+
+
+def _bump(scopes):
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    version_cache = get_version_cache()
+    found = version_cache.get_many(keys)
+    now = int(time.time() * 1000)
+    version_cache.set_many({key: max(now, found.get(key, 0) + 1) for key in keys}, None)
+
+
+def bump_versions(*scopes):
+    """
+    Сбрасывает закэшированные страницы, зависящие от указанных областей. Версии меняются сразу
+    и еще раз после фиксации транзакции, чтобы не закэшировать страницу, построенную до фиксации
+    """
+    scopes = {scope for scope in scopes if scope}
+    if not scopes:
+        return
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _response_signature(view, request, versions):
+    """
+    :return: Ключ ответа в кэше, ETag и время последнего изменения
+    """
+    signature = '%s|%s|%s' % (type(view).__name__, request.get_full_path(),
+                              ','.join('%s=%s' % item for item in sorted(versions.items())))
+    digest = hashlib.md5(signature.encode(), usedforsecurity=False).hexdigest()
+    return RESPONSE_PREFIX + digest, quote_etag(digest), max(versions.values()) // 1000
+
+
+def _finish_response(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Браузер может хранить страницу, но должен каждый раз перепроверять ее по ETag
+    patch_cache_control(response, max_age=0)
+    return response
+
+
+class CachedViewMixin:
+    """
+    Примесь для представлений каталога, кэширующая ответы анонимным пользователям.
+    Ключ ответа строится из пути запроса (включая номер страницы) и версий областей get_cache_scopes(),
+    которые сбрасываются сигналами моделей (см. catalog.signals). Поддерживает условные GET-запросы
+    по ETag и Last-Modified. Версии областей должны храниться в кэше, общем для всех процессов (см. CACHES
+    в настройках): с кэшем в памяти процесса остальные процессы отдают устаревшие страницы до истечения
+    CATALOG_VIEW_CACHE_TIMEOUT
+    """
+    def get_cache_scopes(self):
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key, etag, last_modified = _response_signature(self, request, get_versions(self.get_cache_scopes()))
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = super().dispatch(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if hasattr(response, 'render'):
+                    render_timed(request, response)
+                cache.set(key, (response.content, response['Content-Type']), get_view_cache_timeout())
+        return _finish_response(response, etag, last_modified)
+
+
+class AsyncCachedViewMixin(CachedViewMixin):
+    """
+    Вариант CachedViewMixin для представлений с асинхронными обработчиками (см. catalog.async_views)
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if request.method not in ('GET', 'HEAD') or user.is_authenticated:
+            return await super(CachedViewMixin, self).dispatch(request, *args, **kwargs)
+
+        key, etag, last_modified = _response_signature(self, request, await aget_versions(self.get_cache_scopes()))
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cached = await cache.aget(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = await super(CachedViewMixin, self).dispatch(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if hasattr(response, 'render'):
+                    # Шаблон может обращаться к базе данных (например, через perms), поэтому отрисовка - в потоке
+                    await sync_to_async(render_timed)(request, response)
+                await cache.aset(key, (response.content, response['Content-Type']), get_view_cache_timeout())
+        return _finish_response(response, etag, last_modified)
@@ -0,0 +1,99 @@
+import datetime
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, Max, OuterRef
+from django.utils import timezone
+from .models import Book, CirculationCursor, DailyBookCirculation, DailyGenreCirculation, LoanEvent
+
+# Курсор журнала выдач, до которого построена дневная статистика
+CURSOR_NAME = 'daily_circulation'
+
+# Сколько событий журнала учитывается за одну транзакцию
+CIRCULATION_BATCH_SIZE = 10000
+
+# Вид события -> счетчик дневной статистики
+COUNTER_FOR_KIND = {
+    LoanEvent.CHECKOUT: 'checkouts',
+    LoanEvent.RETURN: 'returns',
+    LoanEvent.RENEW: 'renewals',
+    LoanEvent.STATUS: 'status_changes',
+}
+
+
+def _merge_counts(model, key, rows):
+    """
+    Прибавляет счетчики событий к дневной статистике: существующие строки изменяются одним bulk_update,
+    недостающие создаются bulk_create
+    :param key: Поле модели статистики (book или genre)
+    :param rows: Строки (день, id ключа, вид события, число событий)
+    :return: Число измененных и созданных строк статистики
+    """
+    counts = defaultdict(Counter)
+    for day, pk, kind, count in rows:
+        counts[day, pk][COUNTER_FOR_KIND[kind]] += count
+    if not counts:
+        return 0
+    days = [day for day, pk in counts]
+    pks = list({pk for day, pk in counts})
+    existing = {}
+    batch_size = connection.ops.bulk_batch_size(['pk'], pks) or len(pks)
+    for start in range(0, len(pks), batch_size):
+        for row in model.objects.select_for_update().filter(
+                day__range=(min(days), max(days)), **{key + '_id__in': pks[start:start + batch_size]}):
+            existing[row.day, getattr(row, key + '_id')] = row
+    created = []
+    for (day, pk), counters in counts.items():
+        row = existing.get((day, pk))
+        if row is None:
+            created.append(model(day=day, **{key + '_id': pk}, **counters))
+        else:
+            for name, count in counters.items():
+                setattr(row, name, getattr(row, name) + count)
+    model.objects.bulk_update(existing.values(), list(COUNTER_FOR_KIND.values()), batch_size=1000)
+    model.objects.bulk_create(created, batch_size=1000)
+    return len(counts)
+
+
+def get_circulation_lag():
+    """
+    Курсор статистики - id последнего учтенного события, а id выдаются при вставке, а не при фиксации
+    транзакции. В PostgreSQL событие с меньшим id может стать видимым после того, как курсор прошел его,
+    и было бы пропущено навсегда. Поэтому курсор сдвигается только до событий старше задержки,
+    и транзакции, записывающие события, должны укладываться в нее. SQLite фиксирует транзакции по одной
+    в порядке id, так что для нее задержка не нужна
+    :return: Задержка (в секундах) из настройки CATALOG_CIRCULATION_LAG
+    """
+    return getattr(settings, 'CATALOG_CIRCULATION_LAG', 0 if connection.vendor == 'sqlite' else 300)
+
+
+def aggregate_circulation(batch_size=CIRCULATION_BATCH_SIZE, lag=None):
+    """
+    Дополняет дневную статистику выдач по книгам и жанрам событиями журнала, появившимися после
+    последнего запуска. События учитываются порциями по id: агрегация порции (GROUP BY день, ключ, вид)
+    и сдвиг курсора выполняются в одной транзакции, так что прерванный запуск продолжится с того же места.
+    События удаленных книг в статистику не попадают
+    :param lag: Задержка учета событий в секундах (по умолчанию get_circulation_lag())
+    :return: Число учтенных событий и измененных строк статистики книг и жанров
+    """
+    lag = get_circulation_lag() if lag is None else lag
+    result = {'events': 0, 'books': 0, 'genres': 0}
+    while True:
+        with transaction.atomic():
+            cursor, _ = CirculationCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+            pending = LoanEvent.objects.filter(pk__gt=cursor.last_event_id)
+            if lag:
+                pending = pending.filter(created_at__lte=timezone.now() - datetime.timedelta(seconds=lag))
+            last_id = next(iter(pending.order_by('pk').values_list('pk', flat=True)[batch_size - 1:batch_size]),
+                           None) or pending.aggregate(last_id=Max('pk'))['last_id']
+            if last_id is None:
+                return result
+            events = LoanEvent.objects.filter(pk__gt=cursor.last_event_id, pk__lte=last_id).order_by()
+            result['events'] += events.count()
+            result['books'] += _merge_counts(DailyBookCirculation, 'book', events.filter(
+                Exists(Book.objects.filter(pk=OuterRef('book_id')))).values_list(
+                'day', 'book_id', 'kind').annotate(count=Count('pk')))
+            result['genres'] += _merge_counts(DailyGenreCirculation, 'genre', events.filter(
+                book__genre__isnull=False).values_list('day', 'book__genre', 'kind').annotate(count=Count('pk')))
+            cursor.last_event_id = last_id
+            cursor.save()
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+
+def fragment_cache(request):
+    """
+    Кэш и время жизни фрагментов шаблонов: {% cache fragment_cache_timeout имя ... using=fragment_cache %}
+    """
+    return {
+        'fragment_cache': getattr(settings, 'CATALOG_FRAGMENT_CACHE', 'default'),
+        'fragment_cache_timeout': getattr(settings, 'CATALOG_FRAGMENT_CACHE_TIMEOUT', 600),
+    }
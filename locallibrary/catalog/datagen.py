@@ -0,0 +1,81 @@
+import datetime
+import random
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from .importer import CatalogImporter
+from .models import Language
+
+WORDS = ('war', 'peace', 'night', 'garden', 'river', 'stone', 'winter', 'shadow', 'empire', 'glass',
+         'silent', 'last', 'golden', 'secret', 'city', 'mountain', 'letters', 'children', 'storm', 'island')
+
+STATUSES = ('a', 'a', 'a', 'o', 'o', 'm', 'r')
+
+# Пароль всех сгенерированных читателей
+BORROWER_PASSWORD = 'benchmark'
+
+
+def borrower_username(num):
+    return 'reader%d' % num
+
+
+def book_isbn(num):
+    return '%013d' % (9780000000000 + num)
+
+
+def generate_records(authors=100, books=1000, genres=20, copies=3000, borrowers=50, seed=0):
+    """
+    Детерминированно порождает записи каталога в формате import_catalog: при одинаковых параметрах
+    и seed получается один и тот же набор данных. Записи порождаются по одной, поэтому объем
+    не ограничен памятью
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    languages = [code for code, name in Language.LANGUAGE_CHOICES]
+    for num in range(genres):
+        yield {'type': 'genre', 'name': 'Genre %d' % num}
+    for num in range(authors):
+        yield {'type': 'author', 'first_name': 'First%d' % num, 'last_name': 'Last%d' % num,
+               'date_of_birth': datetime.date(1800 + rng.randrange(200), 1 + rng.randrange(12), 1)}
+    for num in range(books):
+        author = rng.randrange(authors) if authors else None
+        yield {
+            'type': 'book',
+            'title': ' '.join(rng.choice(WORDS) for _ in range(1 + rng.randrange(4))).capitalize(),
+            'summary': ' '.join(rng.choice(WORDS) for _ in range(20)),
+            'isbn': book_isbn(num),
+            'author_first_name': 'First%d' % author if author is not None else '',
+            'author_last_name': 'Last%d' % author if author is not None else '',
+            'genres': ['Genre %d' % rng.randrange(genres) for _ in range(1 + rng.randrange(3))] if genres else [],
+            'language': rng.choice(languages),
+        }
+    for num in range(copies):
+        status = rng.choice(STATUSES)
+        record = {'type': 'copy', 'book_isbn': book_isbn(rng.randrange(books)), 'imprint': 'Imprint %d' % num,
+                  'status': status}
+        if status == 'o' and borrowers:
+            record['borrower'] = borrower_username(rng.randrange(borrowers))
+            record['due_back'] = today + datetime.timedelta(days=rng.randrange(-14, 28))
+        yield record
+
+
+def create_borrowers(count):
+    """
+    Создает читателей reader0..readerN с общим паролем BORROWER_PASSWORD
+    """
+    password = make_password(BORROWER_PASSWORD)
+    existing = set(User.objects.filter(username__startswith='reader').values_list('username', flat=True))
+    User.objects.bulk_create([User(username=borrower_username(num), password=password)
+                              for num in range(count) if borrower_username(num) not in existing],
+                             batch_size=1000)
+
+
+def generate_catalog(authors=100, books=1000, genres=20, copies=3000, borrowers=50, seed=0, batch_size=5000,
+                     report=None):
+    """
+    Заполняет базу детерминированным набором данных
+    :return: Количество созданных объектов каждого типа
+    """
+    create_borrowers(borrowers)
+    records = generate_records(authors=authors, books=books, genres=genres, copies=copies, borrowers=borrowers,
+                               seed=seed)
+    return CatalogImporter(batch_size=batch_size, report=report).run(records)
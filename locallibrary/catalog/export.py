@@ -0,0 +1,80 @@
+import csv
+import json
+from .models import Book, BookInstance
+
+# Поля выгрузки для каждого вида данных: имя столбца -> путь в ORM
+EXPORT_FIELDS = {
+    'books': (
+        ('id', 'pk'),
+        ('title', 'title'),
+        ('isbn', 'isbn'),
+        ('author_first_name', 'author__first_name'),
+        ('author_last_name', 'author__last_name'),
+        ('language', 'language__name'),
+        ('summary', 'summary'),
+    ),
+    'copies': (
+        ('id', 'pk'),
+        ('book_id', 'book_id'),
+        ('book_title', 'book__title'),
+        ('book_isbn', 'book__isbn'),
+        ('author_first_name', 'book__author__first_name'),
+        ('author_last_name', 'book__author__last_name'),
+        ('imprint', 'imprint'),
+        ('status', 'status'),
+        ('due_back', 'due_back'),
+    ),
+}
+
+EXPORT_MODELS = {'books': Book, 'copies': BookInstance}
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+CHUNK_SIZE = 2000
+
+
+def export_rows(kind, chunk_size=CHUNK_SIZE):
+    """
+    Построчно читает данные для выгрузки. Строки берутся через values_list и iterator(),
+    поэтому объекты моделей не создаются, а в памяти одновременно находится не больше chunk_size строк
+    (на PostgreSQL используется серверный курсор)
+    :return: Итератор кортежей в порядке EXPORT_FIELDS[kind]
+    """
+    paths = [path for name, path in EXPORT_FIELDS[kind]]
+    return EXPORT_MODELS[kind].objects.order_by('pk').values_list(*paths).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """
+    Псевдо-файл для csv.writer: вместо записи возвращает строку, чтобы ее можно было сразу отправить клиенту
+    """
+    def write(self, value):
+        return value
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+def iter_csv(kind):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, path in EXPORT_FIELDS[kind]])
+    for row in export_rows(kind):
+        yield writer.writerow([_text(value) for value in row])
+
+
+def iter_jsonl(kind):
+    names = [name for name, path in EXPORT_FIELDS[kind]]
+    for row in export_rows(kind):
+        yield json.dumps(dict(zip(names, row)), default=str, ensure_ascii=False) + '\n'
+
+
+def iter_export(kind, file_format):
+    """
+    :return: Итератор строк выгрузки в формате csv или jsonl
+    """
+    if file_format == 'csv':
+        return iter_csv(kind)
+    return iter_jsonl(kind)
@@ -0,0 +1,133 @@
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .caching import aget_versions, get_versions, get_view_cache_timeout
+from .models import AVAILABILITY_FIELDS, Author, Book, BookInstance, Genre, Language
+
+# Префикс ключей кэша со счетчиками фасетов
+FACETS_CACHE_PREFIX = 'catalog:facets:'
+
+# Области кэша, от которых зависят счетчики: книги (в том числе их доступность) и названия жанров и языков
+FACETS_SCOPES = ['books', 'facets']
+
+# Фасеты списка книг в порядке вывода
+FACET_NAMES = ('genre', 'language', 'author', 'availability')
+
+# Сколько авторов (с наибольшим числом книг) показывать в фасете
+AUTHOR_FACET_LIMIT = 20
+
+
+def parse_filters(params):
+    """
+    :param params: Параметры запроса (request.GET)
+    :return: Словарь фасет -> выбранное значение; неправильные значения отбрасываются
+    """
+    filters = {}
+    for name in ('genre', 'language', 'author'):
+        value = params.get(name, '')
+        if value.isdigit():
+            filters[name] = int(value)
+    if params.get('availability') in AVAILABILITY_FIELDS:
+        filters['availability'] = params['availability']
+    return filters
+
+
+def filter_books(queryset, filters, exclude=None):
+    """
+    Отбирает книги по выбранным значениям фасетов. Доступность проверяется по счетчикам книги,
+    поэтому таблица экземпляров не читается
+    :param exclude: Фасет, выбор которого не учитывается
+    """
+    for name, value in filters.items():
+        if name == exclude:
+            continue
+        if name == 'availability':
+            queryset = queryset.filter(**{AVAILABILITY_FIELDS[value] + '__gt': 0})
+        else:
+            queryset = queryset.filter(**{name: value})
+    return queryset
+
+
+def _counts(model, filters, name, fields, ordering, limit=None):
+    """
+    :return: Значения фасета name (объекты model) с числом книг, отобранных остальными фасетами
+    """
+    books = filter_books(Book.objects.order_by(), filters, exclude=name).values('pk')
+    rows = (model.objects.filter(book__in=books).annotate(count=Count('book')).order_by(*ordering)
+            .values_list('pk', 'count', *fields)[:limit])
+    return [{'value': pk, 'label': ', '.join(labels), 'count': count} for pk, count, *labels in rows]
+
+
+def compute_facets(filters):
+    """
+    Считает книги для каждого значения фасетов одним сгруппированным запросом на фасет. Счетчики фасета
+    учитывают выбор во всех остальных фасетах, но не в нем самом, так что видно, сколько книг будет
+    после выбора другого значения
+    :return: Словарь фасет -> список значений {'value', 'label', 'count'}
+    """
+    statuses = dict(BookInstance.LOAN_STATUS)
+    availability = filter_books(Book.objects.order_by(), filters, exclude='availability').aggregate(**{
+        status: Count('pk', filter=Q(**{field + '__gt': 0})) for status, field in AVAILABILITY_FIELDS.items()})
+    return {
+        'genre': _counts(Genre, filters, 'genre', ['name'], ['name', 'pk']),
+        'language': _counts(Language, filters, 'language', ['name'], ['name', 'pk']),
+        'author': _counts(Author, filters, 'author', ['last_name', 'first_name'],
+                          ['-count', 'last_name', 'first_name', 'pk'], AUTHOR_FACET_LIMIT),
+        'availability': [{'value': status, 'label': statuses[status], 'count': count}
+                         for status, count in availability.items() if count],
+    }
+
+
+def _facets_key(filters, versions):
+    return FACETS_CACHE_PREFIX + '%s:%s' % (','.join('%s=%s' % item for item in sorted(versions.items())),
+                                            urlencode(sorted(filters.items())))
+
+
+def get_facets(filters):
+    """
+    Счетчики фасетов для набора фильтров из кэша. Ключ включает версии областей книг и фасетов,
+    которые сбрасываются сигналами моделей (см. catalog.signals)
+    """
+    key = _facets_key(filters, get_versions(FACETS_SCOPES))
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, get_view_cache_timeout())
+    return facets
+
+
+async def aget_facets(filters):
+    key = _facets_key(filters, await aget_versions(FACETS_SCOPES))
+    facets = await cache.aget(key)
+    if facets is None:
+        facets = await sync_to_async(compute_facets)(filters)
+        await cache.aset(key, facets, get_view_cache_timeout())
+    return facets
+
+
+def filter_query(filters):
+    """
+    :return: Параметры фильтров для ссылок на соседние страницы и сортировки
+    """
+    return ''.join('&%s' % urlencode({name: filters[name]}) for name in FACET_NAMES if name in filters)
+
+
+def facet_links(facets, filters, sort_query=''):
+    """
+    Добавляет к значениям фасетов ссылки, выбирающие значение (или снимающие выбор), и ссылку,
+    снимающую выбор в фасете
+    :return: Список фасетов {'name', 'values', 'selected', 'clear_url'} в порядке FACET_NAMES
+    """
+    def url(**changes):
+        params = {**filters, **changes}
+        query = filter_query({name: value for name, value in params.items() if value is not None}) + sort_query
+        return '?' + query[1:]
+
+    links = []
+    for name in FACET_NAMES:
+        values = [{**value, 'selected': filters.get(name) == value['value'],
+                   'url': url(**{name: None if filters.get(name) == value['value'] else value['value']})}
+                  for value in facets[name]]
+        links.append({'name': name, 'values': values, 'selected': name in filters, 'clear_url': url(**{name: None})})
+    return links
@@ -2,24 +2,52 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 import datetime
+import uuid
+
+
+def validate_renewal_date(data):
+    """
+    Правила даты продления, общие для одного экземпляра и для пакетного продления
+    :return: Проверенная дата
+    """
+    # проверка того, что дата не в прошлом
+    if data < datetime.date.today():
+        raise ValidationError(_("Неправильная дата, возрат в прошлом"))
+
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(_("Неправильная дата, дата не может превышать 4 недели"))
+
+    if data == datetime.date.today():
+        raise ValidationError(_("Вы не можете вернуть книгу в тот же день что и взяли"))
+
+    return data
 
 
 class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(help_text="Введите дату между текущим днем и 4 неделями(по умолчанию 3)")
+    # Версия экземпляра, которую видел библиотекарь, чтобы не затереть чужое изменение (см. catalog.loans)
+    version = forms.IntegerField(required=False, min_value=0, widget=forms.HiddenInput)
 
     def clean_renewal_date(self):
-        data = self.cleaned_data["renewal_date"]
-        # проверка того, что дата не в прошлом
-        if data < datetime.date.today():
-            raise ValidationError(_("Неправильная дата, возрат в прошлом"))
+        return validate_renewal_date(self.cleaned_data["renewal_date"])
 
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(_("Неправильная дата, дата не может превышать 4 недели"))
-
-        if data == datetime.date.today():
-            raise ValidationError(_("Вы не можете вернуть книгу в тот же день что и взяли"))
-
-        return data
 
+class BulkRenewForm(forms.Form):
+    """
+    Продление многих экземпляров сразу: список id экземпляров (через пробел, запятую или с новой строки) и дата
+    """
+    copies = forms.CharField(widget=forms.Textarea, help_text="Идентификаторы экземпляров")
+    renewal_date = forms.DateField(help_text="Введите дату между текущим днем и 4 неделями(по умолчанию 3)")
 
+    def clean_copies(self):
+        try:
+            items = self.cleaned_data["copies"].replace(',', ' ').split()
+            copy_ids = list(dict.fromkeys(uuid.UUID(item) for item in items))
+        except ValueError:
+            raise ValidationError(_("Неправильный идентификатор экземпляра"))
+        if not copy_ids:
+            raise ValidationError(_("Не указаны экземпляры"))
+        return copy_ids
 
+    def clean_renewal_date(self):
+        return validate_renewal_date(self.cleaned_data["renewal_date"])
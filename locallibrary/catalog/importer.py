@@ -0,0 +1,247 @@
+import csv
+import datetime
+import json
+import time
+import uuid
+from collections import Counter
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import Author, Book, BookInstance, Genre, Language, LoanEvent
+from .search import get_backend as get_search_backend
+from .stats import invalidate_stats
+
+RECORD_TYPES = ('author', 'genre', 'language', 'book', 'copy')
+
+
+class CatalogImportError(ValueError):
+    """
+    Ошибка в импортируемой записи
+    """
+
+
+def read_jsonl(stream):
+    """
+    Построчно читает записи из потока в формате JSON Lines
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    """
+    Построчно читает записи из CSV-потока с заголовком. Тип записи задается столбцом type
+    """
+    for row in csv.DictReader(stream):
+        yield {key: value for key, value in row.items() if value not in ('', None)}
+
+
+def _date(value):
+    if not value:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+
+def _names(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [name.strip() for name in value if name.strip()]
+
+
+class CatalogImporter:
+    """
+    Потоковый импорт каталога. Записи накапливаются в пакеты по batch_size штук, каждый пакет
+    сохраняется через bulk_create в отдельной транзакции, после чего память пакета освобождается.
+    Авторы, жанры и языки сопоставляются через словари в памяти, книги и читатели для экземпляров -
+    по ISBN и имени пользователя одним запросом на пакет
+    """
+    def __init__(self, batch_size=1000, report=None, report_interval=1.0):
+        self.batch_size = batch_size
+        self.report = report
+        self.report_interval = report_interval
+        self.authors = {(first, last): pk for pk, first, last in
+                        Author.objects.values_list('pk', 'first_name', 'last_name').iterator()}
+        self.genres = dict(Genre.objects.values_list('name', 'pk'))
+        self.languages = dict(Language.objects.values_list('name', 'pk'))
+        self.counts = Counter()
+        self.records = 0
+        self._started = self._last_report = time.monotonic()
+        self._reset_batch()
+
+    def _reset_batch(self):
+        self.new_authors = {}
+        self.new_genres = {}
+        self.new_languages = {}
+        self.books = []
+        self.copies = []
+        self.pending = 0
+
+    def run(self, records):
+        """
+        Импортирует все записи из итератора
+        :return: Количество созданных объектов каждого типа
+        """
+        for number, record in enumerate(records, start=1):
+            try:
+                self.feed(record)
+            except (KeyError, ValueError, TypeError) as exc:
+                raise CatalogImportError("Запись %s: %s" % (number, exc)) from exc
+        self.flush()
+        invalidate_stats()
+        self._report_progress(force=True)
+        return self.counts
+
+    def feed(self, record):
+        record_type = record.get('type')
+        if record_type not in RECORD_TYPES:
+            raise ValueError("неизвестный тип записи %r" % record_type)
+        getattr(self, '_feed_%s' % record_type)(record)
+        self.records += 1
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def _author_key(self, first_name, last_name):
+        key = (first_name, last_name)
+        if key not in self.authors and key not in self.new_authors:
+            self.new_authors[key] = Author(first_name=first_name, last_name=last_name)
+        return key
+
+    def _genre_key(self, name):
+        if name not in self.genres and name not in self.new_genres:
+            self.new_genres[name] = Genre(name=name)
+        return name
+
+    def _language_key(self, name):
+        if name not in self.languages and name not in self.new_languages:
+            self.new_languages[name] = Language(name=name)
+        return name
+
+    def _feed_author(self, record):
+        key = self._author_key(record['first_name'], record['last_name'])
+        author = self.new_authors.get(key)
+        if author is not None:
+            author.date_of_birth = _date(record.get('date_of_birth'))
+            author.date_of_death = _date(record.get('date_of_death'))
+
+    def _feed_genre(self, record):
+        self._genre_key(record['name'])
+
+    def _feed_language(self, record):
+        self._language_key(record['name'])
+
+    def _feed_book(self, record):
+        author_key = None
+        if record.get('author_last_name') or record.get('author_first_name'):
+            author_key = self._author_key(record.get('author_first_name', ''), record.get('author_last_name', ''))
+        language_key = self._language_key(record['language']) if record.get('language') else None
+        genre_keys = [self._genre_key(name) for name in dict.fromkeys(_names(record.get('genres')))]
+        book = Book(title=record['title'], summary=record.get('summary', ''), isbn=record.get('isbn', ''))
+        self.books.append((book, author_key, language_key, genre_keys))
+
+    def _feed_copy(self, record):
+        status = record.get('status', 'm')
+        if status not in dict(BookInstance.LOAN_STATUS):
+            raise ValueError("неизвестный статус экземпляра %r" % status)
+        # Экземпляры самые многочисленные записи, поэтому для них не создаются объекты моделей
+        copy_id = uuid.UUID(record['id']) if record.get('id') else uuid.uuid4()
+        self.copies.append((record['book_isbn'], copy_id, record.get('imprint', ''), status,
+                            _date(record.get('due_back')), record.get('borrower')))
+
+    def _insert_rows(self, model, field_names, rows):
+        """
+        Вставляет строки одним executemany, минуя создание объектов моделей
+        """
+        # Настоящее подключение, а не прокси django.db.connection, чтобы не платить за поиск подключения на каждое значение
+        db = transaction.get_connection()
+        fields = [model._meta.get_field(name) for name in field_names]
+        qn = db.ops.quote_name
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(model._meta.db_table), ', '.join(qn(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)))
+        with db.cursor() as cursor:
+            cursor.executemany(sql, [[field.get_db_prep_save(value, db) for field, value in zip(fields, row)]
+                                     for row in rows])
+
+    def _create_lookups(self, model, pending, lookup, key_of):
+        if pending:
+            for obj in model.objects.bulk_create(list(pending.values()), batch_size=self.batch_size):
+                lookup[key_of(obj)] = obj.pk
+
+    def flush(self):
+        """
+        Сохраняет накопленный пакет в одной транзакции
+        """
+        if not self.pending:
+            return
+        with transaction.atomic():
+            self._create_lookups(Author, self.new_authors, self.authors, lambda obj: (obj.first_name, obj.last_name))
+            self._create_lookups(Genre, self.new_genres, self.genres, lambda obj: obj.name)
+            self._create_lookups(Language, self.new_languages, self.languages, lambda obj: obj.name)
+            self.counts['author'] += len(self.new_authors)
+            self.counts['genre'] += len(self.new_genres)
+            self.counts['language'] += len(self.new_languages)
+            isbn_map = self._flush_books()
+            self._flush_copies(isbn_map)
+        self._reset_batch()
+        self._report_progress()
+
+    def _flush_books(self):
+        isbns = {book.isbn for book, *rest in self.books if book.isbn}
+        isbns.update(copy[0] for copy in self.copies)
+        isbn_map = dict(Book.objects.filter(isbn__in=isbns).values_list('isbn', 'pk')) if isbns else {}
+        new_books = []
+        for book, author_key, language_key, genre_keys in self.books:
+            # Книги, уже существующие в каталоге (или повторенные в файле), не создаются повторно
+            if book.isbn and book.isbn in isbn_map:
+                continue
+            book.author_id = self.authors[author_key] if author_key else None
+            book.language_id = self.languages[language_key] if language_key else None
+            book._genre_keys = genre_keys
+            if book.isbn:
+                isbn_map[book.isbn] = None
+            new_books.append(book)
+        if not new_books:
+            return isbn_map
+        Book.objects.bulk_create(new_books, batch_size=self.batch_size)
+        self._insert_rows(Book.genre.through, ('book', 'genre'),
+                          [(book.pk, self.genres[key]) for book in new_books for key in book._genre_keys])
+        for book in new_books:
+            if book.isbn:
+                isbn_map[book.isbn] = book.pk
+        get_search_backend().index_books(book.pk for book in new_books)
+        self.counts['book'] += len(new_books)
+        return isbn_map
+
+    def _flush_copies(self, isbn_map):
+        usernames = {copy[-1] for copy in self.copies if copy[-1]}
+        borrowers = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk')) if usernames else {}
+        rows = []
+        for isbn, copy_id, imprint, status, due_back, borrower in self.copies:
+            if isbn_map.get(isbn) is None:
+                raise CatalogImportError("книга с ISBN %r не найдена" % isbn)
+            if borrower and borrower not in borrowers:
+                raise CatalogImportError("пользователь %r не найден" % borrower)
+            rows.append((copy_id, isbn_map[isbn], imprint, status, due_back, borrowers.get(borrower), 0))
+        if rows:
+            self._insert_rows(BookInstance, ('id', 'book', 'imprint', 'status', 'due_back', 'borrower', 'version'),
+                              rows)
+            Book.objects.adjust_availability(Counter((row[1], row[3]) for row in rows))
+            # Выданные экземпляры попадают в журнал выдач, как при BookInstance.objects.bulk_create
+            LoanEvent.objects.bulk_create([LoanEvent.build(copy_id, book_id, borrower_id, '', status, due_back)
+                                           for copy_id, book_id, imprint, status, due_back, borrower_id, version
+                                           in rows if status == 'o'], batch_size=self.batch_size)
+        self.counts['copy'] += len(rows)
+
+    def _report_progress(self, force=False):
+        now = time.monotonic()
+        if self.report is None or (not force and now - self._last_report < self.report_interval):
+            return
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-9)
+        self.report("%d записей за %.1f с (%.0f записей/с)" % (self.records, elapsed, self.records / elapsed))
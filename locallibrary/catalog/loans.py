@@ -0,0 +1,111 @@
+import datetime
+from django.db import connection, transaction
+from django.db.models import F
+from .caching import bump_versions, book_scope, borrower_scope
+from .models import BookInstance, LoanConflict, LoanError, LoanEvent
+from .stats import adjust_stats
+
+# Срок выдачи по умолчанию
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+# Статусы, из которых экземпляр можно выдать
+CHECKOUT_STATUSES = ('a', 'r')
+
+# Результаты пакетного продления для каждого экземпляра
+RENEWED = 'renewed'
+NOT_ON_LOAN = 'not_on_loan'
+NOT_FOUND = 'not_found'
+
+
+def _update(copy, statuses, **changes):
+    """
+    Изменяет строку экземпляра одним условным UPDATE: только если ее версия совпадает с загруженной
+    и статус входит в statuses. Поля экземпляра обновляются лишь при успехе, в той же транзакции
+    в журнал выдач записывается событие
+    """
+    if copy.status not in statuses:
+        raise LoanError("Экземпляр %s в статусе %r" % (copy.pk, copy.get_status_display()))
+    with transaction.atomic():
+        # Условие по версии гарантирует, что книга и статус строки те же, что у загруженного экземпляра
+        updated = BookInstance.objects.filter(pk=copy.pk, version=copy.version, status__in=statuses).update_loaded(
+            (copy.book_id, copy.status), version=F('version') + 1, **changes)
+        if not updated:
+            raise LoanConflict("Экземпляр %s изменен другим пользователем" % copy.pk)
+        borrower_id = getattr(changes['borrower'], 'pk', None) if 'borrower' in changes else copy.borrower_id
+        LoanEvent.build(copy.pk, copy.book_id, borrower_id or copy.borrower_id, copy.status,
+                        changes.get('status', copy.status), changes.get('due_back', copy.due_back)).save()
+
+    # Экземпляр меняется только после успешного блока, иначе при откате он остался бы с новыми полями и версией
+    old_status, old_borrower_id = copy.status, copy.borrower_id
+    for name, value in changes.items():
+        setattr(copy, name, value)
+    copy.version += 1
+    was_available = old_status == 'a'
+    # UPDATE не отправляет сигналы моделей, поэтому счетчики домашней страницы и кэш страниц обновляются здесь
+    copy._loaded_status = copy.status
+    copy._loaded_due_back = copy.due_back
+    adjust_stats(num_instances_available=int(copy.status == 'a') - int(was_available))
+    bump_versions(book_scope(copy.book_id),
+                  *[borrower_scope(pk) for pk in {old_borrower_id, copy.borrower_id} if pk])
+    return copy
+
+
+def checkout(copy, borrower, due_back=None):
+    """
+    Выдает экземпляр читателю
+    :return: Обновленный экземпляр
+    """
+    return _update(copy, CHECKOUT_STATUSES, status='o', borrower=borrower,
+                   due_back=due_back or datetime.date.today() + LOAN_PERIOD)
+
+
+def return_copy(copy):
+    """
+    Принимает выданный экземпляр обратно
+    :return: Обновленный экземпляр
+    """
+    return _update(copy, ('o',), status='a', borrower=None, due_back=None)
+
+
+def renew(copy, due_back):
+    """
+    Продлевает срок возврата выданного экземпляра
+    :return: Обновленный экземпляр
+    """
+    return _update(copy, ('o',), due_back=due_back)
+
+
+def renew_many(copy_ids, due_back):
+    """
+    Продлевает сразу много выданных экземпляров. Строки каждой порции id (в пределах ограничения базы данных
+    на число параметров) блокируются одним SELECT ... FOR UPDATE, по ним определяется результат каждого
+    экземпляра, и выданные экземпляры меняются одним UPDATE. События продления записываются в журнал выдач
+    одним INSERT ... SELECT на порцию. Все изменения выполняются в одной транзакции.
+    Дата должна быть заранее проверена (validate_renewal_date)
+    :return: Словарь id экземпляра -> RENEWED, NOT_ON_LOAN или NOT_FOUND
+    """
+    copy_ids = list(dict.fromkeys(copy_ids))
+    batch_size = connection.ops.bulk_batch_size(['pk'], copy_ids) or len(copy_ids)
+    results = dict.fromkeys(copy_ids, NOT_FOUND)
+    book_ids = set()
+    borrower_ids = set()
+    with transaction.atomic():
+        for start in range(0, len(copy_ids), batch_size):
+            batch = copy_ids[start:start + batch_size]
+            # Заблокированные строки не изменятся до конца транзакции, поэтому UPDATE продлевает ровно
+            # те экземпляры, которые здесь отмечены продленными (при любом уровне изоляции)
+            on_loan = []
+            for pk, status, book_id, borrower_id in BookInstance.objects.select_for_update().filter(
+                    pk__in=batch).order_by().values_list('pk', 'status', 'book_id', 'borrower_id'):
+                results[pk] = RENEWED if status == 'o' else NOT_ON_LOAN
+                if status == 'o':
+                    on_loan.append(pk)
+                    book_ids.add(book_id)
+                    borrower_ids.add(borrower_id)
+            if on_loan:
+                renewed = BookInstance.objects.filter(pk__in=on_loan)
+                # Строки уже заблокированы и события записываются ниже, поэтому update() их не перечитывает
+                renewed.update_loaded(due_back=due_back, version=F('version') + 1)
+                LoanEvent.objects.record_from(renewed, LoanEvent.RENEW, 'o')
+        bump_versions(*[book_scope(pk) for pk in book_ids], *[borrower_scope(pk) for pk in borrower_ids if pk])
+    return results
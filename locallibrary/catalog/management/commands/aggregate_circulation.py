@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from catalog.circulation import CIRCULATION_BATCH_SIZE, aggregate_circulation
+
+
+class Command(BaseCommand):
+    help = ("Дополняет дневную статистику выдач по книгам и жанрам событиями журнала выдач, "
+            "записанными после последнего запуска (запускать периодически)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CIRCULATION_BATCH_SIZE,
+                            help="Сколько событий учитывать за одну транзакцию")
+
+    def handle(self, *args, **options):
+        result = aggregate_circulation(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            "Учтено событий: %(events)d, строк статистики книг: %(books)d, жанров: %(genres)d" % result))
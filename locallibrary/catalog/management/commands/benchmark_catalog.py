@@ -0,0 +1,63 @@
+import json
+import platform
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from catalog.benchmark import ENDPOINTS, compare_results, load_results, run_benchmark, seeded_database
+
+DATASET_OPTIONS = ('authors', 'books', 'genres', 'copies', 'borrowers', 'seed')
+
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--genres', type=int, default=50)
+    parser.add_argument('--copies', type=int, default=50000)
+    parser.add_argument('--borrowers', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keepdb', action='store_true', help="Не удалять тестовую базу после измерений")
+
+
+class Command(BaseCommand):
+    help = ("Создает отдельную тестовую базу, заполняет ее детерминированными данными и измеряет задержку, "
+            "число SQL-запросов и память страниц каталога. Результаты сохраняются в JSON и могут сравниваться "
+            "с предыдущим запуском")
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--requests', type=int, default=50, help="Количество запросов к каждой странице")
+        parser.add_argument('--endpoint', action='append', choices=[name for name, login in ENDPOINTS],
+                            help="Измерять только указанные страницы")
+        parser.add_argument('--warm', action='store_true',
+                            help="Не очищать кэш между запросами (по умолчанию измеряется путь без кэша)")
+        parser.add_argument('--output', help="Файл для сохранения результатов в JSON")
+        parser.add_argument('--compare', help="Файл с результатами предыдущего запуска")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Допустимый относительный рост задержки при сравнении")
+
+    def handle(self, *args, **options):
+        params = {key: options[key] for key in DATASET_OPTIONS + ('requests', 'warm')}
+        with seeded_database(keepdb=options['keepdb'], report=self.stderr.write,
+                             **{key: options[key] for key in DATASET_OPTIONS}):
+            results = run_benchmark(requests=options['requests'], warm=options['warm'],
+                                    endpoints=options['endpoint'])
+
+        for name, metrics in results.items():
+            self.stdout.write("%-14s p50 %8.2f ms  p90 %8.2f ms  p99 %8.2f ms  queries %3d  memory %8.1f KB" % (
+                name, metrics['p50_ms'], metrics['p90_ms'], metrics['p99_ms'], metrics['queries'],
+                metrics['peak_memory_kb']))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'params': params,
+                    'environment': {'python': platform.python_version(), 'django': django.get_version(),
+                                    'database': connection.vendor},
+                    'results': results,
+                }, f, indent=2, sort_keys=True)
+
+        if options['compare']:
+            regressions = compare_results(results, load_results(options['compare']), options['tolerance'])
+            if regressions:
+                raise CommandError("Обнаружены регрессии:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand
+from catalog.benchmark import SERVER_ENDPOINTS, SERVER_URLCONFS, run_server_benchmark, seeded_database
+from .benchmark_catalog import DATASET_OPTIONS, add_dataset_arguments
+
+
+class Command(BaseCommand):
+    help = ("Создает отдельную тестовую базу с детерминированными данными и сравнивает пропускную способность "
+            "страниц каталога под WSGI (синхронные представления) и под ASGI (асинхронные представления) "
+            "при большом числе одновременных запросов")
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--requests', type=int, default=500, help="Количество запросов к каждой странице")
+        parser.add_argument('--concurrency', type=int, default=50, help="Количество одновременных запросов")
+        parser.add_argument('--endpoint', action='append', choices=SERVER_ENDPOINTS,
+                            help="Измерять только указанные страницы")
+        parser.add_argument('--server', action='append', choices=list(SERVER_URLCONFS),
+                            help="Измерять только указанный сервер")
+        parser.add_argument('--warm', action='store_true',
+                            help="Не отключать кэш (по умолчанию измеряется работа представлений без кэша)")
+        parser.add_argument('--output', help="Файл для сохранения результатов в JSON")
+
+    def handle(self, *args, **options):
+        with seeded_database(keepdb=options['keepdb'], report=self.stderr.write,
+                             **{key: options[key] for key in DATASET_OPTIONS}):
+            results = run_server_benchmark(requests=options['requests'], concurrency=options['concurrency'],
+                                           warm=options['warm'], endpoints=options['endpoint'],
+                                           servers=options['server'] or tuple(SERVER_URLCONFS))
+
+        for server, endpoints in results.items():
+            for name, metrics in endpoints.items():
+                self.stdout.write("%-5s %-12s %8.1f req/s  p50 %8.2f ms  p90 %8.2f ms  p99 %8.2f ms  errors %d" % (
+                    server, name, metrics['throughput_rps'], metrics['p50_ms'] or 0, metrics['p90_ms'] or 0,
+                    metrics['p99_ms'] or 0, metrics['errors']))
+
+        if options['output']:
+            params = {key: options[key] for key in DATASET_OPTIONS + ('requests', 'concurrency', 'warm')}
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'params': params, 'results': results}, f, indent=2, sort_keys=True)
@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand
+from catalog.benchmark import TEMPLATE_ENDPOINTS, TEMPLATE_MODES, run_template_benchmark, seeded_database
+from .benchmark_catalog import DATASET_OPTIONS, add_dataset_arguments
+
+
+class Command(BaseCommand):
+    help = ("Создает отдельную тестовую базу с детерминированными данными и сравнивает время отрисовки "
+            "шаблонов страниц каталога без кэша шаблонов и с кэширующим загрузчиком и кэшем фрагментов")
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--requests', type=int, default=200, help="Количество запросов к каждой странице")
+        parser.add_argument('--endpoint', action='append', choices=TEMPLATE_ENDPOINTS,
+                            help="Измерять только указанные страницы")
+        parser.add_argument('--mode', action='append', choices=TEMPLATE_MODES[1:],
+                            help="Сравнивать с режимом без кэша только указанные режимы")
+        parser.add_argument('--output', help="Файл для сохранения результатов в JSON")
+
+    def handle(self, *args, **options):
+        with seeded_database(keepdb=options['keepdb'], report=self.stderr.write,
+                             **{key: options[key] for key in DATASET_OPTIONS}):
+            modes = (TEMPLATE_MODES[0],) + tuple(options['mode'] or TEMPLATE_MODES[1:])
+            results = run_template_benchmark(requests=options['requests'], endpoints=options['endpoint'],
+                                             modes=modes)
+
+        baseline = results[modes[0]]
+        for mode in modes[1:]:
+            for name, metrics in results[mode].items():
+                before = baseline[name]
+                change = (metrics['render_p50_ms'] / before['render_p50_ms'] - 1) * 100 if before['render_p50_ms'] else 0
+                self.stdout.write("%-8s %-14s render p50 %7.2f ms -> %7.2f ms (%+.0f%%)  "
+                                  "total p50 %7.2f ms -> %7.2f ms" % (
+                    mode, name, before['render_p50_ms'], metrics['render_p50_ms'], change,
+                    before['total_p50_ms'], metrics['total_p50_ms']))
+
+        if options['output']:
+            params = {key: options[key] for key in DATASET_OPTIONS + ('requests',)}
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'params': params, 'results': results}, f, indent=2, sort_keys=True)
@@ -0,0 +1,16 @@
+import datetime
+from django.core.management.base import BaseCommand
+from catalog.overdue import compute_overdue
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводки просроченных экземпляров по читателям и по книгам (запускать периодически)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.date.fromisoformat, default=None,
+                            help="Дата, на которую считается просрочка (по умолчанию сегодня)")
+
+    def handle(self, *args, **options):
+        result = compute_overdue(options['date'])
+        self.stdout.write(self.style.SUCCESS(
+            "Просрочено экземпляров: %(copies)d, читателей: %(borrowers)d, книг: %(books)d" % result))
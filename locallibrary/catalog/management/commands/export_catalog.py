@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from catalog.export import EXPORT_FIELDS, EXPORT_FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = "Потоково выгружает книги или экземпляры книг в CSV или JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORT_FIELDS))
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', default=None, help="Путь к файлу, по умолчанию стандартный вывод")
+
+    def handle(self, *args, **options):
+        chunks = iter_export(options['kind'], options['format'])
+        if options['output'] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            f.writelines(chunks)
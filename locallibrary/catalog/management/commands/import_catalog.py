@@ -0,0 +1,33 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from catalog.importer import CatalogImporter, CatalogImportError, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = ("Потоково импортирует авторов, жанры, языки, книги и экземпляры из файла CSV или JSONL. "
+            "Тип каждой записи задается полем type (author, genre, language, book, copy)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к файлу или - для чтения из стандартного ввода")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help="Формат файла, по умолчанию определяется по расширению")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Количество записей, сохраняемых в одной транзакции")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        reader = read_csv if file_format == 'csv' else read_jsonl
+        importer = CatalogImporter(batch_size=options['batch_size'], report=self.stderr.write)
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            counts = importer.run(reader(stream))
+        except CatalogImportError as exc:
+            raise CommandError(str(exc)) from exc
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(
+            "Импортировано: авторов %(author)d, жанров %(genre)d, языков %(language)d, "
+            "книг %(book)d, экземпляров %(copy)d" % {key: counts[key] for key in
+                                                     ('author', 'genre', 'language', 'book', 'copy')}))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from catalog.popularity import POPULARITY_BATCH_SIZE, rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает оценки популярности книг, авторов и жанров по всем выдачам журнала выдач"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=POPULARITY_BATCH_SIZE,
+                            help="Сколько выдач учитывать за один проход")
+
+    def handle(self, *args, **options):
+        total = rebuild_popularity(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Учтено выдач: %d" % total))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс книг каталога"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS("Поисковый индекс перестроен"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = ("Проверяет и пересчитывает счетчики экземпляров книг "
+            "(всего, доступно, выдано, на обслуживании, забронировано)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Только проверить счетчики и завершиться с ошибкой, "
+                                 "если они расходятся с экземплярами")
+
+    def handle(self, *args, **options):
+        drift = Book.objects.availability_drift()
+        for book_id, (stored, actual) in sorted(drift.items()):
+            self.stdout.write("Книга %s: %s" % (book_id, ', '.join(
+                '%s %d -> %d' % (name, stored[name], actual[name]) for name in stored if stored[name] != actual[name])))
+        if options['check']:
+            if drift:
+                raise CommandError("Счетчики расходятся у %d книг" % len(drift))
+            self.stdout.write(self.style.SUCCESS("Счетчики всех книг верны"))
+            return
+        updated = Book.objects.recompute_availability()
+        self.stdout.write(self.style.SUCCESS("Пересчитаны счетчики %d книг, исправлено %d" % (updated, len(drift))))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from catalog.datagen import generate_catalog
+
+
+class Command(BaseCommand):
+    help = "Заполняет базу детерминированным набором авторов, книг, жанров, экземпляров и читателей"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=100)
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--genres', type=int, default=20)
+        parser.add_argument('--copies', type=int, default=3000)
+        parser.add_argument('--borrowers', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        counts = generate_catalog(authors=options['authors'], books=options['books'], genres=options['genres'],
+                                  copies=options['copies'], borrowers=options['borrowers'], seed=options['seed'],
+                                  report=self.stderr.write)
+        self.stdout.write(self.style.SUCCESS(
+            "Создано: авторов %(author)d, жанров %(genre)d, книг %(book)d, экземпляров %(copy)d" % counts))
@@ -0,0 +1,176 @@
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+
+class QueryRecorder:
+    """
+    Обертка выполнения SQL (connection.execute_wrapper), считающая запросы, их суммарное время
+    и повторы одного и того же запроса с разными параметрами - признак N+1
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+class ViewMetrics:
+    """
+    Накопленная в процессе статистика по именам URL
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, stats):
+        with self._lock:
+            view = self._views.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'duplicate_queries': 0,
+                'sql_ms': 0.0, 'render_ms': 0.0, 'total_ms': 0.0, 'max_total_ms': 0.0,
+            })
+            view['requests'] += 1
+            view['queries'] += stats['queries']
+            view['max_queries'] = max(view['max_queries'], stats['queries'])
+            view['duplicate_queries'] += stats['duplicate_queries']
+            view['sql_ms'] += stats['sql_ms']
+            view['render_ms'] += stats['render_ms']
+            view['total_ms'] += stats['total_ms']
+            view['max_total_ms'] = max(view['max_total_ms'], stats['total_ms'])
+
+    def snapshot(self):
+        """
+        :return: Копия статистики со средними значениями на запрос
+        """
+        with self._lock:
+            views = {name: dict(view) for name, view in self._views.items()}
+        for view in views.values():
+            requests = view['requests']
+            for key in ('queries', 'sql_ms', 'render_ms', 'total_ms'):
+                view['avg_%s' % key] = round(view[key] / requests, 3)
+            for key in ('sql_ms', 'render_ms', 'total_ms', 'max_total_ms'):
+                view[key] = round(view[key], 3)
+        return views
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+
+view_metrics = ViewMetrics()
+
+
+def _add_wrapper(recorder):
+    connection.execute_wrappers.append(recorder)
+
+
+def _remove_wrapper(recorder):
+    connection.execute_wrappers.remove(recorder)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Для каждого запроса считает число SQL-запросов, их время, повторы и время отрисовки шаблона.
+    Результат сохраняется в response.query_stats, добавляется в статистику по имени URL (см. view_metrics)
+    и, если включена настройка CATALOG_SERVER_TIMING, отдается в заголовке Server-Timing.
+    Работает и под ASGI, не переводя асинхронные представления в синхронный режим
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        self._start(request)
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        return self._finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        self._start(request)
+        started = time.perf_counter()
+        # Асинхронный ORM выполняет запросы в потоке sync_to_async, у которого свое подключение,
+        # поэтому обертка устанавливается в этом же потоке
+        await sync_to_async(_add_wrapper)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_wrapper)(recorder)
+        return self._finish(request, response, recorder, started)
+
+    def _start(self, request):
+        request._render_ms = 0.0
+
+    def _finish(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None and match.view_name else None
+        stats = {
+            'view': view_name,
+            'queries': recorder.count,
+            'duplicate_queries': recorder.duplicates,
+            'sql_ms': recorder.duration * 1000,
+            'render_ms': request._render_ms,
+            'total_ms': total_ms,
+        }
+        response.query_stats = stats
+        if view_name is not None:
+            view_metrics.record(view_name, stats)
+        if getattr(settings, 'CATALOG_SERVER_TIMING', False):
+            response['Server-Timing'] = ', '.join([
+                'db;dur=%.2f;desc="%d queries, %d duplicate"' % (stats['sql_ms'], stats['queries'],
+                                                                 stats['duplicate_queries']),
+                'render;dur=%.2f' % stats['render_ms'],
+                'total;dur=%.2f' % total_ms,
+            ])
+        return response
+
+    def process_template_response(self, request, response):
+        if response.is_rendered:
+            # Представление уже отрисовало ответ (например, CachedViewMixin) и учло время через render_timed
+            return response
+        started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: add_render_time(request, started))
+        return response
+
+
+def add_render_time(request, started):
+    """
+    Добавляет к времени отрисовки запроса время, прошедшее с started (если запрос инструментирован)
+    """
+    if hasattr(request, '_render_ms'):
+        request._render_ms += (time.perf_counter() - started) * 1000
+
+
+def render_timed(request, response):
+    """
+    Отрисовывает TemplateResponse внутри представления и учитывает время отрисовки в статистике запроса
+    (см. QueryInstrumentationMiddleware)
+    """
+    started = time.perf_counter()
+    try:
+        return response.render()
+    finally:
+        add_render_time(request, started)
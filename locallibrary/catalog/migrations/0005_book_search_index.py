@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Создает полнотекстовый индекс FTS5 по книгам и заполняет его существующими данными
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_book_fts USING fts5("
+        "title, summary, isbn, authors, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO catalog_book_fts (rowid, title, summary, isbn, authors) "
+        "SELECT b.id, b.title, b.summary, b.isbn, COALESCE(a.first_name || ' ' || a.last_name, '') "
+        "FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS catalog_book_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_book_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueByBook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_overdue', models.PositiveIntegerField()),
+                ('oldest_due_back', models.DateField()),
+                ('computed_at', models.DateTimeField()),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_summary', to='catalog.book')),
+            ],
+            options={
+                'ordering': ['-num_overdue', 'oldest_due_back'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OverdueByBorrower',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_overdue', models.PositiveIntegerField()),
+                ('oldest_due_back', models.DateField()),
+                ('computed_at', models.DateTimeField()),
+                ('borrower', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-num_overdue', 'oldest_due_back'],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:50
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_availability(apps, schema_editor):
+    """
+    Заполняет счетчики экземпляров существующих книг
+    """
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+
+    def count(**filters):
+        return Coalesce(Subquery(copies.filter(**filters).annotate(count=Count('pk')).values('count')), 0)
+
+    Book.objects.update(num_copies=count(), num_available=count(status='a'), num_on_loan=count(status='o'),
+                        num_maintenance=count(status='m'), num_reserved=count(status='r'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_bookinstance_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='num_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_copies',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_maintenance',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-num_available', 'title', 'id'], name='book_available_idx'),
+        ),
+        migrations.RunPython(fill_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_book_availability'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyBookCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('status_changes', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_circulation', to='catalog.book')),
+            ],
+            options={
+                'ordering': ['day'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyGenreCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('status_changes', models.PositiveIntegerField(default=0)),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_circulation', to='catalog.genre')),
+            ],
+            options={
+                'ordering': ['day'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('checkout', 'Checkout'), ('return', 'Return'), ('renew', 'Renew'), ('status', 'Status change')], max_length=10)),
+                ('old_status', models.CharField(blank=True, max_length=1)),
+                ('new_status', models.CharField(max_length=1)),
+                ('due_back', models.DateField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('day', models.DateField()),
+                ('book', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='loan_events', to='catalog.book')),
+                ('borrower', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='loan_events', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='loan_events', to='catalog.bookinstance')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailybookcirculation',
+            constraint=models.UniqueConstraint(fields=('day', 'book'), name='daily_book_circulation_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailygenrecirculation',
+            constraint=models.UniqueConstraint(fields=('day', 'genre'), name='daily_genre_circulation_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='loanevent',
+            index=models.Index(fields=['day', 'book'], name='loanevent_day_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanevent',
+            index=models.Index(fields=['copy', 'created_at'], name='loanevent_copy_idx'),
+        ),
+    ]
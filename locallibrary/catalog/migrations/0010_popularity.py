@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_loan_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorPopularity',
+            fields=[
+                ('score', models.FloatField(default=0)),
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='catalog.author')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='author_popularity_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookPopularity',
+            fields=[
+                ('score', models.FloatField(default=0)),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='catalog.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='book_popularity_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='GenrePopularity',
+            fields=[
+                ('score', models.FloatField(default=0)),
+                ('genre', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='catalog.genre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='genre_popularity_idx')],
+            },
+        ),
+    ]
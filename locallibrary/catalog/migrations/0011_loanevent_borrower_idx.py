@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_popularity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loanevent',
+            index=models.Index(fields=['borrower', 'created_at'], name='loanevent_borrower_idx'),
+        ),
+    ]
@@ -1,8 +1,57 @@
-from django.db import models
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection, connections, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 import uuid
+from .caching import bump_versions, book_scope, borrower_scope
 from django.contrib.auth.models import User
 from datetime import date
+from django.utils import timezone
+
+# Денормализованные счетчики экземпляров книги: статус экземпляра -> поле Book
+AVAILABILITY_FIELDS = {
+    'a': 'num_available',
+    'o': 'num_on_loan',
+    'm': 'num_maintenance',
+    'r': 'num_reserved',
+}
+BOOK_COUNTER_FIELDS = ('num_copies',) + tuple(AVAILABILITY_FIELDS.values())
+
+# Период полураспада популярности (в днях). После изменения оценки нужно пересчитать командой rebuild_popularity
+POPULARITY_HALF_LIFE_DAYS = 30
+
+
+def get_popularity_epoch():
+    """
+    :return: Начало отсчета весов выдач из настройки CATALOG_POPULARITY_EPOCH (дата ГГГГ-ММ-ДД)
+    """
+    return date.fromisoformat(getattr(settings, 'CATALOG_POPULARITY_EPOCH', '2020-01-01'))
+
+
+def popularity_weight(day):
+    """
+    Вес выдачи в день day. Вместо того чтобы ежедневно уменьшать все оценки, веса новых выдач удваиваются
+    с каждым периодом полураспада: порядок оценок тот же, что у затухающих, а затухшая оценка
+    на любой день - это сохраненная, деленная на вес этого дня.
+    Веса растут в 2^12 раз за год, и примерно через 84 года после начала отсчета не поместятся во float.
+    Поэтому начало отсчета время от времени переносится вперед с пересчетом оценок командой
+    rebuild_popularity - порядок и затухшие оценки при этом не меняются
+    """
+    return 2.0 ** ((day - get_popularity_epoch()).days / POPULARITY_HALF_LIFE_DAYS)
+
+
+class LoanError(Exception):
+    """
+    Операцию выдачи нельзя выполнить
+    """
+
+
+class LoanConflict(LoanError):
+    """
+    Экземпляр изменился с момента загрузки (другой библиотекарь уже выдал, вернул или продлил его)
+    """
 
 
 class Genre(models.Model):
@@ -44,6 +93,88 @@ class Language(models.Model):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    """
+    Набор книг с обслуживанием денормализованных счетчиков экземпляров
+    """
+    def adjust_availability(self, deltas):
+        """
+        Изменяет счетчики книг условными UPDATE вида num_available = num_available + 1.
+        Книги с одинаковым набором изменений обновляются одним запросом
+        :param deltas: Словарь (id книги, статус экземпляра) -> изменение числа экземпляров
+        """
+        by_book = defaultdict(Counter)
+        for (book_id, status), delta in deltas.items():
+            if book_id is None or not delta:
+                continue
+            by_book[book_id]['num_copies'] += delta
+            if status in AVAILABILITY_FIELDS:
+                by_book[book_id][AVAILABILITY_FIELDS[status]] += delta
+        groups = defaultdict(list)
+        for book_id, changes in by_book.items():
+            key = tuple(sorted((name, delta) for name, delta in changes.items() if delta))
+            if key:
+                groups[key].append(book_id)
+        if not groups:
+            return
+        for key, book_ids in groups.items():
+            batch_size = connection.ops.bulk_batch_size(['pk'], book_ids) or len(book_ids)
+            for start in range(0, len(book_ids), batch_size):
+                self.model.objects.filter(pk__in=book_ids[start:start + batch_size]).update(
+                    **{name: F(name) + delta for name, delta in key})
+        # Доступность показывается в списке книг и на странице каждой книги
+        bump_versions('books', *[book_scope(pk) for pk in by_book])
+
+    def recompute_availability(self):
+        """
+        Пересчитывает счетчики книг набора по таблице экземпляров одним UPDATE с подзапросами
+        :return: Количество обновленных книг
+        """
+        copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+
+        def count(**filters):
+            return Coalesce(Subquery(copies.filter(**filters).annotate(count=Count('pk')).values('count')), 0)
+
+        return self.update(num_copies=count(), **{name: count(status=status)
+                                                  for status, name in AVAILABILITY_FIELDS.items()})
+
+    def availability_drift(self):
+        """
+        Сравнивает сохраненные счетчики с фактическим числом экземпляров (один GROUP BY по экземплярам)
+        :return: Словарь id книги -> (сохраненные счетчики, фактические счетчики) для расходящихся книг
+        """
+        actual = defaultdict(lambda: dict.fromkeys(BOOK_COUNTER_FIELDS, 0))
+        rows = (BookInstance.objects.filter(book__in=self.values('pk')).order_by()
+                .values_list('book_id', 'status').annotate(count=Count('pk')))
+        for book_id, status, count in rows.iterator():
+            actual[book_id]['num_copies'] += count
+            if status in AVAILABILITY_FIELDS:
+                actual[book_id][AVAILABILITY_FIELDS[status]] += count
+        drift = {}
+        for book_id, *stored in self.order_by().values_list('pk', *BOOK_COUNTER_FIELDS).iterator():
+            stored = dict(zip(BOOK_COUNTER_FIELDS, stored))
+            if stored != actual[book_id]:
+                drift[book_id] = (stored, dict(actual[book_id]))
+        return drift
+
+    def add_popularity(self, weights):
+        """
+        Прибавляет веса выдач к оценкам популярности книг, их авторов и жанров.
+        Книги, авторы и жанры загружаются одним запросом, оценки каждой таблицы изменяются одним запросом
+        :param weights: Словарь id книги -> прибавка (сумма popularity_weight выдач)
+        """
+        books, authors, genres = Counter(), Counter(), Counter()
+        for book_id, author_id, genre_id in self.model.objects.filter(pk__in=list(weights)).order_by().values_list(
+                'pk', 'author_id', 'genre'):
+            if book_id not in books:
+                books[book_id] = weights[book_id]
+                authors[author_id] += weights[book_id]
+            genres[genre_id] += weights[book_id]
+        BookPopularity.objects.add(books)
+        AuthorPopularity.objects.add(authors)
+        GenrePopularity.objects.add(genres)
+
+
 class Book(models.Model):
     """
     Модель представляющая книгу (но не конкретный экземпляр книги)
@@ -57,6 +188,25 @@ class Book(models.Model):
     genre = models.ManyToManyField(Genre, help_text="Выберите жанр книги")
     language = models.ForeignKey('Language', null=True,
                                  help_text="Введите язык желаемой книги", on_delete=models.SET_NULL)
+    # Счетчики экземпляров по статусам. Поддерживаются сигналами и BookInstanceQuerySet,
+    # проверяются и пересчитываются командой recompute_availability
+    num_copies = models.PositiveIntegerField(default=0, editable=False)
+    num_available = models.PositiveIntegerField(default=0, editable=False)
+    num_on_loan = models.PositiveIntegerField(default=0, editable=False)
+    num_maintenance = models.PositiveIntegerField(default=0, editable=False)
+    num_reserved = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Поиск книги по ISBN
+            models.Index(fields=['isbn'], name='book_isbn_idx'),
+            # Сортировка и keyset-пагинация списка книг
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            # Список книг, отсортированный по числу доступных экземпляров
+            models.Index(fields=['-num_available', 'title', 'id'], name='book_available_idx'),
+        ]
 
     def __str__(self):
         """
@@ -65,6 +215,15 @@ class Book(models.Model):
         """
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Счетчики экземпляров меняются только приращениями (BookQuerySet.adjust_availability),
+        # поэтому при сохранении существующей книги загруженные значения не записываются обратно
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in BOOK_COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
     def display_genre(self):
         """
         Создает строку для Жанров. Это обязательно для отображения жанров в панеле Администраторов в Django
@@ -82,6 +241,135 @@ class Book(models.Model):
         return reverse("book-detail", args=[str(self.id)])
 
 
+# Поля экземпляра, значения которых при загрузке запоминаются (см. catalog.signals.remember_loaded_state),
+# и атрибуты с запомненными значениями
+LOADED_STATE = {
+    'status': '_loaded_status',
+    'book_id': '_loaded_book_id',
+    'borrower_id': '_loaded_borrower_id',
+    'due_back': '_loaded_due_back',
+}
+
+# Изменения экземпляра, от которых зависят счетчики книг
+AVAILABILITY_CHANGES = {'status', 'book', 'book_id'}
+
+# Состояние выдачи экземпляра, которое отслеживает журнал выдач, и изменяющие его поля update()
+LOAN_STATE_FIELDS = ('pk', 'book_id', 'status', 'borrower_id', 'due_back')
+LOAN_STATE_CHANGES = AVAILABILITY_CHANGES | {'borrower', 'borrower_id', 'due_back'}
+
+
+def _changed_state(row, changes):
+    """
+    :param row: Строка экземпляра со значениями LOAN_STATE_FIELDS
+    :param changes: Новые значения полей экземпляра
+    :return: Строка после изменения
+    """
+    pk, book_id, status, borrower_id, due_back = row
+    for name, value in changes.items():
+        value = getattr(value, 'pk', value)
+        if name in ('book', 'book_id'):
+            book_id = value
+        elif name in ('borrower', 'borrower_id'):
+            borrower_id = value
+        elif name == 'status':
+            status = value
+        elif name == 'due_back':
+            due_back = value
+    return pk, book_id, status, borrower_id, due_back
+
+
+def _moved(loaded, changes):
+    """
+    :param loaded: Число строк по (id книги, статус) до изменения
+    :param changes: Новые значения полей экземпляра
+    :return: Изменения счетчиков по (id книги, статус)
+    """
+    deltas = Counter()
+    book = changes.get('book_id', changes.get('book'))
+    book_id = getattr(book, 'pk', book)
+    for (old_book_id, old_status), count in loaded.items():
+        deltas[(old_book_id, old_status)] -= count
+        new_book_id = book_id if {'book', 'book_id'} & set(changes) else old_book_id
+        deltas[(new_book_id, changes.get('status', old_status))] += count
+    return deltas
+
+
+def _adjust_stats(**deltas):
+    # catalog.stats импортирует модели, поэтому импортируется при вызове
+    from .stats import adjust_stats
+    adjust_stats(**deltas)
+
+
+class BookInstanceQuerySet(models.QuerySet):
+    """
+    Набор экземпляров книг с отборами по состоянию выдачи, выраженными условиями базы данных
+    """
+    def on_loan(self):
+        return self.filter(status='o')
+
+    def available(self):
+        return self.filter(status='a')
+
+    def overdue(self, today=None):
+        """
+        :return: Выданные экземпляры, срок возврата которых прошел (то же, что is_overdue, но в SQL)
+        """
+        return self.on_loan().filter(due_back__lt=today or date.today())
+
+    def update(self, **kwargs):
+        """
+        Массовое изменение. Если меняется состояние выдачи (статус, книга, читатель или срок), в той же
+        транзакции в журнал выдач записываются смены статуса и продления и сбрасываются сводки читателей,
+        а при смене статуса или книги изменяются и счетчики книг и домашней страницы
+        (в том числе для bulk_update, который изменяет строки через update())
+        """
+        if not LOAN_STATE_CHANGES & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            rows = list(self.select_for_update().order_by().values_list(*LOAN_STATE_FIELDS))
+            updated = super().update(**kwargs)
+            if any(hasattr(kwargs.get(name), 'resolve_expression') for name in LOAN_STATE_CHANGES):
+                # Новые значения вычисляет база (например, Case в bulk_update), поэтому строки перечитываются
+                changed = list(self.model.objects.filter(pk__in=[row[0] for row in rows]).order_by()
+                               .values_list(*LOAN_STATE_FIELDS))
+            else:
+                changed = [_changed_state(row, kwargs) for row in rows]
+            if AVAILABILITY_CHANGES & set(kwargs):
+                deltas = Counter((book_id, status) for pk, book_id, status, *rest in changed)
+                deltas.subtract((book_id, status) for pk, book_id, status, *rest in rows)
+                Book.objects.adjust_availability(deltas)
+                _adjust_stats(num_instances_available=sum(delta for (book_id, status), delta in deltas.items()
+                                                         if status == 'a'))
+            LoanEvent.objects.record_changes(rows, changed)
+            # Сводки выдач читателей (см. catalog.borrowers) прежних и новых читателей экземпляров
+            bump_versions(*[borrower_scope(pk) for pk in {row[3] for row in rows + changed} if pk])
+        return updated
+
+    def update_loaded(self, loaded=None, **kwargs):
+        """
+        Как update(), но книга и статус изменяемых строк заранее известны (например, условие по версии
+        гарантирует, что строка не менялась с загрузки), поэтому строки не перечитываются. События журнала
+        выдач и сброс сводок читателей остаются вызывающему коду (см. catalog.loans)
+        :param loaded: (id книги, статус) всех изменяемых строк, если меняются книга или статус
+        """
+        if not AVAILABILITY_CHANGES & set(kwargs):
+            return super().update(**kwargs)
+        # Вызывающий код (catalog.loans) сам открывает транзакцию, отдельная точка сохранения не нужна
+        with transaction.atomic(using=self.db, savepoint=False):
+            updated = super().update(**kwargs)
+            Book.objects.adjust_availability(_moved(Counter({loaded: updated}), kwargs))
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            Book.objects.adjust_availability(Counter((obj.book_id, obj.status) for obj in objs))
+            _adjust_stats(num_instances=len(objs), num_instances_available=sum(obj.status == 'a' for obj in objs))
+            LoanEvent.objects.bulk_create([LoanEvent.build(obj.pk, obj.book_id, obj.borrower_id, '', obj.status,
+                                                           obj.due_back) for obj in objs if obj.status == 'o'])
+        return objs
+
+
 class BookInstance(models.Model):
     """
     Модель представляющая конкретный экземпляр книги (ту которую можно взять из библеотеки)
@@ -100,9 +388,23 @@ class BookInstance(models.Model):
     status = models.CharField(max_length=1, choices=LOAN_STATUS, blank=True, default='m',
                               help_text="Забронировать книгу")
     borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Номер версии строки для оптимистической блокировки (см. catalog.loans)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BookInstanceQuerySet.as_manager()
 
     class Meta:
         ordering = ['due_back']
+        indexes = [
+            # Сортировка по умолчанию
+            models.Index(fields=['due_back'], name='bookinst_due_back_idx'),
+            # Отбор по статусу (в том числе только выданных экземпляров) с сортировкой по дате возврата
+            models.Index(fields=['status', 'due_back'], name='bookinst_status_due_idx'),
+            # Книги, взятые пользователем (LoanedBooksByUserListView)
+            models.Index(fields=['borrower', 'status', 'due_back'], name='bookinst_borrower_idx'),
+            # Только доступные экземпляры каждой книги
+            models.Index(fields=['book'], name='bookinst_available_idx', condition=models.Q(status='a')),
+        ]
         permissions = (
             ('can_mark_returned', 'Set book as returned.'),
         )
@@ -113,6 +415,32 @@ class BookInstance(models.Model):
         """
         return '%s (%s)' % (self.id, self.book.title)
 
+    def save(self, *args, **kwargs):
+        # Счетчики книги изменяются сигналом post_save, в одной транзакции с самим экземпляром
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Существующая строка изменяется только если ее версия совпадает с загруженной, и версия увеличивается.
+        # Иначе экземпляр, загруженный до чужого изменения строки (например, выдачи в параллельном запросе),
+        # затер бы это изменение, а счетчики книги изменились бы от загруженного статуса, а не от статуса строки
+        if self._state.adding:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        version = self._meta.get_field('version')
+        values = [value for value in values if value[0] is not version] + [(version, None, self.version + 1)]
+        if not super()._do_update(base_qs.filter(version=self.version), using, pk_val, values, update_fields,
+                                  forced_update):
+            raise LoanConflict("Экземпляр %s изменен или удален другим пользователем" % pk_val)
+        self.version += 1
+        return True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        # Перечитанные значения становятся загруженными, как у только что загруженного экземпляра
+        for attname, loaded in LOADED_STATE.items():
+            if fields is None or attname in fields or attname.removesuffix('_id') in fields:
+                setattr(self, loaded, self.__dict__.get(attname))
+
     @property
     def is_overdue(self):
         if self.due_back and date.today() > self.due_back:
@@ -120,6 +448,19 @@ class BookInstance(models.Model):
         return False
 
 
+class AuthorQuerySet(models.QuerySet):
+    def with_book_stats(self):
+        """
+        :return: Авторы с числом книг и суммами счетчиков экземпляров их книг, вычисленными в том же запросе
+        """
+        return self.annotate(
+            num_books=Count('book'),
+            num_copies=Coalesce(Sum('book__num_copies'), 0),
+            num_available=Coalesce(Sum('book__num_available'), 0),
+            num_on_loan=Coalesce(Sum('book__num_on_loan'), 0),
+        )
+
+
 class Author(models.Model):
     """
     Модель представляющая автора
@@ -129,6 +470,13 @@ class Author(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('died', null=True, blank=True)
 
+    objects = AuthorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='author_name_idx'),
+        ]
+
     def get_absolute_url(self):
         """
         :return: Возращает url-адресс для доступа к определенному экземпляру автора
@@ -140,3 +488,273 @@ class Author(models.Model):
         :return: Строка представляющая модель объекта
         """
         return '%s, %s' % (self.last_name, self.first_name)
+
+
+class LoanEventQuerySet(models.QuerySet):
+    def record_changes(self, rows, changed):
+        """
+        Записывает одним bulk_create события для экземпляров, статус которых изменился, и продления
+        (смена срока или читателя экземпляра, оставшегося выданным)
+        :param rows: Строки экземпляров до изменения (значения LOAN_STATE_FIELDS)
+        :param changed: Те же строки после изменения
+        """
+        before = {row[0]: row for row in rows}
+        events = []
+        for pk, book_id, status, borrower_id, due_back in changed:
+            old = before.get(pk)
+            if old is None:
+                continue
+            if old[2] != status or status == 'o' and (old[3], old[4]) != (borrower_id, due_back):
+                events.append(LoanEvent.build(pk, book_id, borrower_id or old[3], old[2], status, due_back))
+        return self.bulk_create(events)
+
+    def record_from(self, copies, kind, old_status):
+        """
+        Записывает события для всех экземпляров выборки одним INSERT ... SELECT, не загружая их строки
+        (новый статус, книга, читатель и срок берутся из экземпляров)
+        :param copies: QuerySet экземпляров
+        :return: Число записанных событий
+        """
+        created_at = timezone.now()
+        columns = {
+            'copy_id': models.F('pk'),
+            'book_id': models.F('book_id'),
+            'borrower_id': models.F('borrower_id'),
+            'kind': models.Value(kind),
+            'old_status': models.Value(old_status),
+            'new_status': models.F('status'),
+            'due_back': models.F('due_back'),
+            'created_at': models.Value(created_at, output_field=models.DateTimeField()),
+            'day': models.Value(timezone.localdate(created_at), output_field=models.DateField()),
+        }
+        # Столбцы выбираются аннотациями, чтобы их порядок в SELECT совпадал с порядком в INSERT
+        aliases = {'event_' + name: value for name, value in columns.items()}
+        select = copies.order_by().annotate(**aliases).values_list(*aliases)
+        sql, params = select.query.sql_with_params()
+        db = connections[self.db]
+        with db.cursor() as cursor:
+            cursor.execute('INSERT INTO %s (%s) %s' % (
+                db.ops.quote_name(self.model._meta.db_table), ', '.join(map(db.ops.quote_name, columns)), sql), params)
+            return cursor.rowcount
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self.record_popularity(objs)
+        return objs
+
+    def record_popularity(self, events):
+        """
+        Учитывает выдачи среди событий в оценках популярности (см. BookQuerySet.add_popularity)
+        """
+        weights = Counter()
+        for event in events:
+            if event.kind == LoanEvent.CHECKOUT and event.book_id is not None:
+                weights[event.book_id] += popularity_weight(event.day)
+        if weights:
+            Book.objects.add_popularity(weights)
+
+
+class LoanEvent(models.Model):
+    """
+    Событие журнала выдач: выдача, возврат, продление или другая смена статуса экземпляра.
+    Журнал только пополняется, поэтому ссылки на экземпляр, книгу и читателя не ограничены внешними ключами
+    и переживают их удаление. По дню события (day) журнал разбит на дневные интервалы, из которых команда
+    aggregate_circulation строит дневную статистику (см. catalog.circulation)
+    """
+    CHECKOUT = 'checkout'
+    RETURN = 'return'
+    RENEW = 'renew'
+    STATUS = 'status'
+    KINDS = (
+        (CHECKOUT, 'Checkout'),
+        (RETURN, 'Return'),
+        (RENEW, 'Renew'),
+        (STATUS, 'Status change'),
+    )
+    copy = models.ForeignKey(BookInstance, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name='loan_events')
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+                             related_name='loan_events')
+    borrower = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+                                 related_name='loan_events')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    old_status = models.CharField(max_length=1, blank=True)
+    new_status = models.CharField(max_length=1)
+    due_back = models.DateField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    day = models.DateField()
+
+    objects = LoanEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Дневные интервалы журнала и события книги за день
+            models.Index(fields=['day', 'book'], name='loanevent_day_book_idx'),
+            # История экземпляра
+            models.Index(fields=['copy', 'created_at'], name='loanevent_copy_idx'),
+            # История выдач читателя (см. catalog.borrowers.loan_history)
+            models.Index(fields=['borrower', 'created_at'], name='loanevent_borrower_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s (%s)' % (self.kind, self.copy_id, self.created_at)
+
+    @staticmethod
+    def kind_for(old_status, new_status):
+        """
+        :return: Вид события для смены статуса экземпляра (при неизменном статусе 'o' - продление)
+        """
+        if new_status == 'o':
+            return LoanEvent.RENEW if old_status == 'o' else LoanEvent.CHECKOUT
+        if old_status == 'o':
+            return LoanEvent.RETURN
+        return LoanEvent.STATUS
+
+    @classmethod
+    def build(cls, copy_id, book_id, borrower_id, old_status, new_status, due_back, created_at=None):
+        """
+        :return: Несохраненное событие (для bulk_create), вид и день которого определены по статусам и времени
+        """
+        created_at = created_at or timezone.now()
+        return cls(copy_id=copy_id, book_id=book_id, borrower_id=borrower_id, kind=cls.kind_for(old_status, new_status),
+                   old_status=old_status or '', new_status=new_status, due_back=due_back, created_at=created_at,
+                   day=timezone.localdate(created_at))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("События журнала выдач не изменяются")
+        super().save(*args, **kwargs)
+        LoanEvent.objects.record_popularity([self])
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("События журнала выдач не удаляются")
+
+
+class CirculationCounts(models.Model):
+    """
+    Дневные счетчики событий журнала выдач
+    """
+    day = models.DateField()
+    checkouts = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    renewals = models.PositiveIntegerField(default=0)
+    status_changes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['day']
+
+
+class DailyBookCirculation(CirculationCounts):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_circulation')
+
+    class Meta(CirculationCounts.Meta):
+        constraints = [models.UniqueConstraint(fields=['day', 'book'], name='daily_book_circulation_unique')]
+
+
+class DailyGenreCirculation(CirculationCounts):
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='daily_circulation')
+
+    class Meta(CirculationCounts.Meta):
+        constraints = [models.UniqueConstraint(fields=['day', 'genre'], name='daily_genre_circulation_unique')]
+
+
+class CirculationCursor(models.Model):
+    """
+    Последнее событие журнала выдач, учтенное в дневной статистике
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s: %s' % (self.name, self.last_event_id)
+
+
+class PopularityQuerySet(models.QuerySet):
+    def add(self, scores):
+        """
+        Прибавляет к оценкам одним INSERT ... ON CONFLICT DO UPDATE на порцию (SQLite, PostgreSQL),
+        недостающие строки при этом создаются
+        :param scores: Словарь id объекта -> прибавка
+        """
+        items = [(pk, score) for pk, score in scores.items() if pk is not None and score]
+        if not items:
+            return
+        db = connections[self.db]
+        qn = db.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        key = qn(self.model._meta.pk.column)
+        sql = ('INSERT INTO %s (%s, score) VALUES %%s '
+               'ON CONFLICT (%s) DO UPDATE SET score = %s.score + excluded.score' % (table, key, key, table))
+        batch_size = db.ops.bulk_batch_size(['pk', 'score'], items) or len(items)
+        with db.cursor() as cursor:
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                cursor.execute(sql % ', '.join(['(%s, %s)'] * len(batch)), [value for item in batch for value in item])
+
+
+class PopularityScore(models.Model):
+    """
+    Оценка популярности: сумма весов выдач (см. popularity_weight). Изменяется при каждой выдаче
+    и полностью пересчитывается командой rebuild_popularity
+    """
+    score = models.FloatField(default=0)
+
+    objects = PopularityQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+
+class BookPopularity(PopularityScore):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='book_popularity_idx')]
+
+
+class AuthorPopularity(PopularityScore):
+    author = models.OneToOneField(Author, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='author_popularity_idx')]
+
+
+class GenrePopularity(PopularityScore):
+    genre = models.OneToOneField(Genre, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='genre_popularity_idx')]
+
+
+class OverdueByBorrower(models.Model):
+    """
+    Предвычисленное количество просроченных экземпляров у читателя (см. команду compute_overdue)
+    """
+    borrower = models.OneToOneField(User, on_delete=models.CASCADE, related_name='overdue_summary')
+    num_overdue = models.PositiveIntegerField()
+    oldest_due_back = models.DateField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-num_overdue', 'oldest_due_back']
+
+    def __str__(self):
+        return '%s: %s' % (self.borrower, self.num_overdue)
+
+
+class OverdueByBook(models.Model):
+    """
+    Предвычисленное количество просроченных экземпляров книги (см. команду compute_overdue)
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='overdue_summary')
+    num_overdue = models.PositiveIntegerField()
+    oldest_due_back = models.DateField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-num_overdue', 'oldest_due_back']
+
+    def __str__(self):
+        return '%s: %s' % (self.book, self.num_overdue)
@@ -0,0 +1,47 @@
+import datetime
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from .models import BookInstance, OverdueByBook, OverdueByBorrower
+
+
+def _merge(summary, key, count, oldest):
+    if key is None:
+        return
+    current = summary.get(key)
+    if current is None:
+        summary[key] = [count, oldest]
+    else:
+        current[0] += count
+        current[1] = min(current[1], oldest)
+
+
+def compute_overdue(today=None):
+    """
+    Считает просроченные экземпляры по читателям и по книгам за один проход агрегации
+    (GROUP BY по паре читатель-книга) и атомарно заменяет сохраненные сводки
+    :return: Число просроченных экземпляров, читателей и книг с просрочкой
+    """
+    today = today or datetime.date.today()
+    rows = (BookInstance.objects.overdue(today).order_by()
+            .values_list('borrower_id', 'book_id')
+            .annotate(num_overdue=Count('id'), oldest_due_back=Min('due_back')))
+    by_borrower = {}
+    by_book = {}
+    total = 0
+    for borrower_id, book_id, count, oldest in rows.iterator():
+        total += count
+        _merge(by_borrower, borrower_id, count, oldest)
+        _merge(by_book, book_id, count, oldest)
+
+    computed_at = timezone.now()
+    with transaction.atomic():
+        OverdueByBorrower.objects.all().delete()
+        OverdueByBook.objects.all().delete()
+        OverdueByBorrower.objects.bulk_create([
+            OverdueByBorrower(borrower_id=pk, num_overdue=count, oldest_due_back=oldest, computed_at=computed_at)
+            for pk, (count, oldest) in by_borrower.items()], batch_size=1000)
+        OverdueByBook.objects.bulk_create([
+            OverdueByBook(book_id=pk, num_overdue=count, oldest_due_back=oldest, computed_at=computed_at)
+            for pk, (count, oldest) in by_book.items()], batch_size=1000)
+    return {'copies': total, 'borrowers': len(by_borrower), 'books': len(by_book)}
@@ -0,0 +1,193 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+def encode_cursor(values):
+    """
+    :return: Строка-курсор, кодирующая значения ключа сортировки
+    """
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    :return: Список значений ключа сортировки, закодированных в курсоре
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+def keyset_values(obj, names):
+    """
+    :return: Значения ключа сортировки объекта (поля с '-' сортируются по убыванию)
+    """
+    return [getattr(obj, name.lstrip('-')) for name in names]
+
+
+def _reverse_ordering(names):
+    return [name[1:] if name.startswith('-') else '-' + name for name in names]
+
+
+def keyset_filter(model, names, values, lookup):
+    """
+    :return: Условие "ключ строки больше (меньше) значений курсора" в лексикографическом порядке.
+        Для полей, сортируемых по убыванию ('-поле'), сравнение обратное
+    """
+    if not isinstance(values, list) or len(values) != len(names):
+        raise ValueError("Курсор не соответствует ключу сортировки")
+    reverse_lookup = {'gt': 'lt', 'lt': 'gt'}[lookup]
+    names = [(name.lstrip('-'), reverse_lookup if name.startswith('-') else lookup) for name in names]
+    fields = [model._meta.pk if name == 'pk' else model._meta.get_field(name) for name, _ in names]
+    values = [field.to_python(value) for field, value in zip(fields, values)]
+    condition = Q()
+    for i, (name, name_lookup) in enumerate(names):
+        equal = {equal_name: value for (equal_name, _), value in zip(names[:i], values[:i])}
+        condition |= Q(**equal, **{'%s__%s' % (name, name_lookup): values[i]})
+    return condition
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации. Вместо номера страницы хранит курсоры на соседние страницы,
+    поэтому стоимость любой страницы не зависит от ее глубины
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def keyset_queryset(queryset, keyset_fields, after, before, page_size):
+    """
+    :return: Срез queryset после курсора after (или перед курсором before) с одной лишней строкой,
+        по которой видно, есть ли следующая страница
+    """
+    try:
+        condition = keyset_filter(queryset.model, keyset_fields, decode_cursor(after or before),
+                                  'gt' if after else 'lt')
+    except (ValueError, TypeError, ValidationError) as exc:
+        raise Http404("Неправильный курсор страницы") from exc
+    ordering = list(keyset_fields) if after else _reverse_ordering(keyset_fields)
+    return queryset.filter(condition).order_by(*ordering)[:page_size + 1]
+
+
+def keyset_page(rows, keyset_fields, after, before, page_size):
+    """
+    :return: KeysetPage из строк, выбранных keyset_queryset
+    """
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if before or has_more:
+            next_cursor = encode_cursor(keyset_values(rows[-1], keyset_fields))
+        if after or has_more:
+            previous_cursor = encode_cursor(keyset_values(rows[0], keyset_fields))
+    return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """
+    Примесь для ListView, добавляющая keyset (seek) пагинацию по полям keyset_fields.
+    Если в запросе есть параметр after или before, страница выбирается условием
+    WHERE (поля) > (значения курсора) вместо OFFSET, иначе работает обычная пагинация по номеру страницы
+    """
+    keyset_fields = ('pk',)
+    after_kwarg = 'after'
+    before_kwarg = 'before'
+
+    def _keyset_values(self, obj):
+        return keyset_values(obj, self.keyset_fields)
+
+    def paginate_queryset(self, queryset, page_size):
+        after = self.request.GET.get(self.after_kwarg)
+        before = self.request.GET.get(self.before_kwarg)
+        if not after and not before:
+            return super().paginate_queryset(queryset, page_size)
+
+        rows = list(keyset_queryset(queryset, self.keyset_fields, after, before, page_size))
+        page = keyset_page(rows, self.keyset_fields, after, before, page_size)
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        context['is_keyset_page'] = isinstance(page, KeysetPage)
+        if page is not None and not context['is_keyset_page'] and page.has_next():
+            # Курсор, по которому можно продолжить листание без OFFSET
+            context['next_cursor'] = encode_cursor(self._keyset_values(page.object_list[len(page.object_list) - 1]))
+        return context
+
+
+def estimate_row_count(model):
+    """
+    Оценка числа строк таблицы по статистике базы данных без COUNT(*)
+    :return: Оценка или None, если статистика недоступна
+    """
+    table = model._meta.db_table
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        elif vendor == 'mysql':
+            cursor.execute("SELECT table_rows FROM information_schema.tables "
+                           "WHERE table_schema = DATABASE() AND table_name = %s", [table])
+        elif vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Первое число в stat - количество строк таблицы на момент последнего ANALYZE
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            rows = [int(row[0].split()[0]) for row in cursor.fetchall() if row[0]]
+            return max(rows) if rows else None
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц. Для выборки без фильтров число строк берется из статистики базы,
+    для выборки с фильтрами считается не дальше count_limit строк, поэтому COUNT(*) не просматривает
+    всю таблицу
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if not queryset.query.has_filters():
+            estimate = estimate_row_count(queryset.model)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset.order_by().values('pk')[:self.count_limit + 1].count()
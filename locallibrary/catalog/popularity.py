@@ -0,0 +1,149 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from .models import (AuthorPopularity, Book, BookPopularity, GenrePopularity, Language, LoanEvent,
+                     popularity_weight)
+
+# Ключ кэша со списками популярного
+POPULAR_CACHE_KEY = 'catalog:popular'
+
+# Длина каждого списка популярного
+POPULAR_LIMIT = 5
+
+# Сколько выдач учитывается за один проход пересчета
+POPULARITY_BATCH_SIZE = 10000
+
+
+def get_popular_ttl():
+    """
+    :return: Время (в секундах), в течение которого списки популярного могут быть устаревшими
+    """
+    return getattr(settings, 'CATALOG_POPULARITY_TTL', 300)
+
+
+def _top(queryset, name, limit, today):
+    """
+    Первые limit объектов по оценке. Читается только индекс по score, объекты загружаются тем же запросом
+    :return: Объекты с затухшей на today оценкой в атрибуте popularity_score
+    """
+    weight = popularity_weight(today or timezone.localdate())
+    objects = []
+    for row in queryset.order_by('-score', 'pk')[:limit]:
+        obj = getattr(row, name)
+        obj.popularity_score = row.score / weight
+        objects.append(obj)
+    return objects
+
+
+def top_books(limit=POPULAR_LIMIT, genre=None, language=None, today=None):
+    """
+    :return: Самые популярные книги (всего, жанра или языка)
+    """
+    scores = BookPopularity.objects.select_related('book__author')
+    if genre is not None:
+        scores = scores.filter(book__genre=genre)
+    if language is not None:
+        scores = scores.filter(book__language=language)
+    return _top(scores, 'book', limit, today)
+
+
+def top_books_by(group, groups, limit=POPULAR_LIMIT, today=None):
+    """
+    Самые популярные книги сразу нескольких жанров или языков одним запросом: книги нумеруются
+    оконной функцией ROW_NUMBER() в пределах группы, и из каждой группы берутся первые limit
+    :param group: Путь от книги к группе ('genre' или 'language')
+    :param groups: Жанры или языки
+    :return: Список пар (группа, книги) в порядке groups
+    """
+    scores = (BookPopularity.objects.select_related('book__author')
+              .filter(**{'book__%s__in' % group: groups})
+              .annotate(group_id=F('book__%s' % group),
+                        rank=Window(RowNumber(), partition_by=F('book__%s' % group),
+                                    order_by=[F('score').desc(), F('pk').asc()]))
+              .filter(rank__lte=limit).order_by('rank'))
+    weight = popularity_weight(today or timezone.localdate())
+    books = {obj.pk: [] for obj in groups}
+    for row in scores:
+        row.book.popularity_score = row.score / weight
+        books[row.group_id].append(row.book)
+    return [(obj, books[obj.pk]) for obj in groups]
+
+
+def top_genres(limit=POPULAR_LIMIT, today=None):
+    return _top(GenrePopularity.objects.select_related('genre'), 'genre', limit, today)
+
+
+def top_authors(limit=POPULAR_LIMIT, today=None):
+    return _top(AuthorPopularity.objects.select_related('author'), 'author', limit, today)
+
+
+def top_languages(limit=POPULAR_LIMIT):
+    """
+    Языки с самыми популярными книгами (оценки языков не хранятся: языков мало, они суммируются по книгам)
+    """
+    return list(Language.objects.annotate(score=Sum('book__popularity__score')).filter(score__gt=0)
+                .order_by('-score')[:limit])
+
+
+def compute_popular(limit=POPULAR_LIMIT):
+    """
+    Списки популярного. Число запросов не зависит от числа жанров и языков в списках
+    :return: Словарь списков: книги, авторы, жанры и языки вместе с их популярными книгами
+    """
+    return {
+        'books': top_books(limit),
+        'authors': top_authors(limit),
+        'genres': top_books_by('genre', top_genres(limit), limit),
+        'languages': top_books_by('language', top_languages(limit), limit),
+    }
+
+
+def get_popular():
+    """
+    Возвращает списки популярного из кэша, при отсутствии вычисляет их заново
+    """
+    popular = cache.get(POPULAR_CACHE_KEY)
+    if popular is None:
+        popular = compute_popular()
+        cache.set(POPULAR_CACHE_KEY, popular, get_popular_ttl())
+    return popular
+
+
+async def aget_popular():
+    popular = await cache.aget(POPULAR_CACHE_KEY)
+    if popular is None:
+        popular = await sync_to_async(compute_popular)()
+        await cache.aset(POPULAR_CACHE_KEY, popular, get_popular_ttl())
+    return popular
+
+
+def rebuild_popularity(batch_size=POPULARITY_BATCH_SIZE):
+    """
+    Пересчитывает все оценки популярности по выдачам журнала выдач порциями по batch_size событий.
+    Нужно после изменения POPULARITY_HALF_LIFE_DAYS, начала отсчета CATALOG_POPULARITY_EPOCH, а также жанров
+    и авторов книг: при каждой выдаче оценка прибавляется текущим жанрам и автору книги.
+    Старые оценки заменяются в одной транзакции
+    :return: Число учтенных выдач
+    """
+    checkouts = LoanEvent.objects.filter(kind=LoanEvent.CHECKOUT, book__isnull=False).order_by('pk')
+    total = 0
+    last_id = 0
+    with transaction.atomic():
+        for model in (BookPopularity, AuthorPopularity, GenrePopularity):
+            model.objects.all().delete()
+        while True:
+            rows = list(checkouts.filter(pk__gt=last_id).values_list('pk', 'book_id', 'day')[:batch_size])
+            if not rows:
+                break
+            weights = {}
+            for pk, book_id, day in rows:
+                weights[book_id] = weights.get(book_id, 0) + popularity_weight(day)
+            Book.objects.add_popularity(weights)
+            total += len(rows)
+            last_id = rows[-1][0]
+    cache.delete(POPULAR_CACHE_KEY)
+    return total
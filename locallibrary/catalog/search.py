@@ -0,0 +1,186 @@
+import operator
+import re
+from functools import reduce
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from .models import Book
+
+# Таблица полнотекстового индекса SQLite (создается миграцией 0005_book_search_index)
+FTS_TABLE = 'catalog_book_fts'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def split_terms(query):
+    """
+    :return: Список слов поискового запроса в нижнем регистре
+    """
+    return [term.lower() for term in TERM_RE.findall(query or '')]
+
+
+def book_document(book):
+    """
+    :return: Текст полей книги, попадающих в индекс
+    """
+    author = book.author
+    authors = '%s %s' % (author.first_name, author.last_name) if author else ''
+    return {'title': book.title, 'summary': book.summary, 'isbn': book.isbn, 'authors': authors}
+
+
+class SearchBackend:
+    """
+    Базовый класс поискового движка каталога
+    """
+    def index_books(self, book_ids):
+        """
+        Добавляет или обновляет книги в индексе
+        """
+
+    def remove_books(self, book_ids):
+        """
+        Удаляет книги из индекса
+        """
+
+    def rebuild(self):
+        """
+        Перестраивает индекс целиком
+        """
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def search(self, query, limit, offset=0):
+        """
+        :return: Список id книг, упорядоченных по релевантности
+        """
+        raise NotImplementedError
+
+
+class DatabaseBackend(SearchBackend):
+    """
+    Запасной движок для баз данных без полнотекстового индекса: ищет префиксы слов через icontains
+    """
+    fields = ('title', 'summary', 'isbn', 'author__first_name', 'author__last_name')
+
+    def _queryset(self, query):
+        terms = split_terms(query)
+        if not terms:
+            return Book.objects.none()
+        conditions = [reduce(operator.or_, (Q(**{'%s__icontains' % field: term}) for field in self.fields))
+                      for term in terms]
+        return Book.objects.filter(*conditions).order_by('title', 'id')
+
+    def count(self, query):
+        return self._queryset(query).count()
+
+    def search(self, query, limit, offset=0):
+        return list(self._queryset(query).values_list('pk', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    Движок на основе виртуальной таблицы SQLite FTS5. Поддерживает ранжирование bm25 и поиск по префиксам слов
+    """
+    # Веса столбцов title, summary, isbn, authors при ранжировании
+    weights = (10.0, 1.0, 5.0, 5.0)
+    batch_size = 500
+
+    def _match_expression(self, query):
+        # Каждое слово ищется как префикс, все слова должны встретиться в документе
+        return ' '.join('"%s"*' % term for term in split_terms(query))
+
+    def index_books(self, book_ids):
+        book_ids = list(book_ids)
+        self.remove_books(book_ids)
+        books = Book.objects.filter(pk__in=book_ids).select_related('author').only(
+            'title', 'summary', 'isbn', 'author__first_name', 'author__last_name')
+        self._insert(books.iterator(chunk_size=self.batch_size))
+
+    def _insert(self, books):
+        sql = 'INSERT INTO %s (rowid, title, summary, isbn, authors) VALUES (%%s, %%s, %%s, %%s, %%s)' % FTS_TABLE
+        with connection.cursor() as cursor:
+            batch = []
+            for book in books:
+                document = book_document(book)
+                batch.append((book.pk, document['title'], document['summary'], document['isbn'],
+                              document['authors']))
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+
+    def remove_books(self, book_ids):
+        book_ids = list(book_ids)
+        with connection.cursor() as cursor:
+            for start in range(0, len(book_ids), self.batch_size):
+                chunk = book_ids[start:start + self.batch_size]
+                cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(chunk))),
+                               chunk)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        books = Book.objects.select_related('author').only(
+            'title', 'summary', 'isbn', 'author__first_name', 'author__last_name')
+        self._insert(books.iterator(chunk_size=self.batch_size))
+
+    def count(self, query):
+        expression = self._match_expression(query)
+        if not expression:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE), [expression])
+            return cursor.fetchone()[0]
+
+    def search(self, query, limit, offset=0):
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        sql = 'SELECT rowid FROM %s WHERE %s MATCH %%s ORDER BY bm25(%s, %s) LIMIT %%s OFFSET %%s' % (
+            FTS_TABLE, FTS_TABLE, FTS_TABLE, ', '.join(str(weight) for weight in self.weights))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [expression, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backend = None
+
+
+def get_backend():
+    """
+    :return: Поисковый движок из настройки CATALOG_SEARCH_BACKEND, по умолчанию FTS5 для SQLite
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'CATALOG_SEARCH_BACKEND', None)
+        if path is None:
+            path = 'catalog.search.SQLiteFTSBackend' if connection.vendor == 'sqlite' \
+                else 'catalog.search.DatabaseBackend'
+        _backend = import_string(path)()
+    return _backend
+
+
+class SearchResults:
+    """
+    Ленивый результат поиска, который можно передать в Paginator: книги загружаются только для запрошенного среза
+    """
+    def __init__(self, query, backend=None):
+        self.query = query
+        self.backend = backend or get_backend()
+
+    def count(self):
+        return self.backend.count(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        ids = self.backend.search(self.query, limit=item.stop - start, offset=start)
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
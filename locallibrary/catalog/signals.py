@@ -0,0 +1,188 @@
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import LOADED_STATE, Book, BookInstance, Author, Genre, Language, LoanEvent
+from . import stats
+from .caching import bump_versions, book_scope, author_scope, borrower_scope
+from .search import get_backend as get_search_backend
+
+# Счетчик домашней страницы, который соответствует каждой модели
+COUNTER_FOR_MODEL = {
+    Book: 'num_books',
+    Author: 'num_authors',
+    Genre: 'num_genres',
+}
+
+
+@receiver(post_init, sender=BookInstance)
+def remember_loaded_state(sender, instance, **kwargs):
+    """
+    Запоминает статус, книгу, читателя и срок возврата экземпляра, загруженные из базы, чтобы при сохранении
+    знать, как они изменились
+    """
+    for attname, loaded in LOADED_STATE.items():
+        setattr(instance, loaded, instance.__dict__.get(attname))
+
+
+# Счетчики книги обновляются до остальных обработчиков post_save, которые сбрасывают загруженное состояние
+@receiver(post_save, sender=BookInstance)
+def update_book_availability(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = (instance._loaded_book_id, instance._loaded_status)
+    current = (instance.book_id, instance.status)
+    if created:
+        Book.objects.adjust_availability({current: 1})
+    elif loaded != current:
+        Book.objects.adjust_availability({loaded: -1, current: 1})
+
+
+@receiver(post_save, sender=BookInstance)
+def record_loan_event(sender, instance, created, raw=False, **kwargs):
+    """
+    Записывает в журнал выдач смену статуса экземпляра или продление (новый срок у выданного экземпляра)
+    """
+    if raw:
+        return
+    old_status = '' if created else instance._loaded_status
+    renewed = instance.status == 'o' and instance.due_back != instance._loaded_due_back
+    if (created and instance.status == 'o') or (not created and (old_status != instance.status or renewed)):
+        LoanEvent.build(instance.pk, instance.book_id, instance.borrower_id or instance._loaded_borrower_id,
+                        old_status, instance.status, instance.due_back).save()
+    instance._loaded_due_back = instance.due_back
+
+
+@receiver(post_delete, sender=BookInstance)
+def remove_book_availability(sender, instance, **kwargs):
+    Book.objects.adjust_availability({(instance._loaded_book_id, instance._loaded_status): -1})
+
+
+@receiver(post_init, sender=Book)
+def remember_loaded_author(sender, instance, **kwargs):
+    instance._loaded_author_id = instance.__dict__.get('author_id')
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust_stats(**{COUNTER_FOR_MODEL[sender]: 1})
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def count_deleted(sender, instance, **kwargs):
+    stats.adjust_stats(**{COUNTER_FOR_MODEL[sender]: -1})
+
+
+@receiver(post_save, sender=BookInstance)
+def count_instance_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_available = not created and instance._loaded_status == 'a'
+    is_available = instance.status == 'a'
+    stats.adjust_stats(num_instances=1 if created else 0,
+                       num_instances_available=int(is_available) - int(was_available))
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=BookInstance)
+def count_instance_deleted(sender, instance, **kwargs):
+    stats.adjust_stats(num_instances=-1,
+                       num_instances_available=-1 if instance._loaded_status == 'a' else 0)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    # Индекс обновляется в той же транзакции, что и книга
+    get_search_backend().index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    get_search_backend().remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def index_author_books(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().index_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def remember_author_books(sender, instance, **kwargs):
+    # После удаления автора у его книг уже будет author=NULL, поэтому их id запоминаются заранее
+    instance._book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def reindex_author_books(sender, instance, **kwargs):
+    get_search_backend().index_books(getattr(instance, '_book_ids', []))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_pages(sender, instance, **kwargs):
+    bump_versions('books', 'authors', book_scope(instance.pk),
+                  *[author_scope(pk) for pk in {instance.author_id, instance._loaded_author_id} if pk])
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(post_save, sender=Author)
+def invalidate_author_pages(sender, instance, created, **kwargs):
+    book_ids = [] if created else instance.book_set.values_list('pk', flat=True)
+    bump_versions('authors', 'books', author_scope(instance.pk), *[book_scope(pk) for pk in book_ids])
+
+
+@receiver(post_delete, sender=Author)
+def invalidate_deleted_author_pages(sender, instance, **kwargs):
+    bump_versions('authors', 'books', author_scope(instance.pk),
+                  *[book_scope(pk) for pk in getattr(instance, '_book_ids', [])])
+
+
+@receiver(post_save, sender=Genre)
+def invalidate_genre_pages(sender, instance, created, **kwargs):
+    if not created:
+        bump_versions(*[book_scope(pk) for pk in instance.book_set.values_list('pk', flat=True)])
+
+
+@receiver(pre_delete, sender=Genre)
+def invalidate_deleted_genre_pages(sender, instance, **kwargs):
+    bump_versions(*[book_scope(pk) for pk in instance.book_set.values_list('pk', flat=True)])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def invalidate_book_genre_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_versions(book_scope(instance.pk))
+    elif action == 'pre_clear':
+        # При очистке жанра с обратной стороны id книг известны только до удаления связей
+        bump_versions(*[book_scope(pk) for pk in instance.book_set.values_list('pk', flat=True)])
+    elif action in ('post_add', 'post_remove'):
+        bump_versions(*[book_scope(pk) for pk in pk_set])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def invalidate_facets(sender, **kwargs):
+    # Изменения книг и их доступности сбрасывают счетчики фасетов через область 'books'
+    bump_versions('facets')
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def invalidate_genre_facets(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions('facets')
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def invalidate_copy_pages(sender, instance, **kwargs):
+    bump_versions(*[book_scope(pk) for pk in {instance.book_id, instance._loaded_book_id} if pk],
+                  *[borrower_scope(pk) for pk in {instance.borrower_id, instance._loaded_borrower_id} if pk])
+    instance._loaded_book_id = instance.book_id
+    instance._loaded_borrower_id = instance.borrower_id
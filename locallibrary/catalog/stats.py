@@ -0,0 +1,101 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import Book, BookInstance, Author, Genre
+
+# Префикс ключей кэша со счетчиками домашней страницы
+STATS_CACHE_PREFIX = 'catalog:stats:'
+
+STATS_KEYS = ('num_books', 'num_instances', 'num_instances_available', 'num_authors', 'num_genres')
+
+
+def get_stats_ttl():
+    """
+    :return: Максимальное время (в секундах), в течение которого счетчики могут быть устаревшими
+    """
+    return getattr(settings, 'CATALOG_STATS_TTL', 300)
+
+
+def _cache_key(name):
+    return STATS_CACHE_PREFIX + name
+
+
+def compute_stats():
+    """
+    Считает все счетчики домашней страницы одним запросом к базе данных
+    :return: Словарь счетчиков
+    """
+    qn = connection.ops.quote_name
+    instance_table = qn(BookInstance._meta.db_table)
+    sql = (
+        'SELECT '
+        '(SELECT COUNT(*) FROM %s), '
+        '(SELECT COUNT(*) FROM %s), '
+        '(SELECT COUNT(*) FROM %s WHERE %s = %%s), '
+        '(SELECT COUNT(*) FROM %s), '
+        '(SELECT COUNT(*) FROM %s)' % (
+            qn(Book._meta.db_table),
+            instance_table,
+            instance_table, qn(BookInstance._meta.get_field('status').column),
+            qn(Author._meta.db_table),
+            qn(Genre._meta.db_table),
+        )
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, ['a'])
+        row = cursor.fetchone()
+    return dict(zip(STATS_KEYS, row))
+
+
+def get_stats():
+    """
+    Возвращает счетчики из кэша, при отсутствии хотя бы одного из них пересчитывает все
+    :return: Словарь счетчиков
+    """
+    cached = cache.get_many([_cache_key(name) for name in STATS_KEYS])
+    if len(cached) == len(STATS_KEYS):
+        return {name: cached[_cache_key(name)] for name in STATS_KEYS}
+    stats = compute_stats()
+    cache.set_many({_cache_key(name): value for name, value in stats.items()}, get_stats_ttl())
+    return stats
+
+
+async def aget_stats():
+    """
+    Асинхронный вариант get_stats. Все счетчики по-прежнему считаются одним запросом: пять отдельных
+    COUNT через асинхронный ORM выполнились бы друг за другом в одном потоке подключения к базе
+    """
+    cached = await cache.aget_many([_cache_key(name) for name in STATS_KEYS])
+    if len(cached) == len(STATS_KEYS):
+        return {name: cached[_cache_key(name)] for name in STATS_KEYS}
+    stats = await sync_to_async(compute_stats)()
+    await cache.aset_many({_cache_key(name): value for name, value in stats.items()}, get_stats_ttl())
+    return stats
+
+
+def invalidate_stats():
+    """
+    Удаляет счетчики из кэша, следующий запрос пересчитает их
+    """
+    cache.delete_many([_cache_key(name) for name in STATS_KEYS])
+
+
+def _apply_deltas(deltas):
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(_cache_key(name), delta)
+        except ValueError:
+            # Счетчика нет в кэше - он будет пересчитан целиком при следующем чтении
+            pass
+
+
+def adjust_stats(**deltas):
+    """
+    Изменяет закэшированные счетчики на указанные величины после фиксации транзакции.
+    Время жизни ключей не продлевается, поэтому CATALOG_STATS_TTL ограничивает устаревание
+    данных даже при массовых операциях, которые не отправляют сигналы
+    """
+    transaction.on_commit(lambda: _apply_deltas(deltas))
@@ -0,0 +1,96 @@
+import unittest
+from unittest import mock
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from .admin import BookInstanceAdmin, LimitedInlineFormSet
+from .models import Author, Book, BookInstance, Genre
+from .pagination import EstimatedCountPaginator
+
+
+class CatalogAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser(username="admin", password="12345", email="admin@example.com")
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        genres = [Genre.objects.create(name="Genre %d" % num) for num in range(4)]
+        for book_num in range(30):
+            book = Book.objects.create(title="Title %d" % book_num, summary="Summary", isbn="ABCDEFG",
+                                       author=cls.author)
+            book.genre.set(genres)
+        cls.book = Book.objects.first()
+        BookInstance.objects.bulk_create([BookInstance(book=cls.book, imprint="Imprint", status='a')
+                                          for _ in range(50)])
+
+    def setUp(self):
+        self.client.login(username="admin", password="12345")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp
+
+    def test_book_changelist_is_n_plus_one_free(self):
+        queries, resp = self.count_queries(reverse('admin:catalog_book_changelist'))
+        for book_num in range(30, 60):
+            Book.objects.create(title="Title %d" % book_num, summary="Summary", isbn="ABCDEFG", author=self.author)
+        more_queries, resp = self.count_queries(reverse('admin:catalog_book_changelist'))
+        self.assertEqual(queries, more_queries)
+        self.assertContains(resp, "Genre 0, Genre 1, Genre 2")
+
+    def test_bookinstance_changelist_is_n_plus_one_free(self):
+        queries, resp = self.count_queries(reverse('admin:catalog_bookinstance_changelist'))
+        BookInstance.objects.bulk_create([BookInstance(book=self.book, imprint="Imprint", status='o')
+                                          for _ in range(50)])
+        more_queries, resp = self.count_queries(reverse('admin:catalog_bookinstance_changelist'))
+        self.assertEqual(queries, more_queries)
+
+    def test_inlines_are_capped(self):
+        queries, resp = self.count_queries(reverse('admin:catalog_book_change', args=[self.book.pk]))
+        self.assertEqual(resp.context['inline_admin_formsets'][0].formset.total_form_count(),
+                         LimitedInlineFormSet.max_rows)
+        self.assertContains(resp, "?book__id__exact=%s" % self.book.pk)
+        resp = self.client.get(reverse('admin:catalog_author_change', args=[self.author.pk]))
+        self.assertEqual(resp.context['inline_admin_formsets'][0].formset.total_form_count(),
+                         LimitedInlineFormSet.max_rows)
+
+    def test_filtered_count_is_bounded(self):
+        paginator = EstimatedCountPaginator(BookInstance.objects.filter(status='a').order_by('pk'), 10)
+        paginator.count_limit = 20
+        self.assertEqual(paginator.count, 21)
+        paginator = EstimatedCountPaginator(BookInstance.objects.filter(status='a').order_by('pk'), 10)
+        self.assertEqual(paginator.count, 50)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "Статистика таблиц собирается через ANALYZE SQLite")
+    def test_unfiltered_count_uses_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(BookInstance.objects.order_by('pk'), 10)
+        paginator.count_limit = 10
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator.count, 50)
+        self.assertFalse(any('COUNT' in query['sql'] for query in ctx.captured_queries))
+
+    def test_concurrent_copy_change_is_reported(self):
+        copy = BookInstance.objects.filter(book=self.book).first()
+        url = reverse('admin:catalog_bookinstance_change', args=[copy.pk])
+        save_model = BookInstanceAdmin.save_model
+
+        def racing_save_model(admin, request, obj, form, change):
+            # Строку меняет другой запрос после того, как администратор загрузил объект
+            BookInstance.objects.filter(pk=obj.pk).update(version=F('version') + 1)
+            save_model(admin, request, obj, form, change)
+
+        data = {'book': self.book.pk, 'imprint': "Other", 'id': copy.pk, 'status': 'm', 'due_back': '', 'borrower': ''}
+        with mock.patch.object(BookInstanceAdmin, 'save_model', racing_save_model):
+            resp = self.client.post(url, data, follow=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("изменен или удален другим пользователем", str(list(resp.context['messages'])[0]))
+        stored = BookInstance.objects.get(pk=copy.pk)
+        self.assertEqual((stored.imprint, stored.status, stored.version), ("Imprint", 'a', 0))
+        self.assertFalse(LogEntry.objects.exists())
@@ -0,0 +1,74 @@
+import datetime
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .models import Author, Book, BookInstance, Genre, Language
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.language = Language.objects.create(name="en")
+        cls.genres = [Genre.objects.create(name="Fantasy"), Genre.objects.create(name="Drama")]
+        cls.books = [
+            Book.objects.create(title="Book %02d" % num, summary="Summary", isbn="%013d" % num,
+                                author=cls.author if num % 2 else None, language=cls.language)
+            for num in range(25)
+        ]
+        for book in cls.books[:3]:
+            book.genre.set(cls.genres)
+        cls.copy = BookInstance.objects.create(book=cls.books[1], imprint="Imprint", status='a',
+                                               due_back=datetime.date(2024, 1, 1))
+
+    def get(self, resource, **params):
+        resp = self.client.get(reverse('api-list', args=[resource]), params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_default_fields(self):
+        data = self.get('books')
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][1], {'id': self.books[1].pk, 'title': 'Book 01', 'author': self.author.pk})
+
+    def test_sparse_fields_select_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get('books', fields='isbn')
+        self.assertEqual(data['results'][0], {'isbn': '0000000000000'})
+        sql = ctx.captured_queries[0]['sql']
+        self.assertNotIn('"summary"', sql)
+        self.assertNotIn('"author_id"', sql)
+
+    def test_includes(self):
+        with self.assertNumQueries(2):
+            data = self.get('books', fields='id,title', include='author,genres', limit=3)
+        first, second = data['results'][:2]
+        self.assertIsNone(first['author'])
+        self.assertEqual(second['author'], {'id': self.author.pk, 'first_name': 'John', 'last_name': 'Smith'})
+        self.assertEqual([genre['name'] for genre in second['genres']], ['Drama', 'Fantasy'])
+
+    def test_cursor_pagination(self):
+        data = self.get('books', fields='title', limit=10)
+        titles = [item['title'] for item in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            titles += [item['title'] for item in data['results']]
+        self.assertEqual(titles, [book.title for book in self.books])
+
+    def test_detail(self):
+        resp = self.client.get(reverse('api-detail', args=['copies', self.copy.pk]), {'include': 'book'})
+        self.assertEqual(resp.json(), {
+            'id': str(self.copy.pk), 'book': {'id': self.books[1].pk, 'title': 'Book 01', 'isbn': '0000000000001'},
+            'status': 'a', 'due_back': '2024-01-01',
+        })
+        resp = self.client.get(reverse('api-detail', args=['copies', 'missing']))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_errors(self):
+        url = reverse('api-list', args=['books'])
+        self.assertEqual(self.client.get(url, {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'after': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': '0'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-list', args=['users'])).status_code, 404)
+        self.assertNotIn('borrower', self.get('copies', fields='id')['results'][0])
@@ -0,0 +1,91 @@
+import datetime
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import async_views
+from .models import Author, Book, BookInstance, Genre
+
+
+@override_settings(ROOT_URLCONF='locallibrary.asgi_urls')
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        genre = Genre.objects.create(name="Fantasy")
+        cls.books = [Book.objects.create(title="Book %02d" % num, summary="Summary", isbn="%013d" % num,
+                                         author=cls.author) for num in range(13)]
+        cls.books[0].genre.add(genre)
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+        today = datetime.date.today()
+        BookInstance.objects.bulk_create([
+            BookInstance(book=cls.books[0], imprint="Imprint", status='o' if num % 2 else 'a', borrower=cls.reader
+                         if num % 2 else None, due_back=today + datetime.timedelta(days=num)) for num in range(25)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_views_are_async(self):
+        resp = await self.async_client.get(reverse('books'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIs(resp.resolver_match.func.view_class, async_views.BookListView)
+
+    async def test_index(self):
+        resp = await self.async_client.get(reverse('index'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['num_books'], 13)
+        self.assertEqual(resp.context['num_instances_available'], 13)
+        self.assertEqual(resp.context['num_visits'], 0)
+        resp = await self.async_client.get(reverse('index'))
+        self.assertEqual(resp.context['num_visits'], 1)
+
+    async def test_book_list_pages(self):
+        resp = await self.async_client.get(reverse('books'))
+        self.assertEqual(len(resp.context['book_list']), 10)
+        resp = await self.async_client.get(reverse('books'), {'after': resp.context['next_cursor']})
+        self.assertEqual([book.title for book in resp.context['book_list']], ['Book 10', 'Book 11', 'Book 12'])
+        resp = await self.async_client.get(reverse('books'), {'page': 'last'})
+        self.assertEqual(len(resp.context['book_list']), 3)
+        resp = await self.async_client.get(reverse('books'), {'page': 9})
+        self.assertEqual(resp.status_code, 404)
+
+    async def test_book_detail(self):
+        resp = await self.async_client.get(reverse('book-detail', args=[self.books[0].pk]), {'page': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['num_copies'], 25)
+        self.assertEqual(len(resp.context['copies_page']), 5)
+        self.assertContains(resp, 'Fantasy')
+        resp = await self.async_client.get(reverse('book-detail', args=[0]))
+        self.assertEqual(resp.status_code, 404)
+
+    async def test_my_borrowed(self):
+        resp = await self.async_client.get(reverse('my-borrowed'))
+        self.assertEqual(resp.status_code, 302)
+        await self.async_client.alogin(username='reader', password='12345')
+        resp = await self.async_client.get(reverse('my-borrowed'))
+        self.assertEqual(resp.status_code, 200)
+        due_dates = [copy.due_back for copy in resp.context['bookinstance_list']]
+        self.assertEqual(len(due_dates), 10)
+        self.assertEqual(due_dates, sorted(due_dates))
+
+    async def test_cached_response(self):
+        url = reverse('authors')
+        first = await self.async_client.get(url)
+        second = await self.async_client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    async def test_query_instrumentation(self):
+        resp = await self.async_client.get(reverse('book-detail', args=[self.books[0].pk]))
+        self.assertEqual(resp.query_stats['view'], 'book-detail')
+        self.assertGreater(resp.query_stats['queries'], 0)
+        self.assertGreater(resp.query_stats['render_ms'], 0)
+
+    def test_same_html_as_sync_views(self):
+        for url in [reverse('books'), reverse('authors'), reverse('book-detail', args=[self.books[0].pk])]:
+            cache.clear()
+            async_html = self.client.get(url).content
+            cache.clear()
+            with override_settings(ROOT_URLCONF='locallibrary.urls'):
+                sync_html = self.client.get(url).content
+            self.assertEqual(async_html, sync_html)
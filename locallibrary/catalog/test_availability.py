@@ -0,0 +1,155 @@
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .loans import checkout
+from .models import BOOK_COUNTER_FIELDS, Author, Book, BookInstance, LoanConflict
+from .stats import compute_stats, get_stats
+
+
+class AvailabilityCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book1 = Book.objects.create(title="Book 1", summary="Summary", isbn="1", author=cls.author)
+        cls.book2 = Book.objects.create(title="Book 2", summary="Summary", isbn="2", author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def counters(self, book):
+        return Book.objects.filter(pk=book.pk).values(*BOOK_COUNTER_FIELDS).get()
+
+    def assertCounters(self, book, copies, available=0, on_loan=0, maintenance=0, reserved=0):
+        self.assertEqual(self.counters(book), {
+            'num_copies': copies, 'num_available': available, 'num_on_loan': on_loan,
+            'num_maintenance': maintenance, 'num_reserved': reserved,
+        })
+        self.assertEqual(Book.objects.availability_drift(), {})
+
+    def test_save_and_delete(self):
+        copy = BookInstance.objects.create(book=self.book1, imprint="Imprint", status='a')
+        self.assertCounters(self.book1, 1, available=1)
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(self.book1, 1, on_loan=1)
+        copy.book = self.book2
+        copy.status = 'r'
+        copy.save()
+        self.assertCounters(self.book1, 0)
+        self.assertCounters(self.book2, 1, reserved=1)
+        BookInstance.objects.get(pk=copy.pk).delete()
+        self.assertCounters(self.book2, 0)
+
+    def test_bulk_operations(self):
+        copies = BookInstance.objects.bulk_create([
+            BookInstance(book=self.book1, imprint="Imprint", status=status) for status in 'aaom'
+        ])
+        self.assertCounters(self.book1, 4, available=2, on_loan=1, maintenance=1)
+
+        BookInstance.objects.filter(book=self.book1, status='a').update(status='r')
+        self.assertCounters(self.book1, 4, on_loan=1, maintenance=1, reserved=2)
+
+        for copy in copies[:2]:
+            copy.book = self.book2
+        BookInstance.objects.bulk_update(copies[:2], ['book'])
+        self.assertCounters(self.book1, 2, on_loan=1, maintenance=1)
+        self.assertCounters(self.book2, 2, reserved=2)
+
+        BookInstance.objects.filter(status='r').update(book=self.book1, status='a')
+        self.assertCounters(self.book1, 4, available=2, on_loan=1, maintenance=1)
+        BookInstance.objects.filter(status='a').delete()
+        self.assertCounters(self.book1, 2, on_loan=1, maintenance=1)
+        self.assertCounters(self.book2, 0)
+
+    def test_stale_copy_save_keeps_counters(self):
+        copy = BookInstance.objects.create(book=self.book1, imprint="Imprint", status='a')
+        stale = BookInstance.objects.get(pk=copy.pk)
+        checkout(copy, User.objects.create_user(username='reader'))
+        BookInstance.objects.create(book=self.book1, imprint="Imprint", status='a')
+        with self.assertRaises(LoanConflict):
+            stale.save()
+        self.assertCounters(self.book1, 2, available=1, on_loan=1)
+
+    def test_bulk_operations_adjust_homepage_stats(self):
+        copies = BookInstance.objects.bulk_create([
+            BookInstance(book=self.book1, imprint="Imprint", status=status) for status in 'aaom'
+        ])
+        get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(status='a').update(status='r')
+        self.assertEqual(get_stats(), compute_stats())
+        with self.captureOnCommitCallbacks(execute=True):
+            for copy in copies:
+                copy.status = 'a'
+            BookInstance.objects.bulk_update(copies, ['status'])
+            BookInstance.objects.bulk_create([BookInstance(book=self.book2, imprint="Imprint", status='a')])
+        self.assertEqual(get_stats(), compute_stats())
+        self.assertEqual(get_stats()['num_instances_available'], 5)
+
+    def test_book_save_keeps_counters(self):
+        stale = Book.objects.get(pk=self.book1.pk)
+        BookInstance.objects.create(book=self.book1, imprint="Imprint", status='a')
+        stale.title = "Renamed"
+        stale.save()
+        self.assertCounters(self.book1, 1, available=1)
+
+    def test_recompute_command(self):
+        BookInstance.objects.create(book=self.book1, imprint="Imprint", status='a')
+        Book.objects.filter(pk=self.book1.pk).update(num_available=5, num_on_loan=2)
+        with self.assertRaises(CommandError):
+            call_command('recompute_availability', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('recompute_availability', stdout=out)
+        self.assertIn('num_available 5 -> 1', out.getvalue())
+        self.assertCounters(self.book1, 1, available=1)
+        out = StringIO()
+        call_command('recompute_availability', '--check', stdout=out)
+        self.assertIn('верны', out.getvalue())
+
+
+class BookListAvailabilityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.books = [Book.objects.create(title="Book %02d" % num, summary="Summary", isbn=str(num), author=author)
+                     for num in range(13)]
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint="Imprint", status='a') for num, book in enumerate(cls.books)
+            for _ in range(num % 4)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_books(self, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('books'), params)
+        return resp, len(queries)
+
+    def test_availability_costs_no_queries(self):
+        # Счетчики выбираются вместе с книгами: столько же запросов, сколько при сортировке по названию
+        resp, by_title = self.get_books()
+        self.assertContains(resp, '1 of 1 available')
+        resp, by_availability = self.get_books(sort='available')
+        self.assertEqual(by_availability, by_title)
+
+    def test_sort_by_availability(self):
+        expected = [book.title for book in sorted(self.books, key=lambda book: (-(self.books.index(book) % 4),
+                                                                                book.title))]
+        resp, _ = self.get_books(sort='available')
+        titles = [book.title for book in resp.context['book_list']]
+        self.assertEqual(titles, expected[:10])
+        self.assertContains(resp, '3 of 3 available')
+        self.assertContains(resp, '&amp;sort=available')
+
+        resp, _ = self.get_books(sort='available', after=resp.context['next_cursor'])
+        titles += [book.title for book in resp.context['book_list']]
+        self.assertEqual(titles, expected)
+        resp, _ = self.get_books(sort='available', before=resp.context['page_obj'].previous_cursor)
+        self.assertEqual([book.title for book in resp.context['book_list']], expected[:10])
@@ -0,0 +1,59 @@
+from django.test import TestCase, TransactionTestCase
+from .benchmark import TEMPLATE_MODES, compare_results, percentile, run_benchmark, run_server_benchmark
+from .benchmark import run_template_benchmark
+from .datagen import generate_catalog, generate_records
+from .models import Author, Book, BookInstance
+
+
+class DataGeneratorTest(TestCase):
+    def test_records_are_deterministic(self):
+        first = list(generate_records(authors=5, books=20, genres=3, copies=50, borrowers=4, seed=7))
+        second = list(generate_records(authors=5, books=20, genres=3, copies=50, borrowers=4, seed=7))
+        self.assertEqual(first, second)
+
+    def test_generate_catalog(self):
+        generate_catalog(authors=5, books=20, genres=3, copies=50, borrowers=4)
+        self.assertEqual(Author.objects.count(), 5)
+        self.assertEqual(Book.objects.count(), 20)
+        self.assertEqual(BookInstance.objects.count(), 50)
+        self.assertFalse(BookInstance.objects.filter(status='o', borrower__isnull=True).exists())
+
+
+class BenchmarkTest(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 90), 5)
+
+    def test_run_benchmark_measures_all_endpoints(self):
+        generate_catalog(authors=5, books=20, genres=3, copies=50, borrowers=4)
+        results = run_benchmark(requests=2)
+        self.assertEqual(set(results), {'index', 'books', 'book-detail', 'authors', 'author-detail', 'my-borrowed'})
+        for metrics in results.values():
+            self.assertGreater(metrics['queries'], 0)
+
+    def test_run_template_benchmark(self):
+        generate_catalog(authors=5, books=20, genres=3, copies=50, borrowers=4)
+        results = run_template_benchmark(requests=2, endpoints=['books', 'authors'])
+        self.assertEqual(set(results), set(TEMPLATE_MODES))
+        for mode in TEMPLATE_MODES:
+            self.assertEqual(set(results[mode]), {'books', 'authors'})
+            self.assertGreater(results[mode]['books']['render_p50_ms'], 0)
+
+    def test_compare_results(self):
+        baseline = {'books': {'p50_ms': 10.0, 'p90_ms': 20.0, 'queries': 2}}
+        self.assertEqual(compare_results({'books': {'p50_ms': 11.0, 'p90_ms': 21.0, 'queries': 2}}, baseline), [])
+        regressions = compare_results({'books': {'p50_ms': 15.0, 'p90_ms': 20.0, 'queries': 3}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+class ServerBenchmarkTest(TransactionTestCase):
+    def test_wsgi_and_asgi_serve_the_same_pages(self):
+        generate_catalog(authors=5, books=20, genres=3, copies=50, borrowers=4)
+        results = run_server_benchmark(requests=6, concurrency=3, endpoints=['books', 'book-detail', 'my-borrowed'])
+        for server in ('wsgi', 'asgi'):
+            self.assertEqual(set(results[server]), {'books', 'book-detail', 'my-borrowed'})
+            for metrics in results[server].values():
+                self.assertEqual(metrics['errors'], 0)
+                self.assertGreater(metrics['throughput_rps'], 0)
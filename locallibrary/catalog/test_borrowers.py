@@ -0,0 +1,122 @@
+import datetime
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .borrowers import current_loans, get_borrower_summary, get_loan_history
+from .loans import checkout, renew_many, return_copy
+from .models import Author, Book, BookInstance, LoanEvent
+
+
+class BorrowerDashboardTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(title="Book", summary="Summary", isbn="1", author=author)
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+        cls.other = User.objects.create_user(username='other', password='12345')
+        BookInstance.objects.bulk_create([
+            BookInstance(book=cls.book, imprint="Imprint", status='o', borrower=cls.reader,
+                         due_back=cls.today + datetime.timedelta(days=days)) for days in (-4, 0, 2, 10)
+        ] + [
+            BookInstance(book=cls.book, imprint="Imprint", status='o', borrower=cls.other, due_back=cls.today),
+            BookInstance(book=cls.book, imprint="Imprint", status='a'),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_current_loans(self):
+        with self.assertNumQueries(1):
+            loans = [(copy.overdue, copy.time_remaining.days, copy.book.author.last_name)
+                     for copy in current_loans(self.reader)]
+        self.assertEqual(loans, [(True, -4, "Smith"), (False, 0, "Smith"), (False, 2, "Smith"), (False, 10, "Smith")])
+
+    def test_summary_is_cached(self):
+        with self.assertNumQueries(1):
+            summary = get_borrower_summary(self.reader)
+        self.assertEqual(summary, {'on_loan': 4, 'overdue': 1, 'due_soon': 2,
+                                   'next_due_back': self.today})
+        with self.assertNumQueries(0):
+            get_borrower_summary(self.reader)
+
+    def test_loan_changes_invalidate_summary(self):
+        get_borrower_summary(self.reader)
+        copy = BookInstance.objects.get(borrower=self.reader, due_back__lt=self.today)
+        return_copy(copy)
+        self.assertEqual(get_borrower_summary(self.reader)['on_loan'], 3)
+        checkout(copy, self.reader, self.today + datetime.timedelta(days=1))
+        self.assertEqual(get_borrower_summary(self.reader)['due_soon'], 3)
+
+        renew_many(BookInstance.objects.filter(borrower=self.reader).values_list('pk', flat=True),
+                   self.today + datetime.timedelta(weeks=2))
+        self.assertEqual(get_borrower_summary(self.reader)['due_soon'], 0)
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.borrower = self.other
+        copy.save()
+        self.assertEqual(get_borrower_summary(self.reader)['on_loan'], 3)
+        self.assertEqual(get_borrower_summary(self.other)['on_loan'], 2)
+
+        # Массовые изменения через update() и bulk_update
+        BookInstance.objects.filter(borrower=self.other).update(status='a')
+        self.assertEqual(get_borrower_summary(self.other)['on_loan'], 0)
+        copies = list(BookInstance.objects.filter(borrower=self.reader))
+        for copy in copies:
+            copy.status = 'm'
+        BookInstance.objects.bulk_update(copies, ['status'])
+        self.assertEqual(get_borrower_summary(self.reader)['on_loan'], 0)
+
+    def test_due_back_and_borrower_updates(self):
+        get_borrower_summary(self.reader)
+        get_loan_history(self.other)
+        BookInstance.objects.filter(borrower=self.reader).update(due_back=self.today + datetime.timedelta(weeks=2))
+        self.assertEqual(get_borrower_summary(self.reader)['due_soon'], 0)
+        self.assertEqual(LoanEvent.objects.filter(kind=LoanEvent.RENEW, borrower=self.reader).count(), 4)
+
+        # Передача выданного экземпляра другому читателю сбрасывает сводки обоих
+        copy = BookInstance.objects.filter(borrower=self.reader).first()
+        BookInstance.objects.filter(pk=copy.pk).update(borrower=self.other)
+        self.assertEqual(get_borrower_summary(self.reader)['on_loan'], 3)
+        self.assertEqual(get_loan_history(self.other)[0].kind, LoanEvent.RENEW)
+
+        # Срок невыданного экземпляра не попадает в журнал
+        BookInstance.objects.filter(status='a').update(due_back=self.today)
+        self.assertEqual(LoanEvent.objects.filter(kind=LoanEvent.RENEW).count(), 5)
+
+    def test_page(self):
+        self.client.login(username='reader', password='12345')
+        resp = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['summary']['overdue'], 1)
+        self.assertContains(resp, 'просрочено на 4 дн.')
+        self.assertContains(resp, 'осталось 10 дн.')
+
+    def test_history(self):
+        copy = BookInstance.objects.get(borrower=self.reader, due_back__lt=self.today)
+        return_copy(copy)
+        self.assertEqual([(event.kind, event.book) for event in get_loan_history(self.reader)],
+                         [(LoanEvent.RETURN, self.book)] + [(LoanEvent.CHECKOUT, self.book)] * 4)
+        with self.assertNumQueries(0):
+            get_loan_history(self.reader)
+        checkout(copy, self.reader)
+        self.assertEqual(get_loan_history(self.reader)[0].kind, LoanEvent.CHECKOUT)
+        self.client.login(username='reader', password='12345')
+        self.assertContains(self.client.get(reverse('my-borrowed')), 'История выдач')
+
+    def test_query_count_does_not_depend_on_loans(self):
+        self.client.login(username='reader', password='12345')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('my-borrowed'))
+        for num in range(20):
+            other_book = Book.objects.create(title="Book %d" % num, summary="Summary", isbn="1",
+                                             author=Author.objects.create(first_name="A", last_name=str(num)))
+            BookInstance.objects.create(book=other_book, imprint="Imprint", status='o', borrower=self.reader,
+                                        due_back=self.today)
+        cache.clear()
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            resp = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(resp.context['summary']['on_loan'], 24)
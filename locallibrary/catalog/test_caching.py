@@ -0,0 +1,116 @@
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache, caches
+from django.test import TestCase
+from django.urls import reverse
+from .caching import book_scope, bump_versions, get_versions
+from .models import Author, Book, BookInstance, Genre
+
+
+class CatalogViewCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username="testuser1", password="12345")
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(title="Book Title", summary="Summary", isbn="ABCDEFG", author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_request_served_from_cache(self):
+        first = self.client.get(reverse('books'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('books'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_conditional_get_returns_304(self):
+        resp = self.client.get(self.book.get_absolute_url())
+        resp = self.client.get(self.book.get_absolute_url(), HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(self.book.get_absolute_url(), HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_pages_are_cached_separately(self):
+        first = self.client.get(self.book.get_absolute_url())
+        second = self.client.get(self.book.get_absolute_url(), {'page': 2})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_book_change_invalidates_detail_and_list(self):
+        detail = self.client.get(self.book.get_absolute_url())
+        book_list = self.client.get(reverse('books'))
+        self.book.title = "New Title"
+        self.book.save()
+        self.assertContains(self.client.get(self.book.get_absolute_url()), "New Title")
+        self.assertNotEqual(self.client.get(reverse('books'))['ETag'], book_list['ETag'])
+        self.assertNotEqual(self.client.get(self.book.get_absolute_url())['ETag'], detail['ETag'])
+
+    def test_author_change_invalidates_book_detail(self):
+        self.client.get(self.book.get_absolute_url())
+        self.author.last_name = "Johnson"
+        self.author.save()
+        self.assertContains(self.client.get(self.book.get_absolute_url()), "Johnson")
+
+    def test_genre_and_copy_changes_invalidate_book_detail(self):
+        self.client.get(self.book.get_absolute_url())
+        genre = Genre.objects.create(name="Fantasy")
+        self.book.genre.add(genre)
+        self.assertContains(self.client.get(self.book.get_absolute_url()), "Fantasy")
+        genre.name = "Horror"
+        genre.save()
+        self.assertContains(self.client.get(self.book.get_absolute_url()), "Horror")
+        BookInstance.objects.create(book=self.book, imprint="Unlikely imprint", status='a')
+        self.assertContains(self.client.get(self.book.get_absolute_url()), "Unlikely imprint")
+
+    def test_authenticated_users_are_not_cached(self):
+        self.client.login(username="testuser1", password="12345")
+        resp = self.client.get(reverse('authors'))
+        self.assertNotIn('ETag', resp)
+
+    def test_versions_are_not_evicted_with_responses(self):
+        bump_versions(book_scope(self.book.pk))
+        version = get_versions([book_scope(self.book.pk)])
+        cache.clear()
+        self.assertEqual(get_versions([book_scope(self.book.pk)]), version)
+        self.assertIsNotNone(caches['versions'].get('catalog:version:' + book_scope(self.book.pk)))
+
+
+class TemplateFragmentCacheTest(TestCase):
+    """
+    Меню и строки списков кэшируются фрагментами и для вошедших пользователей, чьи страницы целиком не кэшируются
+    """
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username="testuser1", password="12345")
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(title="Book Title", summary="Summary", isbn="ABCDEFG", author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="testuser1", password="12345")
+
+    def test_sidebar_depends_on_auth_state(self):
+        self.assertContains(self.client.get(reverse('books')), reverse('my-borrowed'))
+        self.client.logout()
+        resp = self.client.get(reverse('books'))
+        self.assertNotContains(resp, reverse('my-borrowed'))
+        self.assertContains(resp, reverse('login'))
+
+    def test_rows_follow_object_changes(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('authors'))
+        self.author.last_name = "Johnson"
+        self.author.save()
+        BookInstance.objects.create(book=self.book, imprint="Imprint", status='a')
+        resp = self.client.get(reverse('books'))
+        self.assertContains(resp, "Johnson")
+        self.assertContains(resp, "1 of 1 available")
+        resp = self.client.get(reverse('authors'))
+        self.assertContains(resp, "Johnson")
+        self.assertContains(resp, "доступно экземпляров: 1")
+
+    def test_rows_depend_on_permissions(self):
+        self.client.get(reverse('books'))
+        librarian = User.objects.create_user(username="librarian", password="12345")
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.login(username="librarian", password="12345")
+        self.assertContains(self.client.get(reverse('books')), "Вернуть кингу")
@@ -0,0 +1,126 @@
+import datetime
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from .circulation import aggregate_circulation
+from .loans import checkout, renew, renew_many, return_copy
+from .models import (Author, Book, BookInstance, CirculationCursor, DailyBookCirculation, DailyGenreCirculation,
+                     Genre, LoanEvent)
+
+
+class LoanEventLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(title="Book", summary="Summary", isbn="1", author=author)
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+
+    def events(self):
+        return list(LoanEvent.objects.order_by('pk').values_list('kind', 'old_status', 'new_status', 'borrower_id'))
+
+    def test_save_path(self):
+        copy = BookInstance.objects.create(book=self.book, imprint="Imprint", status='o', borrower=self.reader,
+                                           due_back=self.today)
+        copy.due_back = self.today + datetime.timedelta(days=7)
+        copy.save()
+        copy.imprint = "Other"
+        copy.save()
+        copy.status, copy.borrower, copy.due_back = 'a', None, None
+        copy.save()
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'm'
+        copy.save()
+        self.assertEqual(self.events(), [
+            (LoanEvent.CHECKOUT, '', 'o', self.reader.pk),
+            (LoanEvent.RENEW, 'o', 'o', self.reader.pk),
+            (LoanEvent.RETURN, 'o', 'a', self.reader.pk),
+            (LoanEvent.STATUS, 'a', 'm', None),
+        ])
+        event = LoanEvent.objects.first()
+        self.assertEqual((event.copy_id, event.book_id, event.day), (copy.pk, self.book.pk, timezone.localdate()))
+
+    def test_loan_service(self):
+        copy = BookInstance.objects.create(book=self.book, imprint="Imprint", status='a')
+        checkout(copy, self.reader)
+        renew(copy, self.today + datetime.timedelta(weeks=4))
+        return_copy(copy)
+        renew_many([checkout(copy, self.reader).pk], self.today + datetime.timedelta(weeks=5))
+        self.assertEqual(self.events(), [
+            (LoanEvent.CHECKOUT, 'a', 'o', self.reader.pk),
+            (LoanEvent.RENEW, 'o', 'o', self.reader.pk),
+            (LoanEvent.RETURN, 'o', 'a', self.reader.pk),
+            (LoanEvent.CHECKOUT, 'a', 'o', self.reader.pk),
+            (LoanEvent.RENEW, 'o', 'o', self.reader.pk),
+        ])
+        self.assertEqual(LoanEvent.objects.last().due_back, self.today + datetime.timedelta(weeks=5))
+
+    def test_bulk_update(self):
+        BookInstance.objects.bulk_create([BookInstance(book=self.book, imprint="Imprint", status='a')
+                                          for _ in range(3)])
+        BookInstance.objects.update(status='m')
+        self.assertEqual(self.events(), [(LoanEvent.STATUS, 'a', 'm', None)] * 3)
+
+    def test_events_are_append_only(self):
+        BookInstance.objects.create(book=self.book, imprint="Imprint", status='o', borrower=self.reader)
+        event = LoanEvent.objects.get()
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+
+
+class AggregateCirculationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.fantasy = Genre.objects.create(name="Fantasy")
+        cls.drama = Genre.objects.create(name="Drama")
+        cls.book1 = Book.objects.create(title="Book 1", summary="Summary", isbn="1", author=author)
+        cls.book1.genre.set([cls.fantasy, cls.drama])
+        cls.book2 = Book.objects.create(title="Book 2", summary="Summary", isbn="2", author=author)
+        cls.book2.genre.set([cls.fantasy])
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+
+    def circulate(self, book, count):
+        for _ in range(count):
+            copy = BookInstance.objects.create(book=book, imprint="Imprint", status='a')
+            return_copy(checkout(copy, self.reader))
+
+    def test_incremental(self):
+        day = timezone.localdate()
+        self.circulate(self.book1, 2)
+        self.assertEqual(aggregate_circulation(batch_size=3), {'events': 4, 'books': 2, 'genres': 4})
+        self.circulate(self.book1, 1)
+        self.circulate(self.book2, 1)
+        self.assertEqual(aggregate_circulation()['events'], 4)
+        self.assertEqual(aggregate_circulation()['events'], 0)
+
+        self.assertEqual(list(DailyBookCirculation.objects.order_by('book').values_list(
+            'day', 'book', 'checkouts', 'returns')), [(day, self.book1.pk, 3, 3), (day, self.book2.pk, 1, 1)])
+        self.assertEqual(dict(DailyGenreCirculation.objects.values_list('genre', 'checkouts')),
+                         {self.fantasy.pk: 4, self.drama.pk: 3})
+        self.assertEqual(CirculationCursor.objects.get().last_event_id, LoanEvent.objects.latest('pk').pk)
+
+    def test_lag(self):
+        self.circulate(self.book1, 1)
+        # Курсор не проходит события моложе задержки: их транзакции могли еще не зафиксировать события с меньшими id
+        self.assertEqual(aggregate_circulation(lag=60)['events'], 0)
+        LoanEvent.objects.update(created_at=timezone.now() - datetime.timedelta(minutes=2))
+        self.circulate(self.book2, 1)
+        self.assertEqual(aggregate_circulation(lag=60), {'events': 2, 'books': 1, 'genres': 2})
+        self.assertEqual(aggregate_circulation(lag=0)['events'], 2)
+
+    def test_deleted_book_is_skipped(self):
+        self.circulate(self.book2, 1)
+        self.book2.delete()
+        self.assertEqual(aggregate_circulation(), {'events': 2, 'books': 0, 'genres': 0})
+        self.assertEqual(LoanEvent.objects.count(), 2)
+
+    def test_command(self):
+        self.circulate(self.book1, 1)
+        out = StringIO()
+        call_command('aggregate_circulation', stdout=out)
+        self.assertIn('Учтено событий: 2', out.getvalue())
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from .models import Author, Book, BookInstance
+
+
+class CatalogExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian = User.objects.create_user(username="librarian", password="12345")
+        librarian.user_permissions.add(Permission.objects.get(codename="can_mark_returned"))
+        User.objects.create_user(username="reader", password="12345")
+        author = Author.objects.create(first_name="Leo", last_name="Tolstoy")
+        book = Book.objects.create(title="War and Peace", summary="Summary", isbn="9785170878871", author=author)
+        for copy_num in range(5):
+            BookInstance.objects.create(book=book, imprint="Imprint, 2016", status='a')
+
+    def test_requires_permission(self):
+        self.client.login(username="reader", password="12345")
+        resp = self.client.get(reverse('catalog-export', args=['books', 'csv']))
+        self.assertEqual(resp.status_code, 302)
+
+    def test_copies_csv_is_streamed(self):
+        self.client.login(username="librarian", password="12345")
+        resp = self.client.get(reverse('catalog-export', args=['copies', 'csv']))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(resp.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['book_title'], "War and Peace")
+        self.assertEqual(rows[0]['author_last_name'], "Tolstoy")
+
+    def test_unknown_export_is_404(self):
+        self.client.login(username="librarian", password="12345")
+        resp = self.client.get(reverse('catalog-export', args=['authors', 'csv']))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_command_jsonl(self):
+        out = io.StringIO()
+        call_command('export_catalog', 'books', format='jsonl', stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[0]['title'], "War and Peace")
+        self.assertEqual(records[0]['author_first_name'], "Leo")
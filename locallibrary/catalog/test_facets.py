@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from .facets import compute_facets, get_facets, parse_filters
+from .models import Author, Book, BookInstance, Genre, Language
+
+
+def counts(facets, name):
+    return {value['label']: value['count'] for value in facets[name]}
+
+
+class FacetsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.smith = Author.objects.create(first_name="John", last_name="Smith")
+        cls.doe = Author.objects.create(first_name="Jane", last_name="Doe")
+        cls.fantasy = Genre.objects.create(name="Fantasy")
+        cls.drama = Genre.objects.create(name="Drama")
+        cls.english = Language.objects.create(name="English")
+        cls.french = Language.objects.create(name="French")
+        cls.books = [
+            Book.objects.create(title="Book %d" % num, summary="Summary", isbn=str(num),
+                                author=cls.smith if num < 3 else cls.doe,
+                                language=cls.english if num % 2 else cls.french)
+            for num in range(5)
+        ]
+        for book in cls.books[:3]:
+            book.genre.add(cls.fantasy)
+        cls.books[2].genre.add(cls.drama)
+        BookInstance.objects.bulk_create([
+            BookInstance(book=cls.books[0], imprint="Imprint", status='a'),
+            BookInstance(book=cls.books[1], imprint="Imprint", status='o'),
+            BookInstance(book=cls.books[2], imprint="Imprint", status='a'),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_filters(self):
+        self.assertEqual(parse_filters({'genre': '3', 'language': 'x', 'availability': 'a', 'author': ''}),
+                         {'genre': 3, 'availability': 'a'})
+
+    def test_counts(self):
+        with self.assertNumQueries(4):
+            facets = compute_facets({})
+        self.assertEqual(counts(facets, 'genre'), {"Drama": 1, "Fantasy": 3})
+        self.assertEqual(counts(facets, 'language'), {"English": 2, "French": 3})
+        self.assertEqual(counts(facets, 'author'), {"Smith, John": 3, "Doe, Jane": 2})
+        self.assertEqual(counts(facets, 'availability'), {"Available": 2, "On Loan": 1})
+
+    def test_counts_ignore_own_selection(self):
+        facets = compute_facets({'genre': self.fantasy.pk, 'language': self.french.pk})
+        # Жанры считаются только среди книг на французском, языки - только среди фэнтези
+        self.assertEqual(counts(facets, 'genre'), {"Drama": 1, "Fantasy": 2})
+        self.assertEqual(counts(facets, 'language'), {"English": 1, "French": 2})
+        self.assertEqual(counts(facets, 'author'), {"Smith, John": 2})
+
+    def test_cache_invalidation(self):
+        get_facets({})
+        with self.assertNumQueries(0):
+            get_facets({})
+        self.books[4].genre.add(self.drama)
+        self.assertEqual(counts(get_facets({}), 'genre'), {"Drama": 2, "Fantasy": 3})
+        BookInstance.objects.filter(book=self.books[1]).update(status='a')
+        self.assertEqual(counts(get_facets({}), 'availability'), {"Available": 3})
+        self.drama.name = "Tragedy"
+        self.drama.save()
+        self.assertIn("Tragedy", counts(get_facets({}), 'genre'))
+
+    def test_book_list(self):
+        resp = self.client.get(reverse('books'), {'genre': self.fantasy.pk, 'availability': 'a'})
+        self.assertEqual([book.title for book in resp.context['book_list']], ["Book 0", "Book 2"])
+        self.assertEqual(resp.context['filter_query'], '&genre=%d&availability=a' % self.fantasy.pk)
+        genre = resp.context['facets'][0]
+        self.assertTrue(genre['selected'])
+        self.assertEqual(genre['clear_url'], '?availability=a')
+        self.assertContains(resp, '<strong>Fantasy</strong> (2)')
+
+        resp = self.client.get(reverse('books'), {'author': self.doe.pk, 'sort': 'available'})
+        self.assertEqual([book.title for book in resp.context['book_list']], ["Book 3", "Book 4"])
+        self.assertContains(resp, 'href="?language=%d&amp;author=%d&amp;sort=available"' % (self.french.pk,
+                                                                                             self.doe.pk))
@@ -0,0 +1,55 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from .models import Author, Book, BookInstance, Genre, Language, LoanEvent
+from .search import SearchResults
+
+
+class ImportCatalogCommandTest(TestCase):
+    def import_file(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        call_command('import_catalog', f.name, stdout=io.StringIO(), stderr=io.StringIO(), **options)
+
+    def test_import_jsonl(self):
+        Author.objects.create(first_name="John", last_name="Tolkien")
+        records = [
+            {"type": "genre", "name": "Fantasy"},
+            {"type": "book", "title": "The Hobbit", "isbn": "9780261102217", "author_first_name": "John",
+             "author_last_name": "Tolkien", "genres": ["Fantasy", "Adventure"], "language": "en"},
+            {"type": "copy", "book_isbn": "9780261102217", "imprint": "HarperCollins", "status": "a"},
+            {"type": "copy", "book_isbn": "9780261102217", "imprint": "HarperCollins", "status": "o",
+             "due_back": "2030-01-01"},
+        ]
+        self.import_file('\n'.join(json.dumps(record) for record in records), '.jsonl', batch_size=2)
+        book = Book.objects.get(isbn="9780261102217")
+        self.assertEqual(Author.objects.count(), 1)
+        self.assertEqual(book.author.last_name, "Tolkien")
+        self.assertEqual(book.language.name, "en")
+        self.assertEqual(sorted(genre.name for genre in book.genre.all()), ["Adventure", "Fantasy"])
+        self.assertEqual(book.bookinstance_set.count(), 2)
+        self.assertEqual((book.num_copies, book.num_available, book.num_on_loan), (2, 1, 1))
+        self.assertEqual(list(LoanEvent.objects.values_list('copy__status', 'kind', 'book', 'due_back')),
+                         [('o', LoanEvent.CHECKOUT, book.pk, datetime.date(2030, 1, 1))])
+        self.assertEqual([result.pk for result in SearchResults("hobbit")[0:10]], [book.pk])
+
+    def test_import_csv_is_idempotent_for_books(self):
+        content = ("type,title,isbn,author_first_name,author_last_name,genres,book_isbn,imprint,status\n"
+                   "book,War and Peace,9785170878871,Leo,Tolstoy,Novel;History,,,\n"
+                   "copy,,,,,,9785170878871,Imprint,m\n")
+        self.import_file(content, '.csv')
+        self.import_file(content, '.csv')
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(Genre.objects.count(), 2)
+        self.assertEqual(BookInstance.objects.count(), 2)
+        self.assertEqual(Language.objects.count(), 0)
+
+    def test_unknown_book_is_error(self):
+        with self.assertRaises(CommandError):
+            self.import_file(json.dumps({"type": "copy", "book_isbn": "missing"}), '.jsonl')
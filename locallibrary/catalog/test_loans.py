@@ -0,0 +1,260 @@
+import datetime
+import threading
+import time
+import uuid
+from unittest import mock
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from .loans import NOT_FOUND, NOT_ON_LOAN, RENEWED, LoanConflict, LoanError, checkout, renew, renew_many, return_copy
+from .models import Author, Book, BookInstance, LoanEvent
+from .stats import get_stats
+
+
+class LoanServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(title="Book", summary="Summary", isbn="1", author=author)
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+        cls.other = User.objects.create_user(username='other', password='12345')
+
+    def setUp(self):
+        cache.clear()
+        self.copy = BookInstance.objects.create(book=self.book, imprint="Imprint", status='a')
+
+    def test_checkout_and_return(self):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        checkout(self.copy, self.reader, due_back)
+        stored = BookInstance.objects.get(pk=self.copy.pk)
+        self.assertEqual((stored.status, stored.borrower, stored.due_back, stored.version),
+                         ('o', self.reader, due_back, 1))
+        self.assertEqual(self.copy.version, 1)
+
+        return_copy(self.copy)
+        stored = BookInstance.objects.get(pk=self.copy.pk)
+        self.assertEqual((stored.status, stored.borrower, stored.due_back, stored.version), ('a', None, None, 2))
+
+    def test_checkout_is_a_single_update(self):
+        # Один условный UPDATE экземпляра, изменение счетчиков книги, запись в журнал выдач и оценки популярности
+        # книги и автора (запрос автора и жанров и по одному upsert на таблицу) в той же транзакции
+        # (SAVEPOINT и RELEASE)
+        with self.assertNumQueries(8):
+            checkout(self.copy, self.reader)
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual((book.num_available, book.num_on_loan), (0, 1))
+
+    def test_stale_copy_is_rejected(self):
+        stale = BookInstance.objects.get(pk=self.copy.pk)
+        checkout(self.copy, self.reader)
+        with self.assertRaises(LoanConflict):
+            checkout(stale, self.other)
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).borrower, self.reader)
+
+    def test_stale_save_is_rejected(self):
+        stale = BookInstance.objects.get(pk=self.copy.pk)
+        checkout(self.copy, self.reader)
+        stale.imprint = "Other"
+        with self.assertRaises(LoanConflict):
+            stale.save()
+        stored = BookInstance.objects.get(pk=self.copy.pk)
+        self.assertEqual((stored.status, stored.borrower, stored.version, stored.imprint),
+                         ('o', self.reader, 1, "Imprint"))
+        # Сохранение актуального экземпляра проходит и увеличивает версию
+        stored.imprint = "Other"
+        stored.save()
+        self.assertEqual((stored.version, BookInstance.objects.get(pk=self.copy.pk).version), (2, 2))
+
+    def test_failed_checkout_leaves_copy_unchanged(self):
+        with mock.patch.object(LoanEvent, 'save', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                checkout(self.copy, self.reader)
+        self.assertEqual((self.copy.status, self.copy.borrower_id, self.copy.version), ('a', None, 0))
+        stored = BookInstance.objects.get(pk=self.copy.pk)
+        self.assertEqual((stored.status, stored.version), ('a', 0))
+        # После отката тот же экземпляр выдается без конфликта версий
+        checkout(self.copy, self.reader)
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).version, 1)
+
+    def test_renew_does_not_overwrite_concurrent_renewal(self):
+        checkout(self.copy, self.reader)
+        stale = BookInstance.objects.get(pk=self.copy.pk)
+        renew(self.copy, datetime.date.today() + datetime.timedelta(days=10))
+        with self.assertRaises(LoanConflict):
+            renew(stale, datetime.date.today() + datetime.timedelta(days=20))
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).due_back,
+                         datetime.date.today() + datetime.timedelta(days=10))
+
+    def test_wrong_status(self):
+        with self.assertRaises(LoanError):
+            return_copy(self.copy)
+        with self.assertRaises(LoanError):
+            renew(self.copy, datetime.date.today())
+
+    def test_available_counter_follows_loans(self):
+        self.assertEqual(get_stats()['num_instances_available'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.copy, self.reader)
+        self.assertEqual(get_stats()['num_instances_available'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            return_copy(self.copy)
+        self.assertEqual(get_stats()['num_instances_available'], 1)
+
+
+class BulkRenewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book = Book.objects.create(title="Book", summary="Summary", isbn="1", author=author)
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        cls.loaned = BookInstance.objects.bulk_create([
+            BookInstance(book=cls.book, imprint="Imprint", status='o', borrower=cls.reader,
+                         due_back=datetime.date.today()) for _ in range(3)
+        ])
+        cls.available = BookInstance.objects.create(book=cls.book, imprint="Imprint", status='a')
+
+    def test_renew_many(self):
+        missing = uuid.uuid4()
+        results = renew_many([copy.pk for copy in self.loaned] + [self.available.pk, missing], self.due_back)
+        self.assertEqual(results, {**{copy.pk: RENEWED for copy in self.loaned},
+                                   self.available.pk: NOT_ON_LOAN, missing: NOT_FOUND})
+        self.assertEqual(set(BookInstance.objects.filter(status='o').values_list('due_back', 'version')),
+                         {(self.due_back, 1)})
+        self.assertIsNone(BookInstance.objects.get(pk=self.available.pk).due_back)
+
+    def test_renew_many_is_one_update_per_batch(self):
+        copies = BookInstance.objects.bulk_create([
+            BookInstance(book=self.book, imprint="Imprint", status='o', due_back=datetime.date.today())
+            for _ in range(10000)
+        ])
+        batches = -(-len(copies) // connection.ops.bulk_batch_size(['pk'], copies))
+        # SELECT ... FOR UPDATE, UPDATE и запись событий на порцию плюс SAVEPOINT и RELEASE
+        with self.assertNumQueries(3 * batches + 2):
+            started = time.perf_counter()
+            results = renew_many([copy.pk for copy in copies], self.due_back)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(list(results.values()).count(RENEWED), len(copies))
+        self.assertLess(elapsed, 1)
+        self.assertEqual(LoanEvent.objects.filter(kind=LoanEvent.RENEW).count(), len(copies))
+
+    def test_json_api(self):
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(reverse('renew-books-librarian'), content_type='application/json', data={
+            'copies': [str(self.loaned[0].pk), str(self.available.pk)], 'renewal_date': self.due_back.isoformat(),
+        })
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['results'], {str(self.loaned[0].pk): RENEWED, str(self.available.pk): NOT_ON_LOAN})
+
+    def test_json_api_uses_renewal_rules(self):
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(reverse('renew-books-librarian'), content_type='application/json', data={
+            'copies': [str(self.loaned[0].pk)], 'renewal_date': datetime.date.today().isoformat(),
+        })
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('renewal_date', resp.json()['errors'])
+        self.assertEqual(BookInstance.objects.get(pk=self.loaned[0].pk).version, 0)
+
+    def test_form(self):
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(reverse('renew-books-librarian'), {
+            'copies': '\n'.join(str(copy.pk) for copy in self.loaned), 'renewal_date': self.due_back,
+        })
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(set(resp.context['results'].values()), {RENEWED})
+
+    def test_requires_permission(self):
+        self.client.login(username='reader', password='12345')
+        resp = self.client.get(reverse('renew-books-librarian'))
+        self.assertEqual(resp.status_code, 302)
+
+
+class LoanConcurrencyTest(TransactionTestCase):
+    """
+    Много потоков одновременно выдают, продлевают и возвращают одни и те же экземпляры
+    """
+    threads = 8
+    attempts = 25
+
+    def setUp(self):
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        book = Book.objects.create(title="Book", summary="Summary", isbn="1", author=author)
+        self.readers = [User.objects.create_user(username='reader%d' % num) for num in range(self.threads)]
+        self.copies = [BookInstance.objects.create(book=book, imprint="Imprint", status='a') for _ in range(3)]
+
+    def run_threads(self, target):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def run(num):
+            try:
+                barrier.wait()
+                target(num)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(num,)) for num in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def retry(self, operation, attempts=50, delay=0.01):
+        # Параллельная запись в SQLite может получить отказ блокировки, это не конфликт версий.
+        # Постоянная ошибка блокировки после attempts попыток проваливает тест, а не зацикливает его
+        for attempt in range(attempts):
+            try:
+                return operation()
+            except OperationalError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(delay * (attempt + 1))
+
+    def test_no_double_loans(self):
+        loans = []
+
+        def borrow(num):
+            for copy in self.retry(lambda: list(BookInstance.objects.filter(pk__in=[c.pk for c in self.copies]))):
+                try:
+                    self.retry(lambda: checkout(copy, self.readers[num]))
+                except LoanError:
+                    continue
+                loans.append((copy.pk, num))
+
+        self.run_threads(borrow)
+        self.assertEqual(sorted(pk for pk, num in loans), sorted(copy.pk for copy in self.copies))
+        for pk, num in loans:
+            stored = BookInstance.objects.get(pk=pk)
+            self.assertEqual((stored.status, stored.borrower_id, stored.version), ('o', self.readers[num].pk, 1))
+
+    def test_no_lost_updates(self):
+        successes = []
+
+        def churn(num):
+            for attempt in range(self.attempts):
+                copy = self.retry(lambda: BookInstance.objects.get(pk=self.copies[attempt % len(self.copies)].pk))
+                operation = {
+                    'a': lambda: checkout(copy, self.readers[num]),
+                    'o': lambda: renew(copy, copy.due_back + datetime.timedelta(days=1)),
+                }[copy.status]
+                if copy.status == 'o' and attempt % 2:
+                    operation = lambda: return_copy(copy)
+                try:
+                    self.retry(operation)
+                except LoanConflict:
+                    continue
+                successes.append(copy.pk)
+
+        self.run_threads(churn)
+        self.assertTrue(successes)
+        # Каждая успешная операция увеличила версию ровно на единицу, ни одна не была затерта
+        for copy in self.copies:
+            stored = BookInstance.objects.get(pk=copy.pk)
+            self.assertEqual(stored.version, successes.count(copy.pk))
@@ -0,0 +1,95 @@
+import datetime
+from io import StringIO
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from .models import Author, Book, BookInstance, OverdueByBook, OverdueByBorrower
+from .overdue import compute_overdue
+
+
+class OverdueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        author = Author.objects.create(first_name="John", last_name="Smith")
+        cls.book1 = Book.objects.create(title="Book 1", summary="Summary", isbn="1", author=author)
+        cls.book2 = Book.objects.create(title="Book 2", summary="Summary", isbn="2", author=author)
+        cls.reader1 = User.objects.create_user(username='reader1', password='12345')
+        cls.reader2 = User.objects.create_user(username='reader2', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+        def copy(book, status, days, borrower=None):
+            return BookInstance(book=book, imprint="Imprint", status=status, borrower=borrower,
+                                due_back=cls.today + datetime.timedelta(days=days))
+
+        BookInstance.objects.bulk_create([
+            copy(cls.book1, 'o', -10, cls.reader1),
+            copy(cls.book1, 'o', -3, cls.reader1),
+            copy(cls.book2, 'o', -5, cls.reader1),
+            copy(cls.book2, 'o', -1, cls.reader2),
+            copy(cls.book2, 'o', -2),
+            # Не просрочены: срок сегодня или позже, либо экземпляр не выдан
+            copy(cls.book1, 'o', 0, cls.reader2),
+            copy(cls.book1, 'o', 5, cls.reader2),
+            copy(cls.book2, 'a', -7),
+        ])
+
+    def test_overdue_queryset_matches_property(self):
+        overdue = set(BookInstance.objects.overdue().values_list('pk', flat=True))
+        expected = {copy.pk for copy in BookInstance.objects.filter(status='o') if copy.is_overdue}
+        self.assertEqual(overdue, expected)
+        self.assertEqual(len(overdue), 5)
+
+    def test_compute_overdue(self):
+        with self.assertNumQueries(7):
+            result = compute_overdue()
+        self.assertEqual(result, {'copies': 5, 'borrowers': 2, 'books': 2})
+
+        borrowers = {row.borrower_id: (row.num_overdue, row.oldest_due_back) for row in OverdueByBorrower.objects.all()}
+        self.assertEqual(borrowers, {
+            self.reader1.pk: (3, self.today - datetime.timedelta(days=10)),
+            self.reader2.pk: (1, self.today - datetime.timedelta(days=1)),
+        })
+        books = {row.book_id: (row.num_overdue, row.oldest_due_back) for row in OverdueByBook.objects.all()}
+        self.assertEqual(books, {
+            self.book1.pk: (2, self.today - datetime.timedelta(days=10)),
+            self.book2.pk: (3, self.today - datetime.timedelta(days=5)),
+        })
+
+    def test_compute_overdue_replaces_summary(self):
+        compute_overdue()
+        compute_overdue(self.today - datetime.timedelta(days=4))
+        self.assertEqual(OverdueByBorrower.objects.get().num_overdue, 2)
+        self.assertEqual(OverdueByBook.objects.count(), 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compute_overdue', '--date', self.today.isoformat(), stdout=out)
+        self.assertIn("Просрочено экземпляров: 5", out.getvalue())
+        self.assertEqual(OverdueByBorrower.objects.count(), 2)
+
+    def test_view_requires_permission(self):
+        self.client.login(username='reader1', password='12345')
+        resp = self.client.get(reverse('overdue'))
+        self.assertEqual(resp.status_code, 403)
+
+    def test_view_lists_overdue_copies(self):
+        compute_overdue()
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.get(reverse('overdue'))
+        self.assertEqual(resp.status_code, 200)
+        due_dates = [copy.due_back for copy in resp.context['bookinstance_list']]
+        self.assertEqual(len(due_dates), 5)
+        self.assertEqual(due_dates, sorted(due_dates))
+        self.assertEqual(resp.context['borrower_summary'][0].borrower, self.reader1)
+        self.assertEqual(resp.context['book_summary'][0].book, self.book2)
+
+    def test_view_lists_copies_without_book(self):
+        BookInstance.objects.create(book=None, imprint="Orphan imprint", status='o', borrower=self.reader2,
+                                    due_back=self.today - datetime.timedelta(days=4))
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.get(reverse('overdue'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Orphan imprint")
@@ -0,0 +1,100 @@
+import datetime
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .loans import checkout, return_copy
+from .models import (POPULARITY_HALF_LIFE_DAYS, Author, AuthorPopularity, Book, BookInstance, BookPopularity, Genre,
+                     GenrePopularity, Language, popularity_weight)
+from .popularity import compute_popular, rebuild_popularity, top_authors, top_books, top_genres
+
+
+class PopularityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.smith = Author.objects.create(first_name="John", last_name="Smith")
+        cls.doe = Author.objects.create(first_name="Jane", last_name="Doe")
+        cls.fantasy = Genre.objects.create(name="Fantasy")
+        cls.drama = Genre.objects.create(name="Drama")
+        cls.english = Language.objects.create(name="English")
+        cls.books = [Book.objects.create(title="Book %d" % num, summary="Summary", isbn=str(num),
+                                         author=cls.doe if num == 2 else cls.smith, language=cls.english)
+                     for num in range(3)]
+        cls.books[0].genre.set([cls.fantasy])
+        cls.books[1].genre.set([cls.fantasy, cls.drama])
+        cls.reader = User.objects.create_user(username='reader', password='12345')
+
+    def setUp(self):
+        cache.clear()
+
+    def circulate(self, book, count):
+        for _ in range(count):
+            copy = BookInstance.objects.create(book=book, imprint="Imprint", status='a')
+            return_copy(checkout(copy, self.reader))
+
+    def test_checkouts_update_scores(self):
+        self.circulate(self.books[1], 3)
+        self.circulate(self.books[2], 1)
+        self.assertEqual([book.title for book in top_books()], ["Book 1", "Book 2"])
+        self.assertAlmostEqual(top_books()[0].popularity_score, 3)
+        self.assertEqual([(author, round(author.popularity_score)) for author in top_authors()],
+                         [(self.smith, 3), (self.doe, 1)])
+        self.assertEqual(set(GenrePopularity.objects.values_list('genre', 'score')),
+                         {(self.fantasy.pk, BookPopularity.objects.get(book=self.books[1]).score),
+                          (self.drama.pk, BookPopularity.objects.get(book=self.books[1]).score)})
+        self.assertEqual([book.title for book in top_books(genre=self.drama)], ["Book 1"])
+
+    def test_scores_decay(self):
+        self.circulate(self.books[0], 2)
+        later = timezone.localdate() + datetime.timedelta(days=POPULARITY_HALF_LIFE_DAYS)
+        self.assertAlmostEqual(top_books(today=later)[0].popularity_score, 1)
+        # Выдача через период полураспада весит вдвое больше прежних
+        self.assertAlmostEqual(popularity_weight(later) / popularity_weight(timezone.localdate()), 2)
+
+    def test_rebase_epoch(self):
+        self.circulate(self.books[0], 2)
+        self.circulate(self.books[1], 1)
+        decayed = [(book, book.popularity_score) for book in top_books()]
+        self.assertGreater(BookPopularity.objects.get(book=self.books[0]).score, 2 ** 50)
+        # Перенос начала отсчета на сегодня: веса сегодняшних выдач снова 1, затухшие оценки прежние
+        with override_settings(CATALOG_POPULARITY_EPOCH=timezone.localdate().isoformat()):
+            rebuild_popularity()
+            self.assertAlmostEqual(BookPopularity.objects.get(book=self.books[0]).score, 2)
+            rebased = [(book, book.popularity_score) for book in top_books()]
+        self.assertEqual([book for book, score in rebased], [book for book, score in decayed])
+        for (book, score), (_, expected) in zip(rebased, decayed):
+            self.assertAlmostEqual(score, expected)
+
+    def test_compute_popular(self):
+        self.circulate(self.books[0], 2)
+        self.circulate(self.books[1], 1)
+        with self.assertNumQueries(6):
+            popular = compute_popular()
+        self.assertEqual([genre for genre, books in popular['genres']], [self.fantasy, self.drama])
+        self.assertEqual(dict(popular['genres'])[self.fantasy], self.books[:2])
+        self.assertEqual(popular['languages'], [(self.english, self.books[:2])])
+
+    def test_rebuild(self):
+        self.circulate(self.books[0], 2)
+        self.circulate(self.books[1], 1)
+        scores = set(BookPopularity.objects.values_list('book', 'score'))
+        self.books[0].genre.set([self.drama])
+        self.assertEqual(rebuild_popularity(batch_size=2), 3)
+        self.assertEqual(set(BookPopularity.objects.values_list('book', 'score')), scores)
+        self.assertEqual([genre.name for genre in top_genres()], ["Drama", "Fantasy"])
+        self.assertEqual(AuthorPopularity.objects.get().author, self.smith)
+        out = StringIO()
+        call_command('rebuild_popularity', stdout=out)
+        self.assertIn('Учтено выдач: 3', out.getvalue())
+
+    def test_pages(self):
+        self.circulate(self.books[0], 1)
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.context['popular']['books'], [self.books[0]])
+        self.assertContains(resp, 'Fantasy')
+        resp = self.client.get(reverse('books'))
+        self.assertEqual(resp.context['popular_books'], [self.books[0]])
+        self.assertContains(resp, 'Popular this month')
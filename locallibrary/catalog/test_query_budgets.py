@@ -0,0 +1,99 @@
+import time
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.template.backends.django import Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .datagen import BORROWER_PASSWORD, generate_catalog
+from .middleware import view_metrics
+from .models import Author, Book
+from .testing import QueryBudgetMixin
+
+
+class CatalogQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Бюджеты SQL-запросов страниц каталога при холодном кэше. Если изменение представления или шаблона
+    добавляет запросы, тест падает
+    """
+    query_budgets = {
+        # Счетчики из одного запроса, создание сессии посетителя (проверка, SAVEPOINT, INSERT, RELEASE)
+        # и списки популярного: книги, авторы, жанры и языки (по два запроса - сами группы и их книги)
+        'index': 11,
+        # Далее у посетителя уже есть сессия, ее загрузка входит в бюджет
+        # Сессия, страница книг с числом книг и счетчики фасетов (по одному запросу на фасет)
+        'books': 7,
+        'book-detail': 5,
+        'authors': 3,
+        # Автор со сводкой по книгам, страница его книг и их жанры
+        'author-detail': 4,
+        # Сессия, пользователь, сводка выдач читателя, страница выдач с книгами и авторами и история выдач
+        'my-borrowed': 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog(authors=30, books=60, genres=5, copies=400, borrowers=3)
+        cls.borrower = User.objects.filter(bookinstance__status='o').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages(self):
+        book = Book.objects.first()
+        author = Author.objects.filter(book__isnull=False).first()
+        for url in (reverse('index'), reverse('books'), reverse('books') + '?page=3', book.get_absolute_url(),
+                    reverse('authors'), author.get_absolute_url()):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertWithinQueryBudget(resp)
+
+    def test_borrowed_books(self):
+        self.client.login(username=self.borrower.username, password=BORROWER_PASSWORD)
+        resp = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertWithinQueryBudget(resp)
+
+
+class QueryInstrumentationMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username="admin", password="12345", is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        view_metrics.reset()
+
+    @override_settings(CATALOG_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        resp = self.client.get(reverse('books'))
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('total;dur=', resp['Server-Timing'])
+
+    @override_settings(CATALOG_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('books')))
+
+    def test_render_time(self):
+        render = Template.render
+
+        def slow_render(template, *args, **kwargs):
+            time.sleep(0.02)
+            return render(template, *args, **kwargs)
+
+        # Список книг отрисовывается внутри CachedViewMixin, домашняя страница - после представления
+        with mock.patch.object(Template, 'render', slow_render):
+            for url in (reverse('books'), reverse('index')):
+                self.assertGreaterEqual(self.client.get(url).query_stats['render_ms'], 20)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        self.client.login(username="admin", password="12345")
+        metrics = self.client.get(reverse('catalog-metrics')).json()
+        self.assertEqual(metrics['books']['requests'], 2)
+        self.assertIn('avg_queries', metrics['books'])
+
+    def test_metrics_endpoint_requires_staff(self):
+        resp = self.client.get(reverse('catalog-metrics'))
+        self.assertEqual(resp.status_code, 302)
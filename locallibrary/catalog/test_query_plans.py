@@ -0,0 +1,68 @@
+import datetime
+import unittest
+from django.test import TestCase
+from django.db import connection
+from django.contrib.auth.models import User
+from .models import Author, Book, BookInstance
+from .views import BookListView, AuthorListView
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Планы запросов проверяются только для SQLite")
+class QueryPlanTest(TestCase):
+    """
+    Проверяет, что основные запросы каталога на большом наборе данных используют индексы, а не полный просмотр таблиц
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.borrowers = User.objects.bulk_create([User(username=f"user{num}") for num in range(50)])
+        authors = Author.objects.bulk_create([
+            Author(first_name=f"First {num}", last_name=f"Last {num % 500}") for num in range(2000)
+        ])
+        books = Book.objects.bulk_create([
+            Book(title=f"Title {num}", summary="Summary", isbn=f"{num:013d}", author=authors[num % len(authors)])
+            for num in range(5000)
+        ])
+        today = datetime.date.today()
+        BookInstance.objects.bulk_create([
+            BookInstance(book=books[num % len(books)], imprint="Imprint", status='maor'[num % 4],
+                         due_back=today + datetime.timedelta(days=num % 60),
+                         borrower=cls.borrowers[num % len(cls.borrowers)] if num % 4 == 1 else None)
+            for num in range(20000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_status_filter(self):
+        self.assertUsesIndex(BookInstance.objects.filter(status='r')[:10], 'bookinst_status_due_idx')
+
+    def test_loaned_books_by_user(self):
+        queryset = BookInstance.objects.filter(borrower=self.borrowers[0], status='o').order_by('due_back')
+        self.assertUsesIndex(queryset, 'bookinst_borrower_idx')
+
+    def test_default_ordering(self):
+        self.assertUsesIndex(BookInstance.objects.all()[:10], 'bookinst_due_back_idx')
+
+    def test_on_loan_copies(self):
+        self.assertUsesIndex(BookInstance.objects.filter(status='o').order_by('due_back')[:10],
+                             'bookinst_status_due_idx')
+
+    def test_available_copies_of_book(self):
+        book = Book.objects.first()
+        self.assertUsesIndex(BookInstance.objects.filter(book=book, status='a').order_by(), 'bookinst_available_idx')
+
+    def test_isbn_lookup(self):
+        self.assertUsesIndex(Book.objects.filter(isbn='0000000001234'), 'book_isbn_idx')
+
+    def test_book_list_ordering(self):
+        self.assertUsesIndex(Book.objects.order_by(*BookListView.ordering)[:10], 'book_title_id_idx')
+
+    def test_author_list_ordering(self):
+        self.assertUsesIndex(Author.objects.order_by(*AuthorListView.ordering)[:10], 'author_name_idx')
+
+    def test_overdue_copies(self):
+        self.assertUsesIndex(BookInstance.objects.overdue().order_by('due_back'), 'bookinst_status_due_idx')
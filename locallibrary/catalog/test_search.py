@@ -0,0 +1,64 @@
+from django.test import TestCase
+from django.urls import reverse
+from .models import Author, Book
+from .search import SearchResults, DatabaseBackend, get_backend
+
+
+class BookSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tolkien = Author.objects.create(first_name="John", last_name="Tolkien")
+        cls.hobbit = Book.objects.create(title="The Hobbit", summary="A journey to the Lonely Mountain",
+                                         isbn="9780261102217", author=cls.tolkien)
+        cls.lotr = Book.objects.create(title="The Lord of the Rings", summary="The Hobbit sequel",
+                                       isbn="9780261103252", author=cls.tolkien)
+        cls.other = Book.objects.create(title="Война и мир", summary="Роман-эпопея", isbn="9785170878871")
+
+    def search_ids(self, query):
+        return [book.pk for book in SearchResults(query)[0:10]]
+
+    def test_title_match_ranked_first(self):
+        self.assertEqual(self.search_ids("hobbit"), [self.hobbit.pk, self.lotr.pk])
+
+    def test_prefix_match(self):
+        self.assertEqual(self.search_ids("hobb"), [self.hobbit.pk, self.lotr.pk])
+        self.assertEqual(self.search_ids("войн"), [self.other.pk])
+
+    def test_isbn_and_author_match(self):
+        self.assertEqual(self.search_ids("9785170878871"), [self.other.pk])
+        self.assertEqual(sorted(self.search_ids("tolkien")), sorted([self.hobbit.pk, self.lotr.pk]))
+
+    def test_index_follows_book_changes(self):
+        self.other.title = "Анна Каренина"
+        self.other.save()
+        self.assertEqual(self.search_ids("войн"), [])
+        self.assertEqual(self.search_ids("анна"), [self.other.pk])
+        self.other.delete()
+        self.assertEqual(self.search_ids("анна"), [])
+
+    def test_index_follows_author_changes(self):
+        self.tolkien.last_name = "Martin"
+        self.tolkien.save()
+        self.assertEqual(self.search_ids("tolkien"), [])
+        self.assertEqual(len(self.search_ids("martin")), 2)
+        self.tolkien.delete()
+        self.assertEqual(self.search_ids("martin"), [])
+
+    def test_database_backend(self):
+        results = SearchResults("hobb", backend=DatabaseBackend())
+        self.assertEqual(results.count(), 2)
+
+    def test_rebuild(self):
+        get_backend().rebuild()
+        self.assertEqual(SearchResults("the").count(), 2)
+
+    def test_search_view(self):
+        resp = self.client.get(reverse('search'), {'q': 'rings'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, 'catalog/book_search.html')
+        self.assertEqual(list(resp.context['book_list']), [self.lotr])
+
+    def test_empty_query(self):
+        resp = self.client.get(reverse('search'), {'q': '  '})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['book_list']), 0)
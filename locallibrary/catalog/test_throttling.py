@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from .throttling import CacheThrottleStore, LocalThrottleStore, parse_rate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/m'), (120, 2.0))
+        for rate in ('10', '0/s', 'x/m', '10/w'):
+            with self.assertRaises(ImproperlyConfigured):
+                parse_rate(rate)
+
+    def check_store(self, store, clock):
+        capacity, refill = parse_rate('3/m')
+        self.assertEqual([store.consume('a', capacity, refill) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.consume('a', capacity, refill), 20)
+        self.assertEqual(store.consume('b', capacity, refill), 0)
+        # За 20 секунд корзина пополняется одним токеном
+        clock.now += 20
+        self.assertEqual(store.consume('a', capacity, refill), 0)
+        self.assertGreater(store.consume('a', capacity, refill), 0)
+
+    def test_local_store(self):
+        clock = Clock()
+        self.check_store(LocalThrottleStore(clock=clock), clock)
+
+    def test_cache_store(self):
+        cache.clear()
+        clock = Clock()
+        self.check_store(CacheThrottleStore('default', clock=clock), clock)
+
+    def test_local_store_is_bounded(self):
+        clock = Clock()
+        store = LocalThrottleStore(max_buckets=2, clock=clock)
+        store.consume('a', 1, 1.0)
+        store.consume('b', 1, 1.0)
+        self.assertGreater(store.consume('a', 1, 1.0), 0)
+        # При переполнении забывается корзина, к которой дольше всего не обращались
+        store.consume('c', 1, 1.0)
+        self.assertEqual(list(store._buckets), ['a', 'c'])
+        for num in range(1000):
+            store.consume('ip%d' % num, 1, 1.0)
+        self.assertEqual(len(store._buckets), 2)
+
+
+@override_settings(CATALOG_THROTTLE_RATES={'books': {'ip': '2/m'}, 'my-borrowed': {'user': '1/m'}})
+class ThrottleMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='reader', password='12345')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ip_limit(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('books')).status_code, 200)
+        # Отклоненный запрос не загружает сессию и не обращается к базе данных
+        with self.assertNumQueries(0):
+            resp = self.client.get(reverse('books'))
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp['Retry-After'], '30')
+        # У другого адреса своя корзина, другие страницы не ограничены
+        self.assertEqual(self.client.get(reverse('books'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get(reverse('authors')).status_code, 200)
+
+    def test_user_limit(self):
+        self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 302)
+        self.client.login(username='reader', password='12345')
+        self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 429)
+
+    @override_settings(ROOT_URLCONF='locallibrary.asgi_urls')
+    async def test_async(self):
+        for _ in range(2):
+            await self.async_client.get(reverse('books'))
+        resp = await self.async_client.get(reverse('books'))
+        self.assertEqual(resp.status_code, 429)
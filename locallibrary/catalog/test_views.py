@@ -1,10 +1,16 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from .models import Author, Book, Genre, Language, BookInstance
 from django.urls import reverse
 import datetime
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .popularity import get_popular
+from .stats import compute_stats, get_stats
+from .visits import VISITS_CACHE_PREFIX, BufferedVisitCounter, get_visit_counter
 
 
 class AuthorListViewTest(TestCase):
@@ -16,6 +22,10 @@ class AuthorListViewTest(TestCase):
         for author_num in range(number_of_authors):
             Author.objects.create(first_name=f"Christian {author_num}", last_name=f"Surname {author_num}")
 
+    def setUp(self):
+        # Страницы каталога кэшируются для анонимных пользователей, каждый тест начинает с пустого кэша
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         resp = self.client.get('/catalog/authors/')
         self.assertEquals(resp.status_code, 200)
@@ -32,6 +42,74 @@ class AuthorListViewTest(TestCase):
         self.assertTrue(resp.context['is_paginated'] is True)
         self.assertTrue(len(resp.context["author_list"]) == 10)
 
+    def test_sort_by_number_of_books(self):
+        prolific = Author.objects.get(last_name="Surname 7")
+        for book_num in range(3):
+            Book.objects.create(title=f"Title {book_num}", summary="Summary", isbn="ABCDEFG", author=prolific)
+        Book.objects.create(title="Title", summary="Summary", isbn="ABCDEFG",
+                            author=Author.objects.get(last_name="Surname 3"))
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse("authors"), {'sort': 'books'})
+            counts = [(author.last_name, author.num_books) for author in resp.context['author_list']]
+        self.assertEqual(counts[:3], [("Surname 7", 3), ("Surname 3", 1), ("Surname 0", 0)])
+        self.assertContains(resp, '?page=2&amp;sort=books')
+
+
+class AuthorDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name="John", last_name="Smith")
+        genres = [Genre.objects.create(name="Fantasy"), Genre.objects.create(name="Drama")]
+        for book_num in range(12):
+            book = Book.objects.create(title=f"Title {book_num:02}", summary="Summary", isbn="ABCDEFG",
+                                       author=cls.author)
+            book.genre.set(genres[:book_num % 3])
+            for copy_num in range(book_num % 4):
+                BookInstance.objects.create(book=book, imprint="Imprint", status='a' if copy_num % 2 else 'o')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_books_with_availability(self):
+        resp = self.client.get(self.author.get_absolute_url())
+        self.assertEqual(resp.status_code, 200)
+        author = resp.context['author']
+        self.assertEqual((author.num_books, author.num_copies, author.num_available, author.num_on_loan),
+                         (12, 18, 6, 12))
+        books = resp.context['books_page']
+        self.assertEqual([book.title for book in books], [f"Title {num:02}" for num in range(10)])
+        self.assertContains(resp, '3 of 3 available', count=0)
+        self.assertContains(resp, '1 of 3 available')
+        self.assertContains(resp, 'Drama')
+        resp = self.client.get(self.author.get_absolute_url(), {'page': 2})
+        self.assertEqual(len(resp.context['books_page']), 2)
+
+    def test_query_count_does_not_depend_on_books(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.author.get_absolute_url())
+        for book_num in range(5):
+            book = Book.objects.create(title=f"Title A{book_num}", summary="Summary", isbn="ABCDEFG",
+                                       author=self.author)
+            book.genre.set(Genre.objects.all())
+            BookInstance.objects.create(book=book, imprint="Imprint", status='a')
+        cache.clear()
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            self.client.get(self.author.get_absolute_url())
+
+    def test_loan_invalidates_cached_page(self):
+        self.client.get(self.author.get_absolute_url())
+        BookInstance.objects.filter(status='o').update(status='a')
+        resp = self.client.get(self.author.get_absolute_url())
+        self.assertEqual(resp.context['author'].num_available, 18)
+
+    def test_loan_invalidates_cached_author_list(self):
+        self.client.get(reverse('authors'))
+        copy = BookInstance.objects.filter(status='a').first()
+        copy.status = 'o'
+        copy.save()
+        resp = self.client.get(reverse('authors'))
+        self.assertEqual(resp.context['author_list'][0].num_available, 5)
+
 
 class LoanedBookInstancesByUserListViewTest(TestCase):
 
@@ -241,4 +319,172 @@ class RenewBookInstancesViewTest(TestCase):
             'pk': self.test_bookinstance1.pk
         }), {"renewal_date": valid_date_in_future})
 
-        self.assertRedirects(resp, reverse('all-borrowed'))
\ No newline at end of file
+        self.assertRedirects(resp, reverse('all-borrowed'))
+
+
+class IndexViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name="John", last_name="Smith")
+        Genre.objects.create(name="Fantasy")
+        test_book = Book.objects.create(title="Book Title", summary="My book summary", isbn="ABCDEFG",
+                                        author=test_author)
+        for status in ('a', 'a', 'o'):
+            BookInstance.objects.create(book=test_book, imprint="Unlikely imprint 2016", status=status)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_are_correct(self):
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['num_books'], 1)
+        self.assertEqual(resp.context['num_instances'], 3)
+        self.assertEqual(resp.context['num_instances_available'], 2)
+        self.assertEqual(resp.context['num_authors'], 1)
+        self.assertEqual(resp.context['num_genres'], 1)
+
+    def test_counts_computed_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            compute_stats()
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_warm_cache_does_not_query_catalog(self):
+        get_stats()
+        get_popular()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('index'))
+        catalog_queries = [q['sql'] for q in ctx.captured_queries if 'catalog_' in q['sql']]
+        self.assertEqual(catalog_queries, [])
+
+    def test_counts_follow_model_changes(self):
+        get_stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = BookInstance.objects.filter(status='o').first()
+            copy.status = 'a'
+            copy.save()
+            Author.objects.create(first_name="Jane", last_name="Doe")
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(status='a').first().delete()
+        self.assertEqual(get_stats(), compute_stats())
+
+    @override_settings(CATALOG_VISIT_TRACKING='session')
+    def test_visits_counted_in_session(self):
+        for expected in range(3):
+            resp = self.client.get(reverse('index'))
+            self.assertEqual(resp.context['num_visits'], expected)
+        self.assertEqual(self.client.session['num_visits'], 3)
+
+    @override_settings(CATALOG_VISIT_TRACKING='buffered', CATALOG_VISIT_FLUSH_INTERVAL=3600)
+    def test_buffered_visits_do_not_write_session(self):
+        self.client.get(reverse('index'))
+        for expected in range(1, 4):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(reverse('index'))
+            self.assertEqual(resp.context['num_visits'], expected)
+            writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+            self.assertEqual(writes, [])
+        get_visit_counter().flush()
+        # В сессии осталось только первое посещение, когда сессии еще не было
+        self.assertEqual(self.client.session['num_visits'], 1)
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 4)
+
+    @override_settings(CATALOG_VISIT_TRACKING='buffered')
+    def test_buffered_flushes_add_up(self):
+        self.client.get(reverse('index'))
+        session_key = self.client.session.session_key
+        # Два процесса сервера с собственными буферами сбрасывают посещения одной сессии в общий кэш
+        counters = [BufferedVisitCounter(flush_interval=3600) for _ in range(2)]
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        for counter, visits in zip(counters, (2, 3)):
+            for _ in range(visits):
+                counter.record(request)
+        for counter in counters:
+            counter.flush()
+        self.assertEqual(cache.get(VISITS_CACHE_PREFIX + session_key), 6)
+
+
+class BookListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Создание 25 книг разных авторов, у части книг одинаковые заголовки
+        for book_num in range(25):
+            author = Author.objects.create(first_name=f"Christian {book_num}", last_name=f"Surname {book_num}")
+            Book.objects.create(title=f"Title {book_num % 7}", summary="Summary", isbn="ABCDEFG", author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pagination_is_ten(self):
+        resp = self.client.get(reverse('books'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.context['is_paginated'])
+        self.assertEqual(len(resp.context['book_list']), 10)
+
+    def test_authors_loaded_without_extra_queries(self):
+        resp = self.client.get(reverse('books'))
+        with self.assertNumQueries(0):
+            authors = [str(book.author) for book in resp.context['book_list']]
+        self.assertEqual(len(authors), 10)
+
+    def test_keyset_pages_match_ordering(self):
+        expected = list(Book.objects.order_by('title', 'id').values_list('id', flat=True))
+        resp = self.client.get(reverse('books'))
+        seen = [book.id for book in resp.context['book_list']]
+        cursor = resp.context['next_cursor']
+        while cursor:
+            resp = self.client.get(reverse('books'), {'after': cursor})
+            self.assertTrue(resp.context['is_keyset_page'])
+            seen.extend(book.id for book in resp.context['book_list'])
+            cursor = resp.context['page_obj'].next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_keyset_before_returns_previous_page(self):
+        resp = self.client.get(reverse('books'))
+        first = [book.id for book in resp.context['book_list']]
+        resp = self.client.get(reverse('books'), {'after': resp.context['next_cursor']})
+        resp = self.client.get(reverse('books'), {'before': resp.context['page_obj'].previous_cursor})
+        self.assertEqual([book.id for book in resp.context['book_list']], first)
+
+    def test_invalid_cursor_is_404(self):
+        resp = self.client.get(reverse('books'), {'after': 'not-a-cursor'})
+        self.assertEqual(resp.status_code, 404)
+
+
+class BookDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name="John", last_name="Smith")
+        test_language = Language.objects.create(name="en")
+        cls.test_book = Book.objects.create(title="Book Title", summary="My book summary", isbn="ABCDEFG",
+                                            author=test_author, language=test_language)
+        cls.test_book.genre.set([Genre.objects.create(name="Fantasy"), Genre.objects.create(name="Drama")])
+        # Создание 45 экземпляров книги в разных статусах
+        for copy_num in range(45):
+            BookInstance.objects.create(book=cls.test_book, imprint="Unlikely imprint 2016",
+                                        status='a' if copy_num % 3 else 'o')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_copies_are_paginated(self):
+        resp = self.client.get(self.test_book.get_absolute_url())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['copies_page']), 20)
+        self.assertEqual(resp.context['num_copies'], 45)
+        resp = self.client.get(self.test_book.get_absolute_url(), {'page': 3})
+        self.assertEqual(len(resp.context['copies_page']), 5)
+
+    def test_status_summary(self):
+        resp = self.client.get(self.test_book.get_absolute_url())
+        summary = {row['status']: row['count'] for row in resp.context['status_summary']}
+        self.assertEqual(summary, {'a': 30, 'o': 15})
+
+    def test_query_count_does_not_depend_on_copies(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.test_book.get_absolute_url())
+        for copy_num in range(30):
+            BookInstance.objects.create(book=self.test_book, imprint="Unlikely imprint 2016", status='m')
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            self.client.get(self.test_book.get_absolute_url())
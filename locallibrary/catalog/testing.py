@@ -0,0 +1,20 @@
+class QueryBudgetMixin:
+    """
+    Примесь для TestCase: query_budgets задает максимальное число SQL-запросов для каждого имени URL.
+    Статистику запроса собирает QueryInstrumentationMiddleware, поэтому в бюджет входят и запросы
+    сессии, аутентификации и отрисовки шаблона. Повторы одного запроса (признак N+1) по умолчанию запрещены
+    """
+    query_budgets = {}
+    duplicate_budgets = {}
+
+    def assertWithinQueryBudget(self, response):
+        stats = response.query_stats
+        view_name = stats['view']
+        self.assertIn(view_name, self.query_budgets, "Для %s не задан бюджет запросов" % view_name)
+        self.assertLessEqual(stats['queries'], self.query_budgets[view_name],
+                             "%s выполняет %d SQL-запросов при бюджете %d" % (
+                                 view_name, stats['queries'], self.query_budgets[view_name]))
+        duplicate_budget = self.duplicate_budgets.get(view_name, 0)
+        self.assertLessEqual(stats['duplicate_queries'], duplicate_budget,
+                             "%s повторяет один и тот же SQL-запрос %d раз" % (
+                                 view_name, stats['duplicate_queries']))
@@ -0,0 +1,179 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+# Префикс ключей корзин в общем кэше
+THROTTLE_CACHE_PREFIX = 'catalog:throttle:'
+
+# Длительность периодов в ограничениях вида 'число/период'
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    :param rate: Ограничение вида '60/m' - не больше 60 запросов в минуту
+    :return: Емкость корзины (допустимый всплеск) и скорость пополнения в токенах за секунду
+    """
+    try:
+        count, period = rate.split('/')
+        count = int(count)
+        seconds = RATE_PERIODS[period]
+    except (ValueError, KeyError):
+        raise ImproperlyConfigured("Неправильное ограничение частоты запросов: %r" % rate)
+    if count < 1:
+        raise ImproperlyConfigured("Неправильное ограничение частоты запросов: %r" % rate)
+    return count, count / seconds
+
+
+def take_token(state, capacity, refill, now):
+    """
+    Пополняет корзину за прошедшее время и забирает из нее токен
+    :param state: Число токенов и время последнего обращения или None для новой (полной) корзины
+    :return: Новое состояние корзины и время ожидания следующего токена (0, если токен взят)
+    """
+    tokens, updated = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * refill)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill
+
+
+class LocalThrottleStore:
+    """
+    Корзины в памяти процесса. Каждый процесс сервера ограничивает запросы независимо. Корзин хранится
+    не больше max_buckets: при переполнении забывается корзина, к которой дольше всего не обращались
+    (она скорее всего уже заполнилась), так что память и время запроса не растут при переборе адресов
+    """
+    def __init__(self, max_buckets=10000, clock=time.monotonic):
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill):
+        """
+        :return: Время ожидания (в секундах) или 0, если запрос разрешен
+        """
+        now = self.clock()
+        with self._lock:
+            state, wait = take_token(self._buckets.pop(key, None), capacity, refill, now)
+            # Корзина становится последней в порядке обращений
+            self._buckets[key] = state
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def aconsume(self, key, capacity, refill):
+        # Корзины в памяти не требуют ввода-вывода
+        return self.consume(key, capacity, refill)
+
+
+class CacheThrottleStore:
+    """
+    Корзины в кэше, общем для всех процессов (например, Redis или Memcached). Чтение и запись корзины
+    не атомарны, поэтому при одновременных запросах ограничение может быть превышено на несколько запросов
+    """
+    def __init__(self, alias, clock=time.time):
+        self.cache = caches[alias]
+        self.clock = clock
+
+    def consume(self, key, capacity, refill):
+        key = THROTTLE_CACHE_PREFIX + key
+        state, wait = take_token(self.cache.get(key), capacity, refill, self.clock())
+        self.cache.set(key, state, math.ceil(capacity / refill))
+        return wait
+
+    async def aconsume(self, key, capacity, refill):
+        key = THROTTLE_CACHE_PREFIX + key
+        state, wait = take_token(await self.cache.aget(key), capacity, refill, self.clock())
+        await self.cache.aset(key, state, math.ceil(capacity / refill))
+        return wait
+
+
+def get_throttle_store():
+    """
+    :return: Хранилище корзин по настройке CATALOG_THROTTLE_STORE: 'local' или имя кэша из CACHES
+    """
+    store = getattr(settings, 'CATALOG_THROTTLE_STORE', 'local')
+    if store == 'local':
+        return LocalThrottleStore()
+    if store not in settings.CACHES:
+        raise ImproperlyConfigured("Неизвестное хранилище корзин CATALOG_THROTTLE_STORE: %r" % store)
+    return CacheThrottleStore(store)
+
+
+def too_many_requests(wait):
+    response = HttpResponse("Слишком много запросов, повторите позже", status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+class ThrottleMiddleware:
+    """
+    Ограничивает частоту запросов к страницам каталога корзинами токенов (token bucket) для каждого
+    IP-адреса и каждого вошедшего пользователя. Ограничения задаются по имени URL в CATALOG_THROTTLE_RATES.
+    Стоит в MIDDLEWARE перед SessionMiddleware: проверка по IP-адресу выполняется до загрузки сессии
+    и пользователя, так что отклоненный запрос не обращается к базе данных. Пользователь проверяется
+    в process_view, и только если у запроса есть cookie сессии
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rates = {name: {scope: parse_rate(rate) for scope, rate in rates.items()}
+                      for name, rates in getattr(settings, 'CATALOG_THROTTLE_RATES', {}).items()}
+        if not self.rates:
+            raise MiddlewareNotUsed
+        self.store = get_throttle_store()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _rates(self, request):
+        """
+        :return: Имя URL запроса и его ограничения (или None, если ограничений нет)
+        """
+        try:
+            name = resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+        rates = self.rates.get(name)
+        return (name, rates) if rates else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._throttle = throttle = self._rates(request)
+        if throttle and 'ip' in throttle[1]:
+            name, rates = throttle
+            wait = self.store.consume('ip:%s:%s' % (name, request.META.get('REMOTE_ADDR')), *rates['ip'])
+            if wait:
+                return too_many_requests(wait)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request._throttle = throttle = self._rates(request)
+        if throttle and 'ip' in throttle[1]:
+            name, rates = throttle
+            wait = await self.store.aconsume('ip:%s:%s' % (name, request.META.get('REMOTE_ADDR')), *rates['ip'])
+            if wait:
+                return too_many_requests(wait)
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        throttle = getattr(request, '_throttle', None)
+        if not throttle or 'user' not in throttle[1] or settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return None
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        name, rates = throttle
+        wait = self.store.consume('user:%s:%s' % (name, user.pk), *rates['user'])
+        return too_many_requests(wait) if wait else None
@@ -5,11 +5,18 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
     path('book/<int:pk>/', views.BookDetailView.as_view(), name="book-detail"),
     path('book/<int:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('books/renew/', views.renew_books_librarian, name='renew-books-librarian'),
     path('author/create/', views.AuthorCreate.as_view(), name="author_create"),
     path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author_update'),
     path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author_delete'),
+    path('export/<str:kind>.<str:file_format>', views.export_catalog, name='catalog-export'),
+    path('api/<str:resource>/', views.api_list, name='api-list'),
+    path('api/<str:resource>/<str:pk>/', views.api_detail, name='api-detail'),
+    path('metrics/', views.view_metrics_json, name='catalog-metrics'),
+    path('overdue/', views.OverdueBooksListView.as_view(), name='overdue'),
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name="author-detail")
@@ -1,15 +1,31 @@
-from django.shortcuts import render
-from .models import Book, BookInstance, Author, Genre
+from django.template.response import TemplateResponse
+from .models import Book, BookInstance, Author, OverdueByBook, OverdueByBorrower
 from django.views import generic
+from django.core.paginator import Paginator
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse, Http404, JsonResponse
 from django.urls import reverse
 import datetime
-from .forms import RenewBookForm
+import json
+from .forms import RenewBookForm, BulkRenewForm
+from .borrowers import current_loans, get_borrower_summary, get_loan_history
+from .loans import LoanError, renew, renew_many
+from .stats import get_stats
+from .popularity import get_popular
+from .facets import facet_links, filter_books, filter_query, get_facets, parse_filters
+from .visits import get_visit_counter
+from .pagination import KeysetPaginationMixin
+from .search import SearchResults
+from .caching import CachedViewMixin, attach_cache_versions, book_scope, author_scope
+from .middleware import view_metrics
+from .export import EXPORT_FIELDS, EXPORT_FORMATS, iter_export
+from .api import RESOURCES, ApiError
 from django.contrib.auth.decorators import permission_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import reverse_lazy
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 
 
 def index(request):
@@ -18,21 +34,74 @@ def index(request):
     :param request:
     :return:
     """
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    # Доступные книги в статусе "a"
-    available_genres = Genre.objects.all().count()
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    num_authors = Author.objects.count()
-    num_visits = request.session.get("num_visits", 0)
-    request.session["num_visits"] = num_visits + 1
-
-    return render(request, 'index.html', context={
-        'num_books': num_books, 'num_instances': num_instances, 'num_instance_available': num_instances_available,
-        'num_authors': num_authors, "num_visits": num_visits
+    # Все счетчики берутся из кэша, который обновляется сигналами моделей (см. catalog.stats)
+    stats = get_stats()
+    num_visits = get_visit_counter().record(request)
+
+    # Шаблон отрисовывается после представления, время отрисовки учитывает QueryInstrumentationMiddleware
+    return TemplateResponse(request, 'index.html', context={
+        'num_books': stats['num_books'], 'num_instances': stats['num_instances'],
+        'num_instances_available': stats['num_instances_available'],
+        'num_authors': stats['num_authors'], 'num_genres': stats['num_genres'], "num_visits": num_visits,
+        # Списки популярного читаются из кэша (см. catalog.popularity)
+        'popular': get_popular(),
     })
 
 
+@staff_member_required
+def view_metrics_json(request):
+    """
+    Статистика SQL-запросов и времени ответа по именам URL, накопленная текущим процессом
+    """
+    return JsonResponse(view_metrics.snapshot())
+
+
+@permission_required('catalog.can_mark_returned')
+def export_catalog(request, kind, file_format):
+    """
+    Потоковая выгрузка книг или экземпляров. Ответ начинает отправляться сразу,
+    а память не зависит от размера таблиц
+    """
+    if kind not in EXPORT_FIELDS or file_format not in EXPORT_FORMATS:
+        raise Http404("Неизвестная выгрузка")
+    response = StreamingHttpResponse(iter_export(kind, file_format), content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (kind, file_format)
+    return response
+
+
+def api_list(request, resource):
+    """
+    Список объектов каталога в JSON. Параметры: fields, include, limit и курсор after
+    """
+    if resource not in RESOURCES:
+        raise Http404("Неизвестный ресурс")
+    try:
+        results, next_cursor = RESOURCES[resource].get_page(request.GET)
+    except ApiError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    next_url = None
+    if next_cursor is not None:
+        params = request.GET.copy()
+        params['after'] = next_cursor
+        next_url = request.build_absolute_uri('%s?%s' % (request.path, params.urlencode()))
+    return JsonResponse({"results": results, "next": next_url})
+
+
+def api_detail(request, resource, pk):
+    """
+    Один объект каталога в JSON. Параметры: fields и include
+    """
+    if resource not in RESOURCES:
+        raise Http404("Неизвестный ресурс")
+    try:
+        obj = RESOURCES[resource].get_object(pk, request.GET)
+    except ApiError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    if obj is None:
+        return JsonResponse({"error": "Объект не найден"}, status=404)
+    return JsonResponse(obj)
+
+
 @permission_required('catalog.can_mark_returned')
 def renew_book_librarian(request, pk):
     book_inst = get_object_or_404(BookInstance, pk=pk)
@@ -43,38 +112,208 @@ def renew_book_librarian(request, pk):
         # Проверка подлинности формы
         if form.is_valid():
             # обработка данных из form.cleaned_data
-            # здесь просто присваем данные формы их полю due_back
-            book_inst.due_back = form.cleaned_data["renewal_date"]
-            book_inst.save()
-
+            # срок меняется условным UPDATE, поэтому одновременное изменение другим библиотекарем не теряется
+            if form.cleaned_data["version"] is not None:
+                book_inst.version = form.cleaned_data["version"]
+            try:
+                renew(book_inst, form.cleaned_data["renewal_date"])
+            except LoanError as exc:
+                # Показываем актуальное состояние экземпляра и предлагаем повторить продление
+                book_inst.refresh_from_db()
+                form = RenewBookForm(initial={"renewal_date": form.cleaned_data["renewal_date"],
+                                              "version": book_inst.version})
+                return TemplateResponse(request, 'catalog/book_renew_librarian.html',
+                                        {"form": form, "bookinst": book_inst, "error": exc})
             # Переход по новому адрессу
             return HttpResponseRedirect(reverse('index'))
     # Если это GET запрос, создать форму по умолчанию
     else:
         proposed_renewal_date = datetime.datetime.today() + datetime.timedelta(weeks=3)
-        form = RenewBookForm(initial={"renewal_date": proposed_renewal_date})
-        return render(request, 'catalog/book_renew_librarian.html',
-                      {"form": form, "bookinst": book_inst})
+        form = RenewBookForm(initial={"renewal_date": proposed_renewal_date, "version": book_inst.version})
+    return TemplateResponse(request, 'catalog/book_renew_librarian.html',
+                            {"form": form, "bookinst": book_inst})
 
 
-class BookListView(generic.ListView):
+@permission_required('catalog.can_mark_returned')
+def renew_books_librarian(request):
+    """
+    Пакетное продление выданных экземпляров. Принимает форму (поле copies со списком id) или JSON
+    {"copies": [...], "renewal_date": "ГГГГ-ММ-ДД"}; в ответ на JSON возвращает результат по каждому экземпляру
+    """
+    is_json = request.content_type == 'application/json'
+    results = None
+    if request.method == "POST":
+        if is_json:
+            try:
+                payload = json.loads(request.body)
+                data = {"copies": ' '.join(str(pk) for pk in payload.get("copies", [])),
+                        "renewal_date": payload.get("renewal_date")}
+            except (ValueError, TypeError, AttributeError):
+                return JsonResponse({"errors": {"__all__": ["Неправильный JSON"]}}, status=400)
+        else:
+            data = request.POST
+        form = BulkRenewForm(data)
+        if form.is_valid():
+            results = renew_many(form.cleaned_data["copies"], form.cleaned_data["renewal_date"])
+            if is_json:
+                return JsonResponse({"renewal_date": form.cleaned_data["renewal_date"],
+                                     "results": {str(pk): result for pk, result in results.items()}})
+        elif is_json:
+            return JsonResponse({"errors": form.errors}, status=400)
+    else:
+        proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        form = BulkRenewForm(initial={"renewal_date": proposed_renewal_date})
+    return TemplateResponse(request, 'catalog/book_renew_bulk.html', {"form": form, "results": results})
+
+
+# Сортировки списка книг (параметр sort): имя -> ключ сортировки, он же ключ keyset-пагинации.
+# Доступность хранится в строке книги (Book.num_available), поэтому сортировка по ней не требует JOIN
+BOOK_SORTS = {
+    'title': ('title', 'id'),
+    'available': ('-num_available', 'title', 'id'),
+}
+
+# Сортировки списка авторов: по имени или по числу книг (аннотация with_book_stats)
+AUTHOR_SORTS = {
+    'name': ('last_name', 'first_name', 'id'),
+    'books': ('-num_books', 'last_name', 'first_name', 'id'),
+}
+
+
+def get_sort(request, sorts):
+    """
+    :param sorts: Словарь имя сортировки -> ключ сортировки, первая сортировка используется по умолчанию
+    :return: Имя сортировки и параметр запроса для ссылок на соседние страницы
+    """
+    default = next(iter(sorts))
+    sort = request.GET.get('sort')
+    if sort not in sorts or sort == default:
+        return default, ''
+    return sort, '&sort=%s' % sort
+
+
+class BookListView(CachedViewMixin, KeysetPaginationMixin, generic.ListView):
+    """
+    Список книг с постраничным выводом. Помимо номера страницы поддерживает курсоры after/before
+    по ключу сортировки, поэтому дальние страницы так же дешевы, как первая.
+    Книги отбираются по жанру, языку, автору и доступности (см. catalog.facets)
+    """
     model = Book
+    paginate_by = 10
+    ordering = BOOK_SORTS['title']
+    keyset_fields = BOOK_SORTS['title']
 
-    # def get_queryset(self):
-    #     return
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.sort, self.sort_query = get_sort(request, BOOK_SORTS)
+        self.ordering = self.keyset_fields = BOOK_SORTS[self.sort]
+        self.filters = parse_filters(request.GET)
 
+    def get_cache_scopes(self):
+        return ['books', 'facets']
 
-class BookDetailView(generic.DetailView):
+    def get_queryset(self):
+        # Авторы загружаются тем же запросом, что и книги
+        return filter_books(super().get_queryset().select_related('author'), self.filters)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(sort=self.sort, sort_query=self.sort_query,
+                                           filter_query=filter_query(self.filters),
+                                           facets=facet_links(get_facets(self.filters), self.filters, self.sort_query),
+                                           popular_books=get_popular()['books'], **kwargs)
+        # Версии книг - ключи закэшированных фрагментов строк списка
+        attach_cache_versions(context['object_list'], book_scope)
+        return context
+
+
+def summarize_statuses(rows):
+    """
+    :return: Сводка по статусам экземпляров с названиями статусов
+    """
+    status_labels = dict(BookInstance.LOAN_STATUS)
+    return [{'status': row['status'], 'label': status_labels.get(row['status'], row['status']), 'count': row['count']}
+            for row in rows]
+
+
+class BookDetailView(CachedViewMixin, generic.DetailView):
+    """
+    Страница книги. Книга, автор и язык загружаются одним запросом, жанры - вторым,
+    сводка по статусам экземпляров - третьим, а сами экземпляры выводятся постранично,
+    поэтому число запросов не зависит от количества экземпляров
+    """
     model = Book
+    copies_paginate_by = 20
 
+    def get_cache_scopes(self):
+        return [book_scope(self.kwargs['pk'])]
 
-class AuthorDetailView(generic.DetailView):
+    def get_queryset(self):
+        return super().get_queryset().select_related('author', 'language').prefetch_related('genre')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        copies = self.object.bookinstance_set.all()
+        status_summary = summarize_statuses(
+            copies.order_by().values('status').annotate(count=Count('pk')).order_by('status'))
+        paginator = Paginator(copies.order_by('due_back', 'id'), self.copies_paginate_by)
+        # Общее число экземпляров уже известно из сводки, отдельный COUNT не нужен
+        paginator.count = sum(row['count'] for row in status_summary)
+        copies_page = paginator.get_page(self.request.GET.get('page'))
+        context.update({
+            'status_summary': status_summary,
+            'num_copies': paginator.count,
+            'copies_page': copies_page,
+        })
+        return context
+
+
+class AuthorDetailView(CachedViewMixin, generic.DetailView):
+    """
+    Страница автора со сводкой и постраничным списком его книг. Сводка вычисляется агрегатами
+    в запросе автора, книги страницы загружаются вторым запросом, их жанры - третьим,
+    а доступность берется из счетчиков книг, поэтому число запросов не зависит от числа книг и экземпляров
+    """
     model = Author
+    queryset = Author.objects.with_book_stats()
+    books_paginate_by = 10
 
+    def get_cache_scopes(self):
+        # Доступность книг меняется при выдаче экземпляров, что сбрасывает область 'books'
+        return [author_scope(self.kwargs['pk']), 'books']
 
-class AuthorListView(generic.ListView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        books = self.object.book_set.select_related('language').prefetch_related('genre').order_by('title', 'id')
+        paginator = Paginator(books, self.books_paginate_by)
+        # Число книг уже посчитано в запросе автора
+        paginator.count = self.object.num_books
+        context['books_page'] = paginator.get_page(self.request.GET.get('page'))
+        return context
+
+
+class AuthorListView(CachedViewMixin, generic.ListView):
+    """
+    Список авторов с числом книг и доступных экземпляров у каждого (аннотации одного запроса)
+    и сортировкой по имени или по числу книг
+    """
     model = Author
+    queryset = Author.objects.with_book_stats()
     paginate_by = 10
+    ordering = AUTHOR_SORTS['name']
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.sort, self.sort_query = get_sort(request, AUTHOR_SORTS)
+        self.ordering = AUTHOR_SORTS[self.sort]
+
+    def get_cache_scopes(self):
+        # Число доступных экземпляров в строках меняется при выдаче экземпляров, что сбрасывает область 'books'
+        return ['authors', 'books']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(sort=self.sort, sort_query=self.sort_query, **kwargs)
+        attach_cache_versions(context['object_list'], author_scope)
+        return context
 
 
 class AuthorCreate(CreateView):
@@ -95,13 +334,67 @@ class AuthorDelete(DeleteView):
 
 class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
     """
-    Общий просмотр на основе классов со списком книг, которые можно одолжить текущему пользователю
+    Книги, взятые текущим пользователем, со сводкой и историей его выдач. Выдачи страницы вместе с книгами,
+    авторами, просрочкой и остатком срока загружаются одним запросом, сводка и история берутся из кэша
+    читателя, и по сводке же известно число выдач для пагинации
     """
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        self.summary = get_borrower_summary(self.request.user)
+        return current_loans(self.request.user)
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        paginator.count = self.summary['on_loan']
+        return paginator
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(summary=self.summary, history=get_loan_history(self.request.user),
+                                        **kwargs)
+
+
+class OverdueBooksListView(PermissionRequiredMixin, generic.ListView):
+    """
+    Список всех просроченных экземпляров для библиотекарей. Отбор выполняется в базе данных
+    по индексу (status, due_back), сводки по читателям и книгам берутся из таблиц,
+    которые пересчитывает команда compute_overdue
+    """
+    permission_required = 'catalog.can_mark_returned'
+    template_name = 'catalog/bookinstance_list_overdue.html'
+    context_object_name = 'bookinstance_list'
+    paginate_by = 20
+    summary_size = 10
+
+    def get_queryset(self):
+        return BookInstance.objects.overdue().select_related('book', 'borrower').order_by('due_back', 'id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        borrower_summary = list(OverdueByBorrower.objects.select_related('borrower')[:self.summary_size])
+        book_summary = list(OverdueByBook.objects.select_related('book')[:self.summary_size])
+        context['borrower_summary'] = borrower_summary
+        context['book_summary'] = book_summary
+        computed = [row.computed_at for row in borrower_summary + book_summary]
+        context['summary_computed_at'] = max(computed) if computed else None
+        return context
 
 
+class BookSearchView(generic.ListView):
+    """
+    Полнотекстовый поиск по названию, описанию, ISBN и автору книги.
+    Результаты берутся из предвычисленного индекса (см. catalog.search) и упорядочены по релевантности
+    """
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return SearchResults(self.request.GET.get('q', '').strip())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '').strip()
+        return context
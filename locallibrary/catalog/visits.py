@@ -0,0 +1,108 @@
+import atexit
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+# Префикс ключей кэша со счетчиками посещений (см. BufferedVisitCounter)
+VISITS_CACHE_PREFIX = 'catalog:visits:'
+
+
+def _visits_key(session_key):
+    return VISITS_CACHE_PREFIX + session_key
+
+
+class SessionVisitCounter:
+    """
+    Хранит счетчик посещений прямо в сессии. Каждое посещение изменяет сессию и поэтому сохраняет ее
+    """
+    def record(self, request):
+        """
+        Учитывает посещение
+        :return: Количество посещений до текущего
+        """
+        num_visits = request.session.get("num_visits", 0)
+        request.session["num_visits"] = num_visits + 1
+        return num_visits
+
+    def flush(self):
+        pass
+
+
+class BufferedVisitCounter:
+    """
+    Хранит счетчик посещений не в сессии, а в кэше под ключом сессии. Посещения накапливаются в памяти
+    процесса и не чаще раза в flush_interval секунд прибавляются к счетчикам атомарным cache.incr,
+    так что посещения не пишут ни сессию, ни базу данных. Подходит только для общего для всех процессов
+    и долговременного кэша (например, Redis): в кэше в памяти процесса каждый процесс считает посещения
+    отдельно, а вытеснение ключа или перезапуск сбрасывает счетчик к значению в сессии.
+    Накопленные посещения сбрасываются и при штатном завершении процесса, при аварийной остановке
+    теряются посещения не больше чем за flush_interval
+    """
+    def __init__(self, flush_interval=60):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, request):
+        session_key = request.session.session_key
+        if session_key is None:
+            # У нового посетителя еще нет сессии, ее все равно придется создать - первое посещение
+            # записывается в нее же (как и в хранилище signed_cookies, где у сессии нет ключа на сервере)
+            return SessionVisitCounter().record(request)
+        stored = cache.get(_visits_key(session_key))
+        if stored is None:
+            # Счетчика в кэше еще нет: отсчет начинается со значения в сессии
+            stored = request.session.get("num_visits", 0)
+        with self._lock:
+            pending, initial = self._pending.get(session_key, (0, stored))
+            self._pending[session_key] = (pending + 1, initial)
+            flush_due = time.monotonic() - self._last_flush >= self.flush_interval
+        if flush_due:
+            self.flush()
+        return stored + pending
+
+    def flush(self):
+        """
+        Прибавляет накопленные посещения к счетчикам в кэше
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        for session_key, (count, initial) in pending.items():
+            key = _visits_key(session_key)
+            # add не перезаписывает существующий счетчик, а incr изменяет его без чтения и записи значения
+            cache.add(key, initial, settings.SESSION_COOKIE_AGE)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # Счетчик вытеснен из кэша между add и incr
+                cache.add(key, initial + count, settings.SESSION_COOKIE_AGE)
+
+
+VISIT_COUNTERS = {
+    'session': SessionVisitCounter,
+    'buffered': BufferedVisitCounter,
+}
+
+_counter = None
+_counter_mode = None
+
+
+def get_visit_counter():
+    """
+    :return: Счетчик посещений, выбранный настройкой CATALOG_VISIT_TRACKING
+    """
+    global _counter, _counter_mode
+    mode = getattr(settings, 'CATALOG_VISIT_TRACKING', 'session')
+    if _counter is None or _counter_mode != mode:
+        if _counter is not None:
+            _counter.flush()
+            atexit.unregister(_counter.flush)
+        _counter = VISIT_COUNTERS[mode]()
+        _counter_mode = mode
+        atexit.register(_counter.flush)
+    if mode == 'buffered':
+        _counter.flush_interval = getattr(settings, 'CATALOG_VISIT_FLUSH_INTERVAL', 60)
+    return _counter
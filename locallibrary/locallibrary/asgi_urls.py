@@ -0,0 +1,11 @@
+"""
+URL configuration for the ASGI deployment: the same as locallibrary.urls,
+but the catalog pages are served by async views (see catalog.async_urls).
+"""
+from django.urls import include, path
+from . import urls
+
+urlpatterns = [
+    path('catalog/', include('catalog.async_urls')) if str(getattr(pattern, 'pattern', '')) == 'catalog/' else pattern
+    for pattern in urls.urlpatterns
+]
@@ -43,6 +43,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'catalog.middleware.QueryInstrumentationMiddleware',
+    # Ограничение частоты запросов должно отклонять запросы до загрузки сессии и пользователя
+    'catalog.throttling.ThrottleMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,20 +54,34 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'locallibrary.urls'
+# Под ASGI (см. asgi.py) основные страницы каталога обслуживаются асинхронными представлениями
+CATALOG_ASYNC_VIEWS = os.environ.get('CATALOG_ASYNC_VIEWS', '0') == '1'
+
+ROOT_URLCONF = 'locallibrary.asgi_urls' if CATALOG_ASYNC_VIEWS else 'locallibrary.urls'
+
+# Загрузчики шаблонов. С CATALOG_CACHED_TEMPLATES=1 (по умолчанию) каждый шаблон читается и компилируется
+# один раз за время жизни процесса (при DEBUG кэш сбрасывается автоперезагрузкой при изменении файлов),
+# с CATALOG_CACHED_TEMPLATES=0 шаблоны компилируются заново при каждой отрисовке
+CATALOG_CACHED_TEMPLATES = os.environ.get('CATALOG_CACHED_TEMPLATES', '1') == '1'
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'catalog.context_processors.fragment_cache',
             ],
+            'loaders': [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+            if CATALOG_CACHED_TEMPLATES else TEMPLATE_LOADERS,
         },
     },
 ]
@@ -113,7 +130,90 @@ USE_I18N = True
 
 USE_TZ = True
 
-SESSION_SAVE_EVERY_REQUEST = True
+# Сессия сохраняется только когда она изменилась, иначе каждый просмотр страницы записывал бы ее в базу
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Хранилище сессий: 'django.contrib.sessions.backends.db' (по умолчанию), '...backends.cached_db',
+# '...backends.cache' или '...backends.signed_cookies' - с двумя последними просмотры страниц не пишут в базу
+SESSION_ENGINE = os.environ.get('DJANGO_SESSION_ENGINE', 'django.contrib.sessions.backends.db')
+
+# Учет посещений домашней страницы: 'session' - счетчик сохраняется в сессии при каждом посещении,
+# 'buffered' - посещения копятся в памяти и раз в CATALOG_VISIT_FLUSH_INTERVAL секунд прибавляются к счетчикам
+# в кэше. 'buffered' стоит включать только вместе с общим долговременным кэшем (DJANGO_CACHE_BACKEND)
+CATALOG_VISIT_TRACKING = os.environ.get('CATALOG_VISIT_TRACKING', 'session')
+CATALOG_VISIT_FLUSH_INTERVAL = 60
+
+# Кэш, в котором хранятся счетчики и другие предвычисленные данные каталога, и отдельный кэш версий
+# объектов (catalog.caching). По умолчанию оба хранятся в памяти процесса, и каждый процесс видит свои версии,
+# поэтому кэширование страниц (CATALOG_VIEW_CACHE_TIMEOUT) и ETag корректны только при одном процессе.
+# При нескольких процессах нужен общий кэш, например DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# и DJANGO_CACHE_LOCATION=redis://127.0.0.1:6379
+CACHE_BACKEND = os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHE_LOCATION = os.environ.get('DJANGO_CACHE_LOCATION', '')
+CACHE_IS_LOCAL = CACHE_BACKEND.endswith('.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        # Ответы, фрагменты, фасеты и сводки читателей; в памяти процесса по умолчанию хранится только 300 ключей
+        'OPTIONS': {'MAX_ENTRIES': 10000} if CACHE_IS_LOCAL else {},
+    },
+    'versions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': 'catalog-versions' if CACHE_IS_LOCAL else CACHE_LOCATION,
+        'KEY_PREFIX': 'versions',
+        # По версии на книгу, автора и читателя
+        'OPTIONS': {'MAX_ENTRIES': 100000} if CACHE_IS_LOCAL else {},
+    },
+}
+
+# Кэш версий объектов, от которых зависят закэшированные страницы и фрагменты (catalog.caching)
+CATALOG_VERSION_CACHE = 'versions'
+
+# Максимальное время (в секундах), в течение которого счетчики домашней страницы могут быть устаревшими
+CATALOG_STATS_TTL = 300
+
+# Максимальное время (в секундах), в течение которого списки популярного (catalog.popularity) могут быть устаревшими
+CATALOG_POPULARITY_TTL = 300
+
+# Начало отсчета весов выдач в оценках популярности (см. catalog.models.popularity_weight). Веса растут
+# экспоненциально, поэтому раз в несколько лет дату стоит перенести вперед и сразу выполнить rebuild_popularity
+CATALOG_POPULARITY_EPOCH = '2020-01-01'
+
+# Время жизни (в секундах) закэшированных страниц каталога для анонимных пользователей
+CATALOG_VIEW_CACHE_TIMEOUT = 600
+
+# Кэш и время жизни (в секундах) фрагментов шаблонов: меню, строк списков книг и авторов.
+# Ключи строк содержат версии объектов, поэтому изменения видны сразу, а не по истечении времени
+CATALOG_FRAGMENT_CACHE = 'default'
+CATALOG_FRAGMENT_CACHE_TIMEOUT = 600
+
+# Ограничение частоты запросов (catalog.throttling): имя URL -> ограничения для IP-адреса ('ip')
+# и вошедшего пользователя ('user') в виде 'число/период' (s, m, h, d). Корзина вмещает столько запросов,
+# сколько разрешено за период. Пустой словарь отключает ограничение
+CATALOG_THROTTLE_RATES = {
+    'index': {'ip': '120/m'},
+    'books': {'ip': '60/m', 'user': '120/m'},
+    'book-detail': {'ip': '60/m', 'user': '120/m'},
+    'authors': {'ip': '60/m', 'user': '120/m'},
+    'author-detail': {'ip': '60/m', 'user': '120/m'},
+    'search': {'ip': '30/m', 'user': '60/m'},
+    'api-list': {'ip': '60/m', 'user': '120/m'},
+    'api-detail': {'ip': '120/m', 'user': '240/m'},
+    'catalog-export': {'ip': '10/h', 'user': '30/h'},
+    'renew-book-librarian': {'ip': '60/m', 'user': '30/m'},
+    'renew-books-librarian': {'ip': '30/m', 'user': '10/m'},
+    'author_create': {'ip': '30/m', 'user': '20/m'},
+    'author_update': {'ip': '30/m', 'user': '20/m'},
+    'author_delete': {'ip': '30/m', 'user': '20/m'},
+}
+
+# Хранилище корзин ограничения частоты: 'local' - память процесса (каждый процесс ограничивает
+# запросы отдельно) или имя кэша из CACHES, общего для всех процессов
+CATALOG_THROTTLE_STORE = os.environ.get('CATALOG_THROTTLE_STORE', 'local')
+
+# Отдавать ли статистику SQL-запросов и времени отрисовки в заголовке Server-Timing
+CATALOG_SERVER_TIMING = DEBUG
 
 LOGIN_REDIRECT_URL = '/'
 